@@ -1,47 +1,207 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context, g
 import os
-import json
-from openai import OpenAI
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from openai import OpenAI, DefaultHttpxClient, DEFAULT_CONNECTION_LIMITS
+import httpx
 from dotenv import load_dotenv
 import time
+import threading
 
 # Load environment variables
 load_dotenv()
 
+# Make the shared helpers in scripts/ importable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scripts'))
+from search_vector_store import search_vector_store as search_vs
+from search_cache import SearchCache
+from semantic_cache import SemanticCache, get_embedder, DEFAULT_THRESHOLD
+from metadata_cache import TTLCache
+from local_index import load_local_index, INDEX_DIR
+from attribute_store import AttributeStore, ATTRIBUTE_STORE_PATH
+from vector_store_listing import format_store, iter_vector_stores, iter_store_details
+from openai_http import add_event_hooks, add_transport_wrapper
+from thread_messages import MessageCursors, run_reply, number_citations
+from rerank import RerankPool, DEFAULT_CANDIDATES, DEFAULT_TIMEOUT as DEFAULT_RERANK_TIMEOUT
+from fanout_search import search_stores, merge_results, DEFAULT_NORMALIZE, DEFAULT_STORE_TIMEOUT
+from search_snippets import project_results, SNIPPET_CHARS
+from response_compression import choose_encoding, compress, compressible, DEFAULT_MIN_BYTES as DEFAULT_COMPRESS_MIN_BYTES
+from store_registry import StoreRegistry, STORE_COOKIE
+from api_helpers import SearchRequests, CachePolicy, LocalSearch, ResponseTimings, RequestError, ChatRequest, ChatTurn, RunStream, BatchSearch
+from api_helpers import ndjson, sse_event, store_choice, store_choice_body, listing_options, reusable_thread, thread_body, reply_body, reply_frames
+from api_helpers import cited_files, remember_files, search_page, content_body, batch_queries, batch_concurrency, STREAM_HEADERS
+from single_flight import SingleFlight
+from session_store import SessionStore, WarmThreadPool, new_session_id, start_sweeper, DEFAULT_SESSION_TTL
+from request_metrics import begin_request, finish_request, stage, record_polls, upstream_hooks, submit_in_context, UpstreamTransport
+from request_metrics import render as render_metrics, CONTENT_TYPE as METRICS_CONTENT_TYPE
+
 app = Flask(__name__)
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
-# Load vector store ID
-try:
-    with open("vector_store_info.json", "r") as f:
-        vector_store_info = json.load(f)
-        vector_store_id = vector_store_info.get("vector_store_id")
-except FileNotFoundError:
-    vector_store_id = None
+# Every upstream call is counted and timed for /metrics, including searches over the pooled client
+client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=DefaultHttpxClient(
+    event_hooks=upstream_hooks(),
+    transport=UpstreamTransport(httpx.HTTPTransport(limits=DEFAULT_CONNECTION_LIMITS))
+))
+add_event_hooks(upstream_hooks())
+add_transport_wrapper(UpstreamTransport)
+
+# The vector store is chosen per request; the default store and each store's assistant are shared with other workers on disk
+store_registry = StoreRegistry()
+if not store_registry.default_store():
     print("Warning: vector_store_info.json not found. Please run file-upload.py first.")
 
+# Browser sessions can pick their own store; only the default store applies to everyone
+ALLOW_DEFAULT_STORE_CHANGE = os.getenv("ALLOW_DEFAULT_STORE_CHANGE", "false").lower() == "true"
+# Stores a client may choose, comma-separated; when unset, any store in the account's (cached) store list
+ALLOWED_VECTOR_STORES = {store_id.strip() for store_id in os.getenv("ALLOWED_VECTOR_STORES", "").split(",") if store_id.strip()}
+
+# Stream assistant replies unless disabled; polling is used as the fallback
+STREAM_RESPONSES = os.getenv("STREAM_RESPONSES", "true").lower() != "false"
+
+# Adaptive backoff for polling runs (seconds)
+POLL_INITIAL_INTERVAL = 0.1
+POLL_MAX_INTERVAL = 1.0
+POLL_BACKOFF_FACTOR = 1.5
+
+# Cache of search results; set SEARCH_CACHE_DB to share it between workers
+search_cache = SearchCache(
+    max_entries=int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "1000")),
+    max_bytes=int(os.getenv("SEARCH_CACHE_MAX_BYTES", str(50 * 1024 * 1024))),
+    ttl=int(os.getenv("SEARCH_CACHE_TTL", "300")),
+    db_path=os.getenv("SEARCH_CACHE_DB")
+)
+
+# Answers reused for near-duplicate questions; enable with SEMANTIC_CACHE=true
+semantic_cache = None
+if os.getenv("SEMANTIC_CACHE", "false").lower() == "true":
+    semantic_cache = SemanticCache(
+        get_embedder(os.getenv("SEMANTIC_CACHE_EMBEDDER", "openai"), client),
+        threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", str(DEFAULT_THRESHOLD)))
+    )
+
+# Searches can be served from a local mirror of the vector store; enable with SEARCH_BACKEND=local
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "remote")
+LOCAL_SEARCH_MODE = os.getenv("LOCAL_SEARCH_MODE", "vector")
+HYBRID_FUSION = os.getenv("HYBRID_FUSION", "rrf")
+local_index = None
+attribute_store = None
+if SEARCH_BACKEND == "local":
+    attribute_store = AttributeStore(os.getenv("ATTRIBUTE_STORE_PATH", ATTRIBUTE_STORE_PATH))
+    local_index = load_local_index(os.getenv("LOCAL_INDEX_DIR", INDEX_DIR), client, attribute_store)
+
+# Batch searches: distinct queries run concurrently on a bounded pool
+BATCH_SEARCH_CONCURRENCY = int(os.getenv("BATCH_SEARCH_CONCURRENCY", "8"))
+BATCH_SEARCH_MAX_CONCURRENCY = 32
+BATCH_SEARCH_MAX_QUERIES = int(os.getenv("BATCH_SEARCH_MAX_QUERIES", "1000"))
+
+# Assistant IDs and the vector store listing are cached in-process (seconds)
+ASSISTANT_CACHE_TTL = int(os.getenv("ASSISTANT_CACHE_TTL", "600"))
+VECTOR_STORE_LIST_TTL = int(os.getenv("VECTOR_STORE_LIST_TTL", "60"))
+VECTOR_STORE_DETAIL_CONCURRENCY = int(os.getenv("VECTOR_STORE_DETAIL_CONCURRENCY", "8"))
+metadata_cache = TTLCache(ttl=ASSISTANT_CACHE_TTL)
+
+# Newest message seen in each thread, so a run's reply is fetched without listing the whole thread
+thread_cursors = MessageCursors()
+
+# Filenames of cited files are cached (seconds); uncached ones are looked up concurrently
+FILE_NAME_TTL = int(os.getenv("FILE_NAME_TTL", "3600"))
+CITATION_LOOKUP_CONCURRENCY = 8
+
+# Browser sessions map to threads server-side; set SESSION_DB to share them between workers
+SESSION_COOKIE = "chat_session"
+SESSION_TTL = int(os.getenv("SESSION_TTL", str(DEFAULT_SESSION_TTL)))
+SESSION_SWEEP_INTERVAL = int(os.getenv("SESSION_SWEEP_INTERVAL", "300"))
+DELETE_EXPIRED_THREADS = os.getenv("DELETE_EXPIRED_THREADS", "true").lower() != "false"
+session_store = SessionStore(
+    max_sessions=int(os.getenv("SESSION_MAX", "10000")),
+    ttl=SESSION_TTL,
+    db_path=os.getenv("SESSION_DB")
+)
+
+# Threads are created ahead of time so starting a conversation needs no API call
+thread_pool = WarmThreadPool(lambda: client.beta.threads.create().id, size=int(os.getenv("THREAD_POOL_SIZE", "4")))
+
+# Identical searches, and identical opening questions, that are in flight at the same time share one upstream call
+COALESCE_REQUESTS = os.getenv("COALESCE_REQUESTS", "true").lower() != "false"
+search_flights = SingleFlight()
+chat_flights = SingleFlight()
+
+# Search results can be reranked on worker processes: per request with "rerank", or for every search with RERANKER.
+# The workers start with the app when RERANKER or RERANK_WORKERS is set; without them, asking to rerank is refused
+RERANKER = os.getenv("RERANKER")
+RERANK_WORKERS = int(os.getenv("RERANK_WORKERS", "0"))
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", str(DEFAULT_CANDIDATES)))
+rerank_pool = RerankPool(
+    workers=RERANK_WORKERS or None,
+    timeout=float(os.getenv("RERANK_TIMEOUT", str(DEFAULT_RERANK_TIMEOUT))),
+    preload_names=[RERANKER] if RERANKER else ()
+)
+
+# Searches can span several vector stores ("vector_store_ids"); each store has this many seconds to answer
+FANOUT_STORE_TIMEOUT = float(os.getenv("FANOUT_STORE_TIMEOUT", str(DEFAULT_STORE_TIMEOUT)))
+
+# JSON responses are gzip or brotli compressed when the client accepts it
+COMPRESS_RESPONSES = os.getenv("COMPRESS_RESPONSES", "true").lower() != "false"
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", str(DEFAULT_COMPRESS_MIN_BYTES)))
+
+# Recent time-to-first-token samples per response mode
+response_timings = ResponseTimings()
+
+# Search request bodies, validated against this app's defaults
+search_requests = SearchRequests(
+    lambda data: store_registry.select(request, data),
+    backend=SEARCH_BACKEND,
+    reranker=RERANKER,
+    rerank_pool=rerank_pool,
+    rerank_candidates=RERANK_CANDIDATES,
+    store_timeout=FANOUT_STORE_TIMEOUT
+)
+
+# What the search cache, the answer cache and coalescing do with a request
+cache_policy = CachePolicy(
+    search_cache,
+    store_registry.default_store,
+    flights=search_flights if COALESCE_REQUESTS else None,
+    semantic_cache=semantic_cache
+)
+local_search = LocalSearch(local_index, attribute_store, mode=LOCAL_SEARCH_MODE, fusion=HYBRID_FUSION)
+
+def check_vector_store(store_id):
+    """Raise ValueError unless a client may use a store: the default, or an allowed or listed one."""
+    if not store_id or store_id == store_registry.default_store():
+        return
+    if ALLOWED_VECTOR_STORES:
+        allowed = store_id in ALLOWED_VECTOR_STORES
+    else:
+        stores = metadata_cache.get_or_load("vector_stores", fetch_vector_stores, ttl=VECTOR_STORE_LIST_TTL)
+        allowed = any(store["id"] == store_id for store in stores)
+    if not allowed:
+        raise ValueError(f"Unknown vector store: {store_id}")
+
 # Create or get assistant
-def get_or_create_assistant():
-    # Check if assistant ID is stored
-    try:
-        with open("assistant_info.json", "r") as f:
-            assistant_info = json.load(f)
-            assistant_id = assistant_info.get("assistant_id")
-            
-            # Verify the assistant still exists
-            try:
-                client.beta.assistants.retrieve(assistant_id)
-                return assistant_id
-            except:
-                print("Assistant not found, creating a new one...")
-                pass
-    except FileNotFoundError:
-        print("No existing assistant found, creating a new one...")
-    
-    # Create a new assistant
+def get_or_create_assistant(store_id):
+    """Return the assistant for a vector store, cached and created at most once at a time."""
+    check_vector_store(store_id)
+    return metadata_cache.get_or_load(
+        f"assistant:{store_id}",
+        lambda: load_or_create_assistant(store_id)
+    )
+
+def load_or_create_assistant(vector_store_id):
     if not vector_store_id:
         raise ValueError("Vector store ID not found. Please run file-upload.py first.")
     
+    # Reuse the store's assistant if it still exists
+    assistant_id = store_registry.assistant_for(vector_store_id)
+    if assistant_id:
+        try:
+            client.beta.assistants.retrieve(assistant_id)
+            return assistant_id
+        except Exception:
+            print("Assistant not found, creating a new one...")
+    else:
+        print("No existing assistant found, creating a new one...")
+    
+    # Create a new assistant
     assistant = client.beta.assistants.create(
         name="Document Assistant",
         instructions="You are a helpful assistant that can answer questions based on the documents provided in the vector store.",
@@ -54,226 +214,661 @@ def get_or_create_assistant():
         }
     )
     
-    # Save assistant ID
-    with open("assistant_info.json", "w") as f:
-        json.dump({"assistant_id": assistant.id}, f, indent=2)
-    
-    return assistant.id
+    # Another worker may have created one for this store in the meantime; keep the one recorded first
+    recorded = store_registry.record_assistant(vector_store_id, assistant.id, replaces=assistant_id)
+    if recorded != assistant.id:
+        try:
+            client.beta.assistants.delete(assistant.id)
+        except Exception as e:
+            print(f"Warning: Could not delete duplicate assistant {assistant.id}: {e}")
+    return recorded
+
+# Request instrumentation
+@app.before_request
+def start_request_trace():
+    g.trace = begin_request(request.url_rule.rule if request.url_rule else "unmatched", request.method)
+
+@app.after_request
+def finish_request_trace(response):
+    trace = g.pop('trace', None)
+    if trace is not None:
+        # Streamed bodies are still being sent; finish once the server closes the response
+        if response.is_streamed:
+            status = response.status_code
+            response.call_on_close(lambda: finish_request(trace, status))
+        else:
+            finish_request(trace, response.status_code)
+    return response
+
+@app.after_request
+def compress_response(response):
+    """Compress JSON bodies for clients that accept gzip or brotli."""
+    if not COMPRESS_RESPONSES or response.is_streamed:
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding(request.headers.get('Accept-Encoding'))
+    if encoding and compressible(response.mimetype, response.content_encoding, COMPRESS_MIN_BYTES, response.content_length or 0):
+        with stage("compress"):
+            response.set_data(compress(response.get_data(), encoding))
+        response.content_encoding = encoding
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Request, stage and upstream call metrics in the Prometheus text format."""
+    return Response(render_metrics(), content_type=METRICS_CONTENT_TYPE)
 
 # Routes
 @app.route('/')
 def index():
     return render_template('index.html')
 
+def fetch_vector_stores():
+    """List every vector store in the account, walking all pages, formatted for the UI."""
+    return [format_store(store) for store in iter_vector_stores(client)]
+
 @app.route('/api/vector-stores', methods=['GET'])
 def list_vector_stores():
     try:
-        # List all vector stores
-        vector_stores = client.beta.vector_stores.list()
-        
-        # Format the response
-        stores_list = []
-        for store in vector_stores.data:
-            store_data = {
-                "id": store.id,
-                "name": store.name,
-                "created_at": store.created_at
-            }
-            
-            # Add additional fields if they exist
-            if hasattr(store, 'bytes'):
-                store_data["bytes"] = store.bytes
-                
-            if hasattr(store, 'file_counts'):
-                store_data["file_counts"] = {
-                    "in_progress": store.file_counts.in_progress,
-                    "completed": store.file_counts.completed,
-                    "failed": store.file_counts.failed,
-                    "cancelled": store.file_counts.cancelled,
-                    "total": store.file_counts.total
-                }
-                
-            stores_list.append(store_data)
+        # Served from the cache unless the user explicitly refreshes
+        if request.args.get('refresh'):
+            metadata_cache.invalidate("vector_stores")
+        stores_list = metadata_cache.get_or_load("vector_stores", fetch_vector_stores, ttl=VECTOR_STORE_LIST_TTL)
         
         return jsonify({
             "vector_stores": stores_list,
-            "current_vector_store_id": vector_store_id
+            "current_vector_store_id": store_registry.select(request)
         })
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/vector-stores/stream', methods=['GET'])
+def stream_vector_stores():
+    """Stream the vector store list as NDJSON, one store per line as pages arrive.
+    
+    refresh=1 bypasses the cache, details=1 retrieves every store concurrently
+    and files=N also lists up to N file IDs per store.
+    """
+    refresh, details, files_limit = listing_options(request.args)
+    current_vector_store_id = store_registry.select(request)
+    
+    def generate():
+        yield ndjson({"current_vector_store_id": current_vector_store_id})
+        try:
+            cached = None if refresh or details else metadata_cache.get("vector_stores")
+            if cached is not None:
+                stores = iter(cached)
+            elif details:
+                stores = iter_store_details(client, iter_vector_stores(client),
+                                            concurrency=VECTOR_STORE_DETAIL_CONCURRENCY, files_limit=files_limit)
+            else:
+                stores = (format_store(store) for store in iter_vector_stores(client))
+            
+            listed = []
+            for store_data in stores:
+                listed.append(store_data)
+                yield ndjson({"store": store_data})
+            
+            # A complete plain listing also refreshes the cached list
+            if cached is None and not details:
+                metadata_cache.set("vector_stores", listed, ttl=VECTOR_STORE_LIST_TTL)
+            yield ndjson({"done": True, "count": len(listed)})
+        except Exception as e:
+            yield ndjson({"error": str(e)})
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson', headers=STREAM_HEADERS)
+
 @app.route('/api/set-vector-store', methods=['POST'])
 def set_vector_store():
-    data = request.json
-    new_vector_store_id = data.get('vector_store_id')
+    """Choose the vector store for this browser session.
     
-    if not new_vector_store_id:
-        return jsonify({"error": "Missing vector store ID"}), 400
+    With "scope": "default" the deployment's default store is changed
+    instead, for every request that does not choose one; that needs
+    ALLOW_DEFAULT_STORE_CHANGE=true. Other stores' assistants and cached
+    searches are kept either way.
+    """
+    try:
+        new_vector_store_id, scope = store_choice(request.json or {}, ALLOW_DEFAULT_STORE_CHANGE)
+        check_vector_store(new_vector_store_id)
+    except RequestError as e:
+        return jsonify({"error": str(e)}), e.status
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     
     try:
         # Verify the vector store exists
         client.beta.vector_stores.retrieve(new_vector_store_id)
         
-        # Save the new vector store ID
-        global vector_store_id
-        vector_store_id = new_vector_store_id
-        
-        with open("vector_store_info.json", "w") as f:
-            json.dump({"vector_store_id": vector_store_id}, f, indent=2)
+        if scope == 'default':
+            store_registry.set_default_store(new_vector_store_id)
         
-        # Delete the assistant info so a new one will be created with the new vector store
-        if os.path.exists("assistant_info.json"):
-            os.remove("assistant_info.json")
-        
-        return jsonify({
-            "success": True,
-            "message": "Vector store updated successfully"
-        })
+        response = jsonify(store_choice_body(new_vector_store_id, scope))
+        if scope == 'session':
+            response.set_cookie(STORE_COOKIE, new_vector_store_id, max_age=SESSION_TTL, httponly=True, samesite="Lax")
+        return response
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def delete_threads(thread_ids):
+    for thread_id in thread_ids:
+        try:
+            client.beta.threads.delete(thread_id)
+        except Exception as e:
+            print(f"Warning: Could not delete thread {thread_id}: {e}")
+
+def delete_session_threads(sessions):
+    """Delete the threads of expired or evicted sessions."""
+    if DELETE_EXPIRED_THREADS:
+        delete_threads([session["thread_id"] for session in sessions])
+
 @app.route('/api/start-thread', methods=['POST'])
 def start_thread():
     try:
-        # Get or create assistant
-        assistant_id = get_or_create_assistant()
+        # Get or create the assistant for the store this session uses
+        store_id = store_registry.select(request, request.get_json(silent=True))
+        with stage("assistant_lookup"):
+            assistant_id = get_or_create_assistant(store_id)
         
-        # Create a new thread
-        thread = client.beta.threads.create()
+        # Reuse the session's thread if nothing has been said in it yet (e.g. a page reload),
+        # otherwise take a pre-created one and only create a thread inline if the pool is empty
+        session_id = request.cookies.get(SESSION_COOKIE)
+        session = session_store.get(session_id)
+        thread_id = reusable_thread(session)
+        if thread_id is None:
+            with stage("thread_create"):
+                thread_id = thread_pool.take() or client.beta.threads.create().id
         
-        return jsonify({
-            "thread_id": thread.id,
-            "assistant_id": assistant_id
-        })
+        thread_cursors.mark_empty(thread_id)
+        if not session:
+            session_id = new_session_id()
+        previous = session_store.start(session_id, thread_id, assistant_id, store_id)
+        if previous and previous["thread_id"] != thread_id and DELETE_EXPIRED_THREADS:
+            threading.Thread(target=delete_threads, args=([previous["thread_id"]],), daemon=True).start()
+        
+        response = jsonify(thread_body(thread_id, assistant_id, store_id))
+        response.set_cookie(SESSION_COOKIE, session_id, max_age=SESSION_TTL, httponly=True, samesite="Lax")
+        return response
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/send-message', methods=['POST'])
-def send_message():
-    data = request.json
-    thread_id = data.get('thread_id')
-    assistant_id = data.get('assistant_id')
-    message = data.get('message')
+@app.route('/api/session/stats', methods=['GET'])
+def get_session_stats():
+    """Report session store and warm thread pool usage."""
+    return jsonify({**session_store.stats(), "thread_pool": thread_pool.stats()})
+
+def wait_for_run(thread_id, run_id):
+    """Poll a run until it leaves the queued/in_progress states, backing off between checks."""
+    interval = POLL_INITIAL_INTERVAL
+    polls = 0
+    with stage("run_poll"):
+        while True:
+            run_status = client.beta.threads.runs.retrieve(
+                thread_id=thread_id,
+                run_id=run_id
+            )
+            polls += 1
+            
+            if run_status.status not in ['queued', 'in_progress', 'cancelling']:
+                record_polls(polls)
+                return run_status
+            
+            time.sleep(interval)
+            interval = min(interval * POLL_BACKOFF_FACTOR, POLL_MAX_INTERVAL)
+
+def get_run_reply(thread_id, run_id):
+    """Return (text, citations) for the messages a run added, or (None, []) if it added none.
+    
+    Only the run's messages newer than the thread's cursor are listed.
+    """
+    with stage("message_list"):
+        messages = client.beta.threads.messages.list(**thread_cursors.list_params(thread_id, run_id))
     
-    if not thread_id or not assistant_id or not message:
-        return jsonify({"error": "Missing required parameters"}), 400
+    if messages.data:
+        thread_cursors.set(thread_id, messages.data[-1].id)
     
+    message_content, citations = run_reply(messages.data)
+    return message_content, resolve_citations(citations)
+
+def retrieve_file_name(file_id):
     try:
-        # Add message to thread
-        client.beta.threads.messages.create(
-            thread_id=thread_id,
-            role="user",
-            content=message
-        )
-        
-        # Run the assistant
-        run = client.beta.threads.runs.create(
+        return client.files.retrieve(file_id).filename
+    except Exception as e:
+        print(f"Warning: Could not look up cited file {file_id}: {e}")
+        return None
+
+def resolve_citations(citations):
+    """Number a reply's citations and attach filenames, retrieving uncached files in one concurrent batch."""
+    if not citations:
+        return []
+    
+    filenames, missing = cited_files(citations, metadata_cache)
+    if missing:
+        with stage("citation_lookup"):
+            with ThreadPoolExecutor(max_workers=min(len(missing), CITATION_LOOKUP_CONCURRENCY)) as executor:
+                futures = [submit_in_context(executor, retrieve_file_name, file_id) for file_id in missing]
+                found = [future.result() for future in futures]
+        remember_files(filenames, missing, found, metadata_cache, FILE_NAME_TTL)
+    
+    return number_citations(citations, filenames)
+
+def poll_response(thread_id, assistant_id, run_id=None):
+    """Run the assistant (or wait on an existing run) by polling and return (reply, citations)."""
+    if run_id is None:
+        with stage("run_create"):
+            run = client.beta.threads.runs.create(
+                thread_id=thread_id,
+                assistant_id=assistant_id
+            )
+        run_id = run.id
+    
+    run_status = wait_for_run(thread_id, run_id)
+    if run_status.status != 'completed':
+        raise RuntimeError(f"Run {run_status.status}")
+    
+    message_content, citations = get_run_reply(thread_id, run_id)
+    if message_content is None:
+        raise RuntimeError("No response from assistant")
+    
+    return message_content, citations
+
+def stream_response(thread_id, assistant_id, started, on_complete=None):
+    """Yield SSE frames with the assistant's text deltas as they arrive.
+
+    If streaming fails before any text has been sent, the run is finished by
+    polling instead and the full reply is sent as a single delta. The full
+    reply and its citations are passed to `on_complete` once the run has
+    finished, and the citations are sent with the final "done" event.
+    """
+    run = RunStream(thread_id, thread_cursors)
+    
+    try:
+        with client.beta.threads.runs.stream(
             thread_id=thread_id,
             assistant_id=assistant_id
-        )
+        ) as stream:
+            for event in stream:
+                yield from run.frames(event)
+                if run.ended:
+                    return
         
-        # Poll for completion
-        while True:
-            run_status = client.beta.threads.runs.retrieve(
+        missing = run.finish()
+        if missing:
+            yield missing
+            return
+        
+        citations = resolve_citations(run.citations)
+        if on_complete:
+            on_complete(run.reply, citations)
+        yield sse_event("done", {
+            "timing": response_timings.record("stream", started, run.first_token_at),
+            "citations": citations
+        })
+        return
+    except Exception as e:
+        if run.first_token_at is not None:
+            yield sse_event("error", {"error": str(e)})
+            return
+        print(f"Streaming failed, falling back to polling: {e}")
+    
+    try:
+        message_content, citations = poll_response(thread_id, assistant_id, run_id=run.run_id)
+        first_token_at = time.perf_counter()
+        if on_complete:
+            on_complete(message_content, citations)
+        yield reply_frames(message_content, response_timings.record("poll", started, first_token_at), citations)
+    except Exception as e:
+        yield sse_event("error", {"error": str(e)})
+
+def answer_from_semantic_cache(thread_id, turn):
+    """The answer to a near-duplicate of this opening question, recorded in the thread, or None."""
+    # Answers given before the store's files changed are dropped
+    refresh_store_version(turn.store_id)
+    
+    try:
+        with stage("semantic_cache_embed"):
+            embedding = semantic_cache.embed(turn.message)
+    except Exception as e:
+        print(f"Warning: Could not embed question for the semantic cache: {e}")
+        return None
+    
+    answer = turn.cached_answer(embedding)
+    if answer is not None:
+        record_answer(thread_id, answer)
+    return answer
+
+def record_answer(thread_id, answer):
+    """Add an answer that did not come from a run on this thread, so follow-up questions keep their context."""
+    answer_message = client.beta.threads.messages.create(
+        thread_id=thread_id,
+        role="assistant",
+        content=answer
+    )
+    thread_cursors.set(thread_id, answer_message.id)
+
+def wait_for_coalesced(flight):
+    """Return the leading request's (answer, citations), or None if it failed and this request should run its own."""
+    try:
+        with stage("coalesced_wait"):
+            return flight.wait()
+    except Exception as e:
+        print(f"Coalesced run failed, running separately: {e}")
+        return None
+
+@app.route('/api/send-message', methods=['POST'])
+def send_message():
+    data = request.json or {}
+    session_id = request.cookies.get(SESSION_COOKIE)
+    try:
+        chat = ChatRequest(data, session_store.get(session_id), store_registry.select(request, data), STREAM_RESPONSES)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    thread_id, assistant_id = chat.thread_id, chat.assistant_id
+    started = time.perf_counter()
+    
+    try:
+        turn = ChatTurn(chat, thread_cursors.is_empty(thread_id), semantic_cache, chat_flights if COALESCE_REQUESTS else None)
+        
+        # Add message to thread
+        with stage("message_create"):
+            user_message = client.beta.threads.messages.create(
                 thread_id=thread_id,
-                run_id=run.id
+                role="user",
+                content=chat.message
             )
-            
-            if run_status.status == 'completed':
-                break
-            elif run_status.status in ['failed', 'cancelled', 'expired']:
-                return jsonify({"error": f"Run {run_status.status}"}), 500
-            
-            time.sleep(1)
-        
-        # Get messages
-        messages = client.beta.threads.messages.list(
-            thread_id=thread_id
-        )
+        thread_cursors.set(thread_id, user_message.id)
+        if chat.in_session:
+            session_store.record_message(session_id)
         
-        # Get the latest assistant message
-        assistant_messages = [
-            msg for msg in messages.data 
-            if msg.role == "assistant"
-        ]
+        # Reuse the answer to a near-duplicate opening question instead of starting a run
+        cached_answer = answer_from_semantic_cache(thread_id, turn) if turn.checks_cache else None
+        if cached_answer is not None:
+            timing = response_timings.record("cached", started, time.perf_counter())
+            if chat.stream:
+                return Response(reply_frames(cached_answer, timing), mimetype='text/event-stream')
+            return jsonify(reply_body(cached_answer, timing, source="cached"))
         
-        if not assistant_messages:
-            return jsonify({"error": "No response from assistant"}), 500
+        # Wait for an identical opening question already running on another thread instead of starting a run
+        flight = turn.join()
+        if flight is not None:
+            reply = wait_for_coalesced(flight)
+            if reply is not None:
+                record_answer(thread_id, reply[0])
+                timing = response_timings.record("coalesced", started, time.perf_counter())
+                if chat.stream:
+                    return Response(reply_frames(reply[0], timing, reply[1]), mimetype='text/event-stream')
+                return jsonify(reply_body(reply[0], timing, reply[1], source="coalesced"))
         
-        latest_message = assistant_messages[0]
+        if chat.stream:
+            response = Response(
+                stream_with_context(stream_response(thread_id, assistant_id, started, on_complete=turn.answer_ready)),
+                mimetype='text/event-stream',
+                headers=STREAM_HEADERS
+            )
+            response.call_on_close(turn.release)
+            return response
         
-        # Extract text content
-        message_content = ""
-        for content in latest_message.content:
-            if content.type == "text":
-                message_content += content.text.value
+        # Run the assistant and poll for completion
+        try:
+            message_content, citations = poll_response(thread_id, assistant_id)
+            turn.answer_ready(message_content, citations)
+        finally:
+            turn.release()
         
-        return jsonify({
-            "response": message_content
-        })
+        return jsonify(reply_body(message_content, response_timings.record("poll", started, time.perf_counter()), citations))
     
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/response-timings', methods=['GET'])
+def get_response_timings():
+    """Summarize recent time-to-first-token samples for the stream and poll paths."""
+    return jsonify(response_timings.summary())
+
+def refresh_store_version(vector_store_id):
+    """Invalidate cached searches and answers for a store if its files changed since the last check."""
+    if not cache_policy.refresh_due(vector_store_id):
+        return
+    try:
+        with stage("store_version_check"):
+            store = client.beta.vector_stores.retrieve(vector_store_id)
+        cache_policy.store_changed(vector_store_id, store)
+    except Exception as e:
+        print(f"Warning: Could not check vector store version: {e}")
+
+@app.route('/api/metadata-cache/stats', methods=['GET'])
+def get_metadata_cache_stats():
+    """Hit/miss counters for the assistant and vector store metadata cache."""
+    return jsonify(metadata_cache.stats())
+
+@app.route('/api/semantic-cache/stats', methods=['GET'])
+def get_semantic_cache_stats():
+    """Hit/miss/eviction counters for the semantic answer cache."""
+    if semantic_cache is None:
+        return jsonify({"enabled": False})
+    return jsonify(dict(semantic_cache.stats(), enabled=True))
+
+@app.route('/api/coalescing/stats', methods=['GET'])
+def get_coalescing_stats():
+    """Requests that led an upstream call and requests that shared one, for searches and opening questions."""
+    return jsonify({
+        "enabled": COALESCE_REQUESTS,
+        "search": search_flights.stats(),
+        "chat": chat_flights.stats()
+    })
+
+@app.route('/api/rerank/stats', methods=['GET'])
+def get_rerank_stats():
+    """Reranks applied, and reranks that fell back to the original ranking after a timeout or error."""
+    return jsonify(dict(rerank_pool.stats(), default=RERANKER, candidates=RERANK_CANDIDATES))
+
+@app.route('/api/search-cache/stats', methods=['GET'])
+def get_search_cache_stats():
+    """Hit/miss/eviction counters for the search cache."""
+    return jsonify(search_cache.stats())
+
+def cached_search(query, max_results=10, filters=None, rewrite_query=False, store_id=None):
+    """Return cached results for a remote search of the given store (default: the default store), or None."""
+    store_id = cache_policy.store(store_id)
+    if not store_id:
+        return None
+    refresh_store_version(store_id)
+    return cache_policy.lookup(cache_policy.key(store_id, query, max_results, filters, rewrite_query))
+
+def run_search(query, max_results=10, filters=None, rewrite_query=False, backend=None, mode=None, fusion=None, store_id=None):
+    """Run one search against the local mirror or the vector store, going through the search cache.
+    
+    Remote searches go to `store_id`, or the default vector store. Returns
+    (results, cached). Raises ValueError for requests that cannot be
+    served and RuntimeError if the search itself fails.
+    """
+    # The local mirror answers without a network round trip (unless its embedder is remote)
+    if (backend or SEARCH_BACKEND) == 'local':
+        file_ids = local_search.file_ids(filters)
+        with stage("local_search"):
+            return local_search.search(query, max_results, file_ids, mode, fusion), False
+    
+    store_id = cache_policy.store(store_id)
+    if not store_id:
+        raise ValueError("Vector store ID not found")
+    
+    # Serve repeated searches from the cache
+    cached = cached_search(query, max_results, filters, rewrite_query, store_id)
+    if cached is not None:
+        return cached, True
+    
+    key = cache_policy.key(store_id, query, max_results, filters, rewrite_query)
+    def fetch():
+        with stage("remote_search"):
+            results = search_vs(
+                store_id, 
+                query, 
+                max_results=max_results,
+                filters=filters,
+                rewrite_query=rewrite_query,
+                ranking_options=None
+            )
+        cache_policy.keep(key, store_id, results)
+        return results
+    
+    # Identical searches already in flight share that call's results
+    results = cache_policy.flights.do(key, fetch)[0] if cache_policy.flights else fetch()
+    return search_page(query, results), False
+
+def run_fanout_search(query, options, store_ids, normalize=DEFAULT_NORMALIZE, timeout=FANOUT_STORE_TIMEOUT):
+    """Search several vector stores concurrently and merge their hits by normalized score.
+    
+    Stores that fail or miss the deadline are left out of the hits and
+    reported in the response's `stores`. Raises RuntimeError if none answered.
+    """
+    def search_store(store_id):
+        return run_search(query, **dict(options, store_id=store_id))[0]
+    
+    with stage("fanout_search"):
+        outcomes = search_stores(search_store, store_ids, timeout)
+    with stage("merge"):
+        return merge_results(query, outcomes, options["max_results"], normalize)
+
+def search_results(query, data, options):
+    """Results of a search request: from one vector store, or merged from several with "vector_store_ids"."""
+    fanout = search_requests.fanout(data)
+    if fanout:
+        return run_fanout_search(query, options, **fanout)
+    return run_search(query, **options)[0]
+
 @app.route('/api/search-vector-store', methods=['POST'])
 def search_vector_store():
     """API endpoint to search the vector store."""
-    global vector_store_id
+    data = request.json or {}
     
-    if not vector_store_id:
-        return jsonify({"error": "Vector store ID not found"}), 400
+    try:
+        query = search_requests.query(data)
+        options, reranker, top_k = search_requests.single(data)
+        fields = search_requests.projection(data)
+        results = search_results(query, data, options)
+        
+        if reranker:
+            with stage("rerank"):
+                results = rerank_pool.rerank(results, query, reranker, top_k)
+        if fields is not None:
+            with stage("snippets"):
+                results = project_results(results, query, fields, data.get('snippet_chars', SNIPPET_CHARS))
+        return jsonify(results)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print(f"Error searching vector store: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/search-vector-store/content', methods=['POST'])
+def search_result_content():
+    """Full content of one hit from an earlier search.
     
-    data = request.json
-    query = data.get('query')
-    max_results = data.get('max_results', 10)
-    rewrite_query = data.get('rewrite_query', False)
+    Takes the body of that search plus the hit's `result_id`. The search is
+    repeated, normally from the search cache, and the hit's content returned.
+    """
+    data = request.json or {}
+    wanted = data.get('result_id')
     
-    if not query:
-        return jsonify({"error": "Query is required"}), 400
+    if not data.get('query') or not wanted:
+        return jsonify({"error": "query and result_id are required"}), 400
     
     try:
-        # Import the search function directly from the scripts directory
-        import os
-        import sys
-        script_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scripts')
-        sys.path.insert(0, script_path)
-        from search_vector_store import search_vector_store as search_vs
-        
-        # Ensure max_results is within valid range
-        max_results = min(max(1, max_results), 50)
-        
-        # Set up ranking options if needed
-        ranking_options = None
-        
-        # Perform the search using the imported function
-        results = search_vs(
-            vector_store_id, 
-            query, 
-            max_results=max_results,
-            filters=None,
-            rewrite_query=rewrite_query,
-            ranking_options=ranking_options
-        )
+        query = search_requests.query(data)
+        options, _, _ = search_requests.single(data)
+        results = search_results(query, data, options)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print(f"Error loading search result content: {e}")
+        return jsonify({"error": str(e)}), 500
+    
+    body = content_body(results, wanted)
+    if body is None:
+        return jsonify({"error": "Result not found; the store may have changed since the search"}), 404
+    return jsonify(body)
+
+@app.route('/api/search-vector-store/batch', methods=['POST'])
+def search_vector_store_batch():
+    """Run many searches in one request.
+    
+    Queries that normalize to the same text are searched once, cached results
+    are returned straight away and the rest run on a bounded thread pool.
+    With "stream": true each result is sent as an NDJSON line as soon as it
+    completes; otherwise results come back in request order in one response.
+    """
+    data = request.json or {}
+    
+    try:
+        batch = BatchSearch(batch_queries(data, BATCH_SEARCH_MAX_QUERIES))
+        options = search_requests.options(data)
+        concurrency = batch_concurrency(data, BATCH_SEARCH_CONCURRENCY, BATCH_SEARCH_MAX_CONCURRENCY)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    def search_one(query):
+        started = time.perf_counter()
+        try:
+            results, cached = run_search(query, **options)
+        except Exception as e:
+            return batch.outcome(query, error=str(e), started=started)
+        return batch.outcome(query, results, cached, started=started)
+    
+    def completed():
+        """Yield (positions, outcome) for each distinct query as it finishes."""
+        pending = []
+        for indexes, query in batch.distinct():
+            hit = None
+            if options["backend"] != 'local':
+                hit = cached_search(query, options["max_results"], options["filters"], options["rewrite_query"], options["store_id"])
+            if hit is not None:
+                yield indexes, batch.outcome(query, hit, cached=True)
+            else:
+                pending.append((indexes, query))
         
-        if not results:
-            return jsonify({"error": "Search failed or returned no results"}), 500
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = {submit_in_context(executor, search_one, query): indexes for indexes, query in pending}
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+    
+    if data.get('stream'):
+        def generate():
+            for indexes, outcome in completed():
+                yield batch.add(indexes, outcome)
+            yield ndjson({"stats": batch.stats()})
         
-        # Process the results to ensure they're in a consistent format
-        # The search_vector_store.py function returns a dictionary with data array
-        if isinstance(results, dict) and 'data' in results:
-            # Already in the expected format
-            return jsonify(results)
-        else:
-            # Format the results to match the expected structure
-            formatted_results = {
-                "search_query": query,
-                "data": results if isinstance(results, list) else []
-            }
-            return jsonify(formatted_results)
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson', headers=STREAM_HEADERS)
     
-    except Exception as e:
-        print(f"Error searching vector store: {e}")
-        return jsonify({"error": str(e)}), 500
+    for indexes, outcome in completed():
+        batch.add(indexes, outcome)
+    return jsonify(batch.body())
+
+# Background work starts with the first request rather than at import, so processes that import the app
+# without serving it (the reloader's watcher, the rerank workers) do not start threads nobody uses
+background_started = False
+background_lock = threading.Lock()
+
+@app.before_request
+def start_background_work():
+    global background_started
+    if background_started:
+        return
+    with background_lock:
+        if background_started:
+            return
+        # The rerank workers come from a fork server, so threads already running here are not copied
+        if RERANKER or RERANK_WORKERS:
+            try:
+                rerank_pool.start()
+            except Exception as e:
+                print(f"Warning: Reranking is unavailable: {e}")
+        
+        # Fill the thread pool and expire idle sessions in the background
+        thread_pool.refill()
+        start_sweeper(session_store, SESSION_SWEEP_INTERVAL, delete_session_threads)
+        background_started = True
 
 if __name__ == '__main__':
     app.run(debug=True) 
\ No newline at end of file
@@ -0,0 +1,956 @@
+"""
+Asyncio serving mode for the Document Assistant.
+
+Exposes the same routes as app.py, but every upstream call goes through
+AsyncOpenAI so run polling, streaming and searches overlap on one event loop
+instead of pinning a worker thread each. Run it with:
+    hypercorn async_app:app --bind 0.0.0.0:5000
+"""
+from quart import Quart, render_template, request, jsonify, Response, g
+from quart.wrappers.response import IterableBody
+import os
+import sys
+import asyncio
+import time
+from openai import AsyncOpenAI, OpenAI, DefaultAsyncHttpxClient, DEFAULT_CONNECTION_LIMITS
+import httpx
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Make the shared helpers in scripts/ importable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scripts'))
+from search_cache import SearchCache
+from semantic_cache import SemanticCache, get_embedder, DEFAULT_THRESHOLD
+from metadata_cache import TTLCache
+from local_index import load_local_index, INDEX_DIR
+from attribute_store import AttributeStore, ATTRIBUTE_STORE_PATH
+from vector_store_listing import format_store, iter_vector_stores_async, iter_store_details_async
+from thread_messages import MessageCursors, run_reply, number_citations
+from rerank import RerankPool, DEFAULT_CANDIDATES, DEFAULT_TIMEOUT as DEFAULT_RERANK_TIMEOUT
+from fanout_search import search_stores_async, merge_results, DEFAULT_NORMALIZE, DEFAULT_STORE_TIMEOUT
+from search_snippets import project_results, SNIPPET_CHARS
+from response_compression import choose_encoding, compress, compressible, DEFAULT_MIN_BYTES as DEFAULT_COMPRESS_MIN_BYTES
+from store_registry import StoreRegistry, STORE_COOKIE
+from api_helpers import SearchRequests, CachePolicy, LocalSearch, ResponseTimings, RequestError, ChatRequest, ChatTurn, RunStream, BatchSearch
+from api_helpers import ndjson, sse_event, store_choice, store_choice_body, listing_options, reusable_thread, thread_body, reply_body, reply_frames
+from api_helpers import cited_files, remember_files, search_page, content_body, batch_queries, batch_concurrency, STREAM_HEADERS
+from single_flight import AsyncSingleFlight
+from session_store import SessionStore, AsyncWarmThreadPool, new_session_id, run_sweeper_async, DEFAULT_SESSION_TTL
+from request_metrics import begin_request, finish_request, use_trace, stage, record_polls, async_upstream_hooks, AsyncUpstreamTransport
+from request_metrics import render as render_metrics, CONTENT_TYPE as METRICS_CONTENT_TYPE
+
+app = Quart(__name__)
+# Every upstream call, searches included, is counted and timed for /metrics
+client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=DefaultAsyncHttpxClient(
+    event_hooks=async_upstream_hooks(),
+    transport=AsyncUpstreamTransport(httpx.AsyncHTTPTransport(limits=DEFAULT_CONNECTION_LIMITS))
+))
+
+# The vector store is chosen per request; the default store and each store's assistant are shared with other workers on disk
+store_registry = StoreRegistry()
+if not store_registry.default_store():
+    print("Warning: vector_store_info.json not found. Please run file-upload.py first.")
+
+# Browser sessions can pick their own store; only the default store applies to everyone
+ALLOW_DEFAULT_STORE_CHANGE = os.getenv("ALLOW_DEFAULT_STORE_CHANGE", "false").lower() == "true"
+# Stores a client may choose, comma-separated; when unset, any store in the account's (cached) store list
+ALLOWED_VECTOR_STORES = {store_id.strip() for store_id in os.getenv("ALLOWED_VECTOR_STORES", "").split(",") if store_id.strip()}
+
+# Stream assistant replies unless disabled; polling is used as the fallback
+STREAM_RESPONSES = os.getenv("STREAM_RESPONSES", "true").lower() != "false"
+
+# Adaptive backoff for polling runs (seconds)
+POLL_INITIAL_INTERVAL = 0.1
+POLL_MAX_INTERVAL = 1.0
+POLL_BACKOFF_FACTOR = 1.5
+
+# Cache of search results; set SEARCH_CACHE_DB to share it between workers
+search_cache = SearchCache(
+    max_entries=int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "1000")),
+    max_bytes=int(os.getenv("SEARCH_CACHE_MAX_BYTES", str(50 * 1024 * 1024))),
+    ttl=int(os.getenv("SEARCH_CACHE_TTL", "300")),
+    db_path=os.getenv("SEARCH_CACHE_DB")
+)
+
+# Answers reused for near-duplicate questions; enable with SEMANTIC_CACHE=true.
+# Embedding calls use a sync client and run in a worker thread.
+semantic_cache = None
+if os.getenv("SEMANTIC_CACHE", "false").lower() == "true":
+    semantic_cache = SemanticCache(
+        get_embedder(os.getenv("SEMANTIC_CACHE_EMBEDDER", "openai"), OpenAI(api_key=os.getenv("OPENAI_API_KEY"))),
+        threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", str(DEFAULT_THRESHOLD)))
+    )
+
+# Searches can be served from a local mirror of the vector store; enable with SEARCH_BACKEND=local
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "remote")
+LOCAL_SEARCH_MODE = os.getenv("LOCAL_SEARCH_MODE", "vector")
+HYBRID_FUSION = os.getenv("HYBRID_FUSION", "rrf")
+local_index = None
+attribute_store = None
+if SEARCH_BACKEND == "local":
+    attribute_store = AttributeStore(os.getenv("ATTRIBUTE_STORE_PATH", ATTRIBUTE_STORE_PATH))
+    local_index = load_local_index(os.getenv("LOCAL_INDEX_DIR", INDEX_DIR), OpenAI(api_key=os.getenv("OPENAI_API_KEY")), attribute_store)
+
+# Batch searches: distinct queries run concurrently, at most this many at a time
+BATCH_SEARCH_CONCURRENCY = int(os.getenv("BATCH_SEARCH_CONCURRENCY", "8"))
+BATCH_SEARCH_MAX_CONCURRENCY = 32
+BATCH_SEARCH_MAX_QUERIES = int(os.getenv("BATCH_SEARCH_MAX_QUERIES", "1000"))
+
+# Assistant IDs and the vector store listing are cached in-process (seconds)
+ASSISTANT_CACHE_TTL = int(os.getenv("ASSISTANT_CACHE_TTL", "600"))
+VECTOR_STORE_LIST_TTL = int(os.getenv("VECTOR_STORE_LIST_TTL", "60"))
+VECTOR_STORE_DETAIL_CONCURRENCY = int(os.getenv("VECTOR_STORE_DETAIL_CONCURRENCY", "8"))
+metadata_cache = TTLCache(ttl=ASSISTANT_CACHE_TTL)
+
+# Newest message seen in each thread, so a run's reply is fetched without listing the whole thread
+thread_cursors = MessageCursors()
+
+# Filenames of cited files are cached (seconds); uncached ones are looked up concurrently
+FILE_NAME_TTL = int(os.getenv("FILE_NAME_TTL", "3600"))
+
+# Browser sessions map to threads server-side; set SESSION_DB to share them between workers
+SESSION_COOKIE = "chat_session"
+SESSION_TTL = int(os.getenv("SESSION_TTL", str(DEFAULT_SESSION_TTL)))
+SESSION_SWEEP_INTERVAL = int(os.getenv("SESSION_SWEEP_INTERVAL", "300"))
+DELETE_EXPIRED_THREADS = os.getenv("DELETE_EXPIRED_THREADS", "true").lower() != "false"
+session_store = SessionStore(
+    max_sessions=int(os.getenv("SESSION_MAX", "10000")),
+    ttl=SESSION_TTL,
+    db_path=os.getenv("SESSION_DB")
+)
+
+async def create_thread_id():
+    return (await client.beta.threads.create()).id
+
+# Threads are created ahead of time so starting a conversation needs no API call
+thread_pool = AsyncWarmThreadPool(create_thread_id, size=int(os.getenv("THREAD_POOL_SIZE", "4")))
+
+# Keep references to fire-and-forget tasks so they are not garbage collected mid-flight
+background_tasks = set()
+
+# Identical searches, and identical opening questions, that are in flight at the same time share one upstream call
+COALESCE_REQUESTS = os.getenv("COALESCE_REQUESTS", "true").lower() != "false"
+search_flights = AsyncSingleFlight()
+chat_flights = AsyncSingleFlight()
+
+# Search results can be reranked on worker processes: per request with "rerank", or for every search with RERANKER.
+# The workers start with the app when RERANKER or RERANK_WORKERS is set; without them, asking to rerank is refused
+RERANKER = os.getenv("RERANKER")
+RERANK_WORKERS = int(os.getenv("RERANK_WORKERS", "0"))
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", str(DEFAULT_CANDIDATES)))
+rerank_pool = RerankPool(
+    workers=RERANK_WORKERS or None,
+    timeout=float(os.getenv("RERANK_TIMEOUT", str(DEFAULT_RERANK_TIMEOUT))),
+    preload_names=[RERANKER] if RERANKER else ()
+)
+
+# Searches can span several vector stores ("vector_store_ids"); each store has this many seconds to answer
+FANOUT_STORE_TIMEOUT = float(os.getenv("FANOUT_STORE_TIMEOUT", str(DEFAULT_STORE_TIMEOUT)))
+
+# JSON responses are gzip or brotli compressed when the client accepts it
+COMPRESS_RESPONSES = os.getenv("COMPRESS_RESPONSES", "true").lower() != "false"
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", str(DEFAULT_COMPRESS_MIN_BYTES)))
+
+# Recent time-to-first-token samples per response mode
+response_timings = ResponseTimings()
+
+# Search request bodies, validated against this app's defaults
+search_requests = SearchRequests(
+    lambda data: store_registry.select(request, data),
+    backend=SEARCH_BACKEND,
+    reranker=RERANKER,
+    rerank_pool=rerank_pool,
+    rerank_candidates=RERANK_CANDIDATES,
+    store_timeout=FANOUT_STORE_TIMEOUT
+)
+
+# What the search cache, the answer cache and coalescing do with a request
+cache_policy = CachePolicy(
+    search_cache,
+    store_registry.default_store,
+    flights=search_flights if COALESCE_REQUESTS else None,
+    semantic_cache=semantic_cache
+)
+local_search = LocalSearch(local_index, attribute_store, mode=LOCAL_SEARCH_MODE, fusion=HYBRID_FUSION)
+
+async def load_existing_assistant(assistant_id):
+    """Return the recorded assistant ID if the assistant still exists, otherwise None."""
+    if not assistant_id:
+        print("No existing assistant found, creating a new one...")
+        return None
+
+    # Verify the assistant still exists
+    try:
+        await client.beta.assistants.retrieve(assistant_id)
+        return assistant_id
+    except Exception:
+        print("Assistant not found, creating a new one...")
+        return None
+
+async def check_vector_store(store_id):
+    """Raise ValueError unless a client may use a store: the default, or an allowed or listed one."""
+    if not store_id or store_id == store_registry.default_store():
+        return
+    if ALLOWED_VECTOR_STORES:
+        allowed = store_id in ALLOWED_VECTOR_STORES
+    else:
+        stores = await metadata_cache.get_or_load_async("vector_stores", fetch_vector_stores, ttl=VECTOR_STORE_LIST_TTL)
+        allowed = any(store["id"] == store_id for store in stores)
+    if not allowed:
+        raise ValueError(f"Unknown vector store: {store_id}")
+
+# Create or get assistant
+async def get_or_create_assistant(store_id):
+    """Return the assistant for a vector store, cached and created at most once at a time."""
+    await check_vector_store(store_id)
+    return await metadata_cache.get_or_load_async(f"assistant:{store_id}", lambda: load_or_create_assistant(store_id))
+
+async def load_or_create_assistant(vector_store_id):
+    if not vector_store_id:
+        raise ValueError("Vector store ID not found. Please run file-upload.py first.")
+
+    # Reuse the store's assistant if it still exists
+    recorded_id = store_registry.assistant_for(vector_store_id)
+    if await load_existing_assistant(recorded_id):
+        return recorded_id
+
+    # Create a new assistant
+    assistant = await client.beta.assistants.create(
+        name="Document Assistant",
+        instructions="You are a helpful assistant that can answer questions based on the documents provided in the vector store.",
+        model="gpt-4-turbo-preview",
+        tools=[{"type": "file_search"}],
+        tool_resources={
+            "file_search": {
+                "vector_store_ids": [vector_store_id]
+            }
+        }
+    )
+
+    # Another worker may have created one for this store in the meantime; keep the one recorded first
+    recorded = await asyncio.to_thread(store_registry.record_assistant, vector_store_id, assistant.id, replaces=recorded_id)
+    if recorded != assistant.id:
+        try:
+            await client.beta.assistants.delete(assistant.id)
+        except Exception as e:
+            print(f"Warning: Could not delete duplicate assistant {assistant.id}: {e}")
+    return recorded
+
+# Request instrumentation
+@app.before_request
+async def start_request_trace():
+    g.trace = begin_request(request.url_rule.rule if request.url_rule else "unmatched", request.method)
+
+async def finish_after_body(body, trace, status):
+    """Send a streamed body with its request's trace current, then finish the trace."""
+    use_trace(trace)
+    try:
+        async with body as chunks:
+            async for chunk in chunks:
+                yield chunk
+    finally:
+        finish_request(trace, status)
+
+@app.after_request
+async def finish_request_trace(response):
+    trace = g.pop('trace', None)
+    if trace is not None:
+        # Streamed bodies are still being sent; finish once the last chunk is out
+        if isinstance(response.response, IterableBody):
+            response.response = IterableBody(finish_after_body(response.response, trace, response.status_code))
+        else:
+            finish_request(trace, response.status_code)
+    return response
+
+@app.after_request
+async def compress_response(response):
+    """Compress JSON bodies for clients that accept gzip or brotli."""
+    if not COMPRESS_RESPONSES or isinstance(response.response, IterableBody):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding(request.headers.get('Accept-Encoding'))
+    if encoding and compressible(response.mimetype, response.content_encoding, COMPRESS_MIN_BYTES, response.content_length or 0):
+        with stage("compress"):
+            response.set_data(compress(await response.get_data(), encoding))
+        response.content_encoding = encoding
+    return response
+
+@app.route('/metrics', methods=['GET'])
+async def metrics():
+    """Request, stage and upstream call metrics in the Prometheus text format."""
+    return Response(render_metrics(), content_type=METRICS_CONTENT_TYPE)
+
+# Routes
+@app.route('/')
+async def index():
+    return await render_template('index.html')
+
+async def fetch_vector_stores():
+    """List every vector store in the account, walking all pages, formatted for the UI."""
+    return [format_store(store) async for store in iter_vector_stores_async(client)]
+
+@app.route('/api/vector-stores', methods=['GET'])
+async def list_vector_stores():
+    try:
+        # Served from the cache unless the user explicitly refreshes
+        if request.args.get('refresh'):
+            metadata_cache.invalidate("vector_stores")
+        stores_list = await metadata_cache.get_or_load_async("vector_stores", fetch_vector_stores, ttl=VECTOR_STORE_LIST_TTL)
+
+        return jsonify({
+            "vector_stores": stores_list,
+            "current_vector_store_id": store_registry.select(request)
+        })
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/vector-stores/stream', methods=['GET'])
+async def stream_vector_stores():
+    """Stream the vector store list as NDJSON, one store per line as pages arrive.
+
+    refresh=1 bypasses the cache, details=1 retrieves every store concurrently
+    and files=N also lists up to N file IDs per store.
+    """
+    refresh, details, files_limit = listing_options(request.args)
+    current_vector_store_id = store_registry.select(request)
+
+    async def formatted(stores):
+        async for store in stores:
+            yield format_store(store)
+
+    async def from_cache(cached):
+        for store_data in cached:
+            yield store_data
+
+    async def generate():
+        yield ndjson({"current_vector_store_id": current_vector_store_id})
+        try:
+            cached = None if refresh or details else metadata_cache.get("vector_stores")
+            if cached is not None:
+                stores = from_cache(cached)
+            elif details:
+                stores = iter_store_details_async(client, iter_vector_stores_async(client),
+                                                  concurrency=VECTOR_STORE_DETAIL_CONCURRENCY, files_limit=files_limit)
+            else:
+                stores = formatted(iter_vector_stores_async(client))
+
+            listed = []
+            async for store_data in stores:
+                listed.append(store_data)
+                yield ndjson({"store": store_data})
+
+            # A complete plain listing also refreshes the cached list
+            if cached is None and not details:
+                metadata_cache.set("vector_stores", listed, ttl=VECTOR_STORE_LIST_TTL)
+            yield ndjson({"done": True, "count": len(listed)})
+        except Exception as e:
+            yield ndjson({"error": str(e)})
+
+    response = Response(generate(), mimetype='application/x-ndjson', headers=STREAM_HEADERS)
+    response.timeout = None
+    return response
+
+@app.route('/api/set-vector-store', methods=['POST'])
+async def set_vector_store():
+    """Choose the vector store for this browser session.
+
+    With "scope": "default" the deployment's default store is changed
+    instead, for every request that does not choose one; that needs
+    ALLOW_DEFAULT_STORE_CHANGE=true. Other stores' assistants and cached
+    searches are kept either way.
+    """
+    try:
+        new_vector_store_id, scope = store_choice(await request.get_json() or {}, ALLOW_DEFAULT_STORE_CHANGE)
+        await check_vector_store(new_vector_store_id)
+    except RequestError as e:
+        return jsonify({"error": str(e)}), e.status
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        # Verify the vector store exists
+        await client.beta.vector_stores.retrieve(new_vector_store_id)
+
+        if scope == 'default':
+            await asyncio.to_thread(store_registry.set_default_store, new_vector_store_id)
+
+        response = jsonify(store_choice_body(new_vector_store_id, scope))
+        if scope == 'session':
+            response.set_cookie(STORE_COOKIE, new_vector_store_id, max_age=SESSION_TTL, httponly=True, samesite="Lax")
+        return response
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+def run_in_background(coro):
+    task = asyncio.get_running_loop().create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+async def delete_threads(thread_ids):
+    async def delete(thread_id):
+        try:
+            await client.beta.threads.delete(thread_id)
+        except Exception as e:
+            print(f"Warning: Could not delete thread {thread_id}: {e}")
+
+    await asyncio.gather(*(delete(thread_id) for thread_id in thread_ids))
+
+async def delete_session_threads(sessions):
+    """Delete the threads of expired or evicted sessions."""
+    if DELETE_EXPIRED_THREADS:
+        await delete_threads([session["thread_id"] for session in sessions])
+
+@app.before_serving
+async def start_rerank_workers():
+    # The workers come from a fork server, so the loop's threads are not copied into them
+    if RERANKER or RERANK_WORKERS:
+        try:
+            await asyncio.to_thread(rerank_pool.start)
+        except Exception as e:
+            print(f"Warning: Reranking is unavailable: {e}")
+
+@app.before_serving
+async def start_session_tasks():
+    # Fill the thread pool and expire idle sessions in the background
+    thread_pool.refill()
+    run_in_background(run_sweeper_async(session_store, SESSION_SWEEP_INTERVAL, delete_session_threads))
+
+@app.after_serving
+async def stop_session_tasks():
+    for task in list(background_tasks):
+        task.cancel()
+
+@app.after_serving
+async def stop_rerank_workers():
+    await asyncio.to_thread(rerank_pool.shutdown)
+
+@app.route('/api/start-thread', methods=['POST'])
+async def start_thread():
+    try:
+        # Get or create the assistant for the store this session uses
+        store_id = store_registry.select(request, await request.get_json(silent=True))
+        with stage("assistant_lookup"):
+            assistant_id = await get_or_create_assistant(store_id)
+
+        # Reuse the session's thread if nothing has been said in it yet (e.g. a page reload),
+        # otherwise take a pre-created one and only create a thread inline if the pool is empty
+        session_id = request.cookies.get(SESSION_COOKIE)
+        session = session_store.get(session_id)
+        thread_id = reusable_thread(session)
+        if thread_id is None:
+            with stage("thread_create"):
+                thread_id = thread_pool.take() or await create_thread_id()
+
+        thread_cursors.mark_empty(thread_id)
+        if not session:
+            session_id = new_session_id()
+        previous = session_store.start(session_id, thread_id, assistant_id, store_id)
+        if previous and previous["thread_id"] != thread_id and DELETE_EXPIRED_THREADS:
+            run_in_background(delete_threads([previous["thread_id"]]))
+
+        response = jsonify(thread_body(thread_id, assistant_id, store_id))
+        response.set_cookie(SESSION_COOKIE, session_id, max_age=SESSION_TTL, httponly=True, samesite="Lax")
+        return response
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/session/stats', methods=['GET'])
+async def get_session_stats():
+    """Report session store and warm thread pool usage."""
+    return jsonify({**session_store.stats(), "thread_pool": thread_pool.stats()})
+
+async def wait_for_run(thread_id, run_id):
+    """Poll a run until it leaves the queued/in_progress states, backing off between checks."""
+    interval = POLL_INITIAL_INTERVAL
+    polls = 0
+    with stage("run_poll"):
+        while True:
+            run_status = await client.beta.threads.runs.retrieve(
+                thread_id=thread_id,
+                run_id=run_id
+            )
+            polls += 1
+
+            if run_status.status not in ['queued', 'in_progress', 'cancelling']:
+                record_polls(polls)
+                return run_status
+
+            await asyncio.sleep(interval)
+            interval = min(interval * POLL_BACKOFF_FACTOR, POLL_MAX_INTERVAL)
+
+async def get_run_reply(thread_id, run_id):
+    """Return (text, citations) for the messages a run added, or (None, []) if it added none.
+
+    Only the run's messages newer than the thread's cursor are listed.
+    """
+    with stage("message_list"):
+        messages = await client.beta.threads.messages.list(**thread_cursors.list_params(thread_id, run_id))
+
+    if messages.data:
+        thread_cursors.set(thread_id, messages.data[-1].id)
+
+    message_content, citations = run_reply(messages.data)
+    return message_content, await resolve_citations(citations)
+
+async def retrieve_file_name(file_id):
+    try:
+        return (await client.files.retrieve(file_id)).filename
+    except Exception as e:
+        print(f"Warning: Could not look up cited file {file_id}: {e}")
+        return None
+
+async def resolve_citations(citations):
+    """Number a reply's citations and attach filenames, retrieving uncached files in one concurrent batch."""
+    if not citations:
+        return []
+
+    filenames, missing = cited_files(citations, metadata_cache)
+    if missing:
+        with stage("citation_lookup"):
+            found = await asyncio.gather(*(retrieve_file_name(file_id) for file_id in missing))
+        remember_files(filenames, missing, found, metadata_cache, FILE_NAME_TTL)
+
+    return number_citations(citations, filenames)
+
+async def poll_response(thread_id, assistant_id, run_id=None):
+    """Run the assistant (or wait on an existing run) by polling and return (reply, citations)."""
+    if run_id is None:
+        with stage("run_create"):
+            run = await client.beta.threads.runs.create(
+                thread_id=thread_id,
+                assistant_id=assistant_id
+            )
+        run_id = run.id
+
+    run_status = await wait_for_run(thread_id, run_id)
+    if run_status.status != 'completed':
+        raise RuntimeError(f"Run {run_status.status}")
+
+    message_content, citations = await get_run_reply(thread_id, run_id)
+    if message_content is None:
+        raise RuntimeError("No response from assistant")
+
+    return message_content, citations
+
+async def stream_response(thread_id, assistant_id, started, on_complete=None):
+    """Yield SSE frames with the assistant's text deltas as they arrive.
+
+    If streaming fails before any text has been sent, the run is finished by
+    polling instead and the full reply is sent as a single delta. The full
+    reply and its citations are passed to `on_complete` once the run has
+    finished, and the citations are sent with the final "done" event.
+    """
+    run = RunStream(thread_id, thread_cursors)
+
+    try:
+        async with client.beta.threads.runs.stream(
+            thread_id=thread_id,
+            assistant_id=assistant_id
+        ) as stream:
+            async for event in stream:
+                for frame in run.frames(event):
+                    yield frame
+                if run.ended:
+                    return
+
+        missing = run.finish()
+        if missing:
+            yield missing
+            return
+
+        citations = await resolve_citations(run.citations)
+        if on_complete:
+            on_complete(run.reply, citations)
+        yield sse_event("done", {
+            "timing": response_timings.record("stream", started, run.first_token_at),
+            "citations": citations
+        })
+        return
+    except Exception as e:
+        if run.first_token_at is not None:
+            yield sse_event("error", {"error": str(e)})
+            return
+        print(f"Streaming failed, falling back to polling: {e}")
+
+    try:
+        message_content, citations = await poll_response(thread_id, assistant_id, run_id=run.run_id)
+        first_token_at = time.perf_counter()
+        if on_complete:
+            on_complete(message_content, citations)
+        yield reply_frames(message_content, response_timings.record("poll", started, first_token_at), citations)
+    except Exception as e:
+        yield sse_event("error", {"error": str(e)})
+
+async def answer_from_semantic_cache(thread_id, turn):
+    """The answer to a near-duplicate of this opening question, recorded in the thread, or None."""
+    # Answers given before the store's files changed are dropped
+    await refresh_store_version(turn.store_id)
+
+    try:
+        with stage("semantic_cache_embed"):
+            embedding = await asyncio.to_thread(semantic_cache.embed, turn.message)
+    except Exception as e:
+        print(f"Warning: Could not embed question for the semantic cache: {e}")
+        return None
+
+    answer = turn.cached_answer(embedding)
+    if answer is not None:
+        await record_answer(thread_id, answer)
+    return answer
+
+async def record_answer(thread_id, answer):
+    """Add an answer that did not come from a run on this thread, so follow-up questions keep their context."""
+    answer_message = await client.beta.threads.messages.create(
+        thread_id=thread_id,
+        role="assistant",
+        content=answer
+    )
+    thread_cursors.set(thread_id, answer_message.id)
+
+async def wait_for_coalesced(flight):
+    """Return the leading request's (answer, citations), or None if it failed and this request should run its own."""
+    try:
+        with stage("coalesced_wait"):
+            return await flight.wait()
+    except Exception as e:
+        print(f"Coalesced run failed, running separately: {e}")
+        return None
+
+async def releasing(frames, release):
+    """Pass a streamed body through, calling `release` once it has been sent or abandoned."""
+    try:
+        async for frame in frames:
+            yield frame
+    finally:
+        release()
+
+@app.route('/api/send-message', methods=['POST'])
+async def send_message():
+    data = await request.get_json() or {}
+    session_id = request.cookies.get(SESSION_COOKIE)
+    try:
+        chat = ChatRequest(data, session_store.get(session_id), store_registry.select(request, data), STREAM_RESPONSES)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    thread_id, assistant_id = chat.thread_id, chat.assistant_id
+    started = time.perf_counter()
+
+    try:
+        turn = ChatTurn(chat, thread_cursors.is_empty(thread_id), semantic_cache, chat_flights if COALESCE_REQUESTS else None)
+
+        # Add message to thread
+        with stage("message_create"):
+            user_message = await client.beta.threads.messages.create(
+                thread_id=thread_id,
+                role="user",
+                content=chat.message
+            )
+        thread_cursors.set(thread_id, user_message.id)
+        if chat.in_session:
+            session_store.record_message(session_id)
+
+        # Reuse the answer to a near-duplicate opening question instead of starting a run
+        cached_answer = await answer_from_semantic_cache(thread_id, turn) if turn.checks_cache else None
+        if cached_answer is not None:
+            timing = response_timings.record("cached", started, time.perf_counter())
+            if chat.stream:
+                return Response(reply_frames(cached_answer, timing), mimetype='text/event-stream')
+            return jsonify(reply_body(cached_answer, timing, source="cached"))
+
+        # Wait for an identical opening question already running on another thread instead of starting a run
+        flight = turn.join()
+        if flight is not None:
+            reply = await wait_for_coalesced(flight)
+            if reply is not None:
+                await record_answer(thread_id, reply[0])
+                timing = response_timings.record("coalesced", started, time.perf_counter())
+                if chat.stream:
+                    return Response(reply_frames(reply[0], timing, reply[1]), mimetype='text/event-stream')
+                return jsonify(reply_body(reply[0], timing, reply[1], source="coalesced"))
+
+        if chat.stream:
+            response = Response(
+                releasing(stream_response(thread_id, assistant_id, started, on_complete=turn.answer_ready), turn.release),
+                mimetype='text/event-stream',
+                headers=STREAM_HEADERS
+            )
+            response.timeout = None
+            return response
+
+        # Run the assistant and poll for completion
+        try:
+            message_content, citations = await poll_response(thread_id, assistant_id)
+            turn.answer_ready(message_content, citations)
+        finally:
+            turn.release()
+
+        return jsonify(reply_body(message_content, response_timings.record("poll", started, time.perf_counter()), citations))
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/response-timings', methods=['GET'])
+async def get_response_timings():
+    """Summarize recent time-to-first-token samples for the stream and poll paths."""
+    return jsonify(response_timings.summary())
+
+async def search_vs(vector_store_id, query, max_results=10, filters=None, rewrite_query=False, ranking_options=None):
+    """Search the vector store through the shared async client connection pool."""
+    # Build the request payload
+    payload = {
+        "query": query,
+        "max_num_results": max_results
+    }
+
+    # Add optional parameters if provided
+    if filters:
+        payload["filters"] = filters
+
+    if rewrite_query:
+        payload["rewrite_query"] = rewrite_query
+
+    if ranking_options:
+        payload["ranking_options"] = ranking_options
+
+    return await client.post(
+        f"/vector_stores/{vector_store_id}/search",
+        cast_to=object,
+        body=payload,
+        options={"headers": {"OpenAI-Beta": "assistants=v2"}}
+    )
+
+async def refresh_store_version(vector_store_id):
+    """Invalidate cached searches and answers for a store if its files changed since the last check."""
+    if not cache_policy.refresh_due(vector_store_id):
+        return
+    try:
+        with stage("store_version_check"):
+            store = await client.beta.vector_stores.retrieve(vector_store_id)
+        cache_policy.store_changed(vector_store_id, store)
+    except Exception as e:
+        print(f"Warning: Could not check vector store version: {e}")
+
+@app.route('/api/metadata-cache/stats', methods=['GET'])
+async def get_metadata_cache_stats():
+    """Hit/miss counters for the assistant and vector store metadata cache."""
+    return jsonify(metadata_cache.stats())
+
+@app.route('/api/semantic-cache/stats', methods=['GET'])
+async def get_semantic_cache_stats():
+    """Hit/miss/eviction counters for the semantic answer cache."""
+    if semantic_cache is None:
+        return jsonify({"enabled": False})
+    return jsonify(dict(semantic_cache.stats(), enabled=True))
+
+@app.route('/api/coalescing/stats', methods=['GET'])
+async def get_coalescing_stats():
+    """Requests that led an upstream call and requests that shared one, for searches and opening questions."""
+    return jsonify({
+        "enabled": COALESCE_REQUESTS,
+        "search": search_flights.stats(),
+        "chat": chat_flights.stats()
+    })
+
+@app.route('/api/rerank/stats', methods=['GET'])
+async def get_rerank_stats():
+    """Reranks applied, and reranks that fell back to the original ranking after a timeout or error."""
+    return jsonify(dict(rerank_pool.stats(), default=RERANKER, candidates=RERANK_CANDIDATES))
+
+@app.route('/api/search-cache/stats', methods=['GET'])
+async def get_search_cache_stats():
+    """Hit/miss/eviction counters for the search cache."""
+    return jsonify(search_cache.stats())
+
+async def cached_search(query, max_results=10, filters=None, rewrite_query=False, store_id=None):
+    """Return cached results for a remote search of the given store (default: the default store), or None."""
+    store_id = cache_policy.store(store_id)
+    if not store_id:
+        return None
+    await refresh_store_version(store_id)
+    return cache_policy.lookup(cache_policy.key(store_id, query, max_results, filters, rewrite_query))
+
+async def run_search(query, max_results=10, filters=None, rewrite_query=False, backend=None, mode=None, fusion=None, store_id=None):
+    """Run one search against the local mirror or the vector store, going through the search cache.
+
+    Remote searches go to `store_id`, or the default vector store. Returns
+    (results, cached). Raises ValueError for requests that cannot be
+    served and RuntimeError if the search itself fails.
+    """
+    # The local mirror answers without a network round trip; the query
+    # embedding may still call the API, so run it in a worker thread
+    if (backend or SEARCH_BACKEND) == 'local':
+        file_ids = local_search.file_ids(filters)
+        with stage("local_search"):
+            return await asyncio.to_thread(local_search.search, query, max_results, file_ids, mode, fusion), False
+
+    store_id = cache_policy.store(store_id)
+    if not store_id:
+        raise ValueError("Vector store ID not found")
+
+    # Serve repeated searches from the cache
+    cached = await cached_search(query, max_results, filters, rewrite_query, store_id)
+    if cached is not None:
+        return cached, True
+
+    key = cache_policy.key(store_id, query, max_results, filters, rewrite_query)
+    async def fetch():
+        with stage("remote_search"):
+            results = await search_vs(
+                store_id,
+                query,
+                max_results=max_results,
+                filters=filters,
+                rewrite_query=rewrite_query,
+                ranking_options=None
+            )
+        cache_policy.keep(key, store_id, results)
+        return results
+
+    # Identical searches already in flight share that call's results
+    results = (await cache_policy.flights.do(key, fetch))[0] if cache_policy.flights else await fetch()
+    return search_page(query, results), False
+
+async def run_fanout_search(query, options, store_ids, normalize=DEFAULT_NORMALIZE, timeout=FANOUT_STORE_TIMEOUT):
+    """Search several vector stores concurrently and merge their hits by normalized score.
+
+    Stores that fail or miss the deadline are left out of the hits and
+    reported in the response's `stores`. Raises RuntimeError if none answered.
+    """
+    async def search_store(store_id):
+        return (await run_search(query, **dict(options, store_id=store_id)))[0]
+
+    with stage("fanout_search"):
+        outcomes = await search_stores_async(search_store, store_ids, timeout)
+    with stage("merge"):
+        return merge_results(query, outcomes, options["max_results"], normalize)
+
+async def search_results(query, data, options):
+    """Results of a search request: from one vector store, or merged from several with "vector_store_ids"."""
+    fanout = search_requests.fanout(data)
+    if fanout:
+        return await run_fanout_search(query, options, **fanout)
+    return (await run_search(query, **options))[0]
+
+@app.route('/api/search-vector-store', methods=['POST'])
+async def search_vector_store():
+    """API endpoint to search the vector store."""
+    data = await request.get_json() or {}
+
+    try:
+        query = search_requests.query(data)
+        options, reranker, top_k = search_requests.single(data)
+        fields = search_requests.projection(data)
+        results = await search_results(query, data, options)
+
+        if reranker:
+            with stage("rerank"):
+                results = await rerank_pool.rerank_async(results, query, reranker, top_k)
+        if fields is not None:
+            with stage("snippets"):
+                results = project_results(results, query, fields, data.get('snippet_chars', SNIPPET_CHARS))
+        return jsonify(results)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print(f"Error searching vector store: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/search-vector-store/content', methods=['POST'])
+async def search_result_content():
+    """Full content of one hit from an earlier search.
+
+    Takes the body of that search plus the hit's `result_id`. The search is
+    repeated, normally from the search cache, and the hit's content returned.
+    """
+    data = await request.get_json() or {}
+    wanted = data.get('result_id')
+
+    if not data.get('query') or not wanted:
+        return jsonify({"error": "query and result_id are required"}), 400
+
+    try:
+        query = search_requests.query(data)
+        options, _, _ = search_requests.single(data)
+        results = await search_results(query, data, options)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print(f"Error loading search result content: {e}")
+        return jsonify({"error": str(e)}), 500
+
+    body = content_body(results, wanted)
+    if body is None:
+        return jsonify({"error": "Result not found; the store may have changed since the search"}), 404
+    return jsonify(body)
+
+@app.route('/api/search-vector-store/batch', methods=['POST'])
+async def search_vector_store_batch():
+    """Run many searches in one request.
+
+    Queries that normalize to the same text are searched once, cached results
+    are returned straight away and the rest run concurrently, at most
+    `concurrency` at a time. With "stream": true each result is sent as an
+    NDJSON line as soon as it completes; otherwise results come back in
+    request order in one response.
+    """
+    data = await request.get_json() or {}
+
+    try:
+        batch = BatchSearch(batch_queries(data, BATCH_SEARCH_MAX_QUERIES))
+        options = search_requests.options(data)
+        concurrency = batch_concurrency(data, BATCH_SEARCH_CONCURRENCY, BATCH_SEARCH_MAX_CONCURRENCY)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    slots = asyncio.Semaphore(concurrency)
+
+    async def search_one(indexes, query):
+        async with slots:
+            started = time.perf_counter()
+            try:
+                results, cached = await run_search(query, **options)
+            except Exception as e:
+                return indexes, batch.outcome(query, error=str(e), started=started)
+            return indexes, batch.outcome(query, results, cached, started=started)
+
+    async def completed():
+        """Yield (positions, outcome) for each distinct query as it finishes."""
+        pending = []
+        for indexes, query in batch.distinct():
+            hit = None
+            if options["backend"] != 'local':
+                hit = await cached_search(query, options["max_results"], options["filters"], options["rewrite_query"], options["store_id"])
+            if hit is not None:
+                yield indexes, batch.outcome(query, hit, cached=True)
+            else:
+                pending.append((indexes, query))
+
+        tasks = [asyncio.ensure_future(search_one(indexes, query)) for indexes, query in pending]
+        try:
+            for task in asyncio.as_completed(tasks):
+                yield await task
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    if data.get('stream'):
+        async def generate():
+            async for indexes, outcome in completed():
+                yield batch.add(indexes, outcome)
+            yield ndjson({"stats": batch.stats()})
+
+        response = Response(generate(), mimetype='application/x-ndjson', headers=STREAM_HEADERS)
+        response.timeout = None
+        return response
+
+    async for indexes, outcome in completed():
+        batch.add(indexes, outcome)
+    return jsonify(batch.body())
+
+if __name__ == '__main__':
+    app.run(debug=True)
@@ -0,0 +1,578 @@
+#!/usr/bin/env python3
+"""
+Request handling shared by app.py and async_app.py.
+
+The Flask and Quart apps differ in how they wait (worker threads or the
+event loop), not in what a request means. Everything else lives here:
+parsing and validating request bodies, shaping responses and streamed
+frames, and deciding what the search cache, the answer cache and request
+coalescing do with a request. The apps keep only the I/O: the OpenAI calls,
+the waiting, and turning these results into Flask or Quart responses. A
+change to the API is then made once and both apps behave the same.
+
+The apps pass in their configuration and state (`SearchRequests`,
+`CachePolicy`, `LocalSearch`) rather than this module reading the
+environment. ValueError means a bad request (400); `RequestError` carries
+another status.
+"""
+import json
+import time
+from collections import deque
+
+from attribute_store import validate_filter
+from fanout_search import check_store_ids, check_normalize, check_timeout, unique_store_ids, DEFAULT_NORMALIZE, DEFAULT_STORE_TIMEOUT
+from request_metrics import percentile, record_stage, stage
+from rerank import check_reranker, DEFAULT_RERANKER, DEFAULT_CANDIDATES
+from search_cache import make_key, normalize_query, store_fingerprint
+from search_snippets import check_fields, find_result, DEFAULT_FIELDS
+from thread_messages import message_text
+
+MAX_RESULTS = 50
+TIMING_SAMPLES = 500
+
+# Streamed responses must reach the client as they are written, not when a proxy's buffer fills
+STREAM_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+class RequestError(ValueError):
+    """A request the API refuses, answered with `status` (400 unless given)."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def ndjson(data):
+    return json.dumps(data) + "\n"
+
+
+def sse_event(event, data):
+    """Format a Server-Sent Events frame."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class ResponseTimings:
+    """Recent time-to-first-token samples per response mode (milliseconds)."""
+
+    MODES = ("stream", "poll", "cached", "coalesced")
+
+    def __init__(self, samples=TIMING_SAMPLES):
+        self.samples = {mode: deque(maxlen=samples) for mode in self.MODES}
+
+    def record(self, mode, started, first_token_at):
+        """Record time-to-first-token for a response and return the timing summary."""
+        ttft_ms = (first_token_at - started) * 1000
+        self.samples[mode].append(ttft_ms)
+        return {
+            "mode": mode,
+            "ttft_ms": round(ttft_ms, 1),
+            "total_ms": round((time.perf_counter() - started) * 1000, 1)
+        }
+
+    def summary(self):
+        summary = {}
+        for mode, samples in self.samples.items():
+            samples = list(samples)
+            summary[mode] = {
+                "count": len(samples),
+                "mean_ttft_ms": round(sum(samples) / len(samples), 1) if samples else None,
+                "p50_ttft_ms": round(percentile(samples, 0.5), 1) if samples else None,
+                "p95_ttft_ms": round(percentile(samples, 0.95), 1) if samples else None
+            }
+        return summary
+
+
+def store_choice(data, allow_default_change):
+    """The (vector store ID, scope) a set-vector-store body asks for.
+
+    "session" (the default) picks the store for one browser session and
+    "default" changes the deployment's default, which needs
+    `allow_default_change`.
+    """
+    store_id = data.get('vector_store_id')
+    scope = data.get('scope', 'session')
+    if not store_id:
+        raise RequestError("Missing vector store ID")
+    if scope not in ('session', 'default'):
+        raise RequestError("scope must be 'session' or 'default'")
+    if scope == 'default' and not allow_default_change:
+        raise RequestError("Changing the default vector store is disabled; set ALLOW_DEFAULT_STORE_CHANGE=true", 403)
+    return store_id, scope
+
+
+def store_choice_body(store_id, scope):
+    return {
+        "success": True,
+        "message": "Vector store updated successfully",
+        "vector_store_id": store_id,
+        "scope": scope
+    }
+
+
+def listing_options(args):
+    """(refresh, details, files_limit) of a vector store listing's query string.
+
+    refresh=1 bypasses the cache, details=1 retrieves every store and files=N
+    also lists up to N file IDs per store.
+    """
+    files_limit = args.get('files', 0, type=int)
+    details = bool(args.get('details')) or files_limit > 0
+    return bool(args.get('refresh')), details, files_limit
+
+
+def reusable_thread(session):
+    """The session's thread if nothing has been said in it yet (e.g. after a page reload), or None."""
+    if session and session["messages"] == 0:
+        return session["thread_id"]
+    return None
+
+
+def thread_body(thread_id, assistant_id, store_id):
+    return {
+        "thread_id": thread_id,
+        "assistant_id": assistant_id,
+        "vector_store_id": store_id
+    }
+
+
+class ChatRequest:
+    """A send-message body. Browsers send only the message; their thread and assistant come from the session."""
+
+    def __init__(self, data, session, store_id, stream_allowed=True):
+        self.thread_id = data.get('thread_id')
+        self.assistant_id = data.get('assistant_id')
+        self.message = data.get('message')
+        self.stream = bool(data.get('stream', False)) and stream_allowed
+        self.store_id = store_id
+        if session and not self.thread_id:
+            self.thread_id = session["thread_id"]
+            self.assistant_id = self.assistant_id or session["assistant_id"]
+            self.store_id = session["vector_store_id"] or store_id
+        if not self.thread_id or not self.assistant_id or not self.message:
+            raise RequestError("Missing required parameters")
+        # Messages only count towards the session while it is on its own thread
+        self.in_session = bool(session) and session["thread_id"] == self.thread_id
+
+
+class ChatTurn:
+    """The answer cache and coalescing decisions for one message; the apps make the calls and do the waiting.
+
+    Only opening questions use either, because later answers depend on the
+    conversation so far. `flights` is None when coalescing is off.
+    """
+
+    def __init__(self, chat, first_turn, semantic_cache=None, flights=None):
+        self.store_id = chat.store_id
+        self.message = chat.message
+        self.first_turn = first_turn
+        self.semantic_cache = semantic_cache
+        self.flights = flights
+        self.key = json.dumps([chat.store_id, chat.assistant_id, normalize_query(chat.message)])
+        self.embedding = None
+        self.flight = None
+
+    @property
+    def checks_cache(self):
+        """Whether to embed the question and look for a near-duplicate's answer."""
+        return self.first_turn and self.semantic_cache is not None and bool(self.store_id)
+
+    def cached_answer(self, embedding):
+        """The answer to a near-duplicate question, or None; on a miss the embedding is kept to cache this answer."""
+        self.embedding = embedding
+        match = self.semantic_cache.lookup(self.store_id, embedding)
+        return match[0] if match else None
+
+    def join(self):
+        """The flight of an identical opening question already running, to wait on; None if this request runs its own."""
+        if self.flights is None or not self.first_turn:
+            return None
+        flight, leader = self.flights.begin(self.key)
+        if leader:
+            self.flight = flight
+            return None
+        return flight
+
+    def answer_ready(self, answer, citations):
+        """Share the answer with the requests waiting on this one and cache it for near-duplicates."""
+        if self.flight is not None:
+            self.flights.finish(self.key, self.flight, (answer, citations))
+        if self.embedding is not None and answer:
+            self.semantic_cache.add(self.store_id, self.message, answer, self.embedding)
+
+    def release(self):
+        """Let waiting requests run their own if no answer was shared; a no-op once one was."""
+        if self.flight is not None:
+            self.flights.finish(self.key, self.flight, error=RuntimeError("Coalesced run did not complete"))
+
+
+def reply_body(answer, timing, citations=None, source=None):
+    """A chat reply; `source` ("cached" or "coalesced") marks one that did not come from this request's run."""
+    body = {"response": answer, "timing": timing}
+    if citations is not None:
+        body["citations"] = citations
+    if source:
+        body[source] = True
+    return body
+
+
+def reply_frames(answer, timing, citations=None):
+    """A whole chat reply as SSE frames: one delta, then "done"."""
+    done = {"timing": timing}
+    if citations is not None:
+        done["citations"] = citations
+    return sse_event("delta", {"text": answer}) + sse_event("done", done)
+
+
+class RunStream:
+    """Follows a streamed assistant run, collecting the reply and turning its text deltas into SSE frames."""
+
+    ENDED = ('thread.run.failed', 'thread.run.cancelled', 'thread.run.expired')
+
+    def __init__(self, thread_id, thread_cursors):
+        self.thread_id = thread_id
+        self.thread_cursors = thread_cursors
+        self.run_id = None
+        self.first_token_at = None
+        self.parts = []
+        self.citations = []
+        self.ended = False
+        self.started = time.perf_counter()
+
+    def frames(self, event):
+        """The SSE frames to send for one stream event; sets `ended` once a run that did not complete is reported."""
+        frames = []
+        if event.event == 'thread.run.created':
+            self.run_id = event.data.id
+        elif event.event == 'thread.message.delta':
+            for block in event.data.delta.content or []:
+                if block.type == 'text' and block.text and block.text.value:
+                    if self.first_token_at is None:
+                        self.first_token_at = time.perf_counter()
+                        record_stage("run_stream_first_token", self.first_token_at - self.started)
+                    self.parts.append(block.text.value)
+                    frames.append(sse_event("delta", {"text": block.text.value}))
+        elif event.event == 'thread.message.completed':
+            # The completed message carries the final citations; it is also the thread's newest message
+            self.thread_cursors.set(self.thread_id, event.data.id)
+            self.citations.extend(message_text(event.data)[1])
+        elif event.event in self.ENDED:
+            frames.append(sse_event("error", {"error": f"Run {event.data.status}"}))
+            self.ended = True
+        return frames
+
+    def finish(self):
+        """Record the stream's duration; returns an error frame if no text arrived, else None."""
+        record_stage("run_stream", time.perf_counter() - self.started)
+        if self.first_token_at is None:
+            return sse_event("error", {"error": "No response from assistant"})
+        return None
+
+    @property
+    def reply(self):
+        return "".join(self.parts)
+
+
+def cited_files(citations, metadata_cache):
+    """(filenames already cached by file ID, file IDs still to look up) for a reply's citations."""
+    filenames = {}
+    missing = []
+    for file_id in dict.fromkeys(citation["file_id"] for citation in citations):
+        filename = metadata_cache.get(f"file:{file_id}", count=False)
+        if filename is None:
+            missing.append(file_id)
+        else:
+            filenames[file_id] = filename
+    return filenames, missing
+
+
+def remember_files(filenames, missing, found, metadata_cache, ttl):
+    """Add looked-up filenames (None where the lookup failed) to `filenames` and the cache."""
+    for file_id, filename in zip(missing, found):
+        if filename:
+            metadata_cache.set(f"file:{file_id}", filename, ttl=ttl)
+            filenames[file_id] = filename
+
+
+class SearchRequests:
+    """Options of the search endpoints' request bodies, validated; ValueError means a bad request.
+
+    `select_store(data)` returns the vector store a request searches when it
+    names no other. Reranking is only offered while `rerank_pool` is started.
+    """
+
+    def __init__(self, select_store, backend="remote", reranker=None, rerank_pool=None, rerank_candidates=DEFAULT_CANDIDATES,
+                 store_timeout=DEFAULT_STORE_TIMEOUT):
+        self.select_store = select_store
+        self.backend = backend
+        self.reranker = reranker
+        self.rerank_pool = rerank_pool
+        self.rerank_candidates = rerank_candidates
+        self.store_timeout = store_timeout
+
+    def query(self, data):
+        """The query of a search body; ValueError if it is missing or the search has no vector store to go to."""
+        if not self.select_store(data) and not data.get('vector_store_ids') and data.get('backend', self.backend) != 'local':
+            raise ValueError("Vector store ID not found")
+        query = data.get('query')
+        if not query:
+            raise ValueError("Query is required")
+        return query
+
+    def options(self, data):
+        """The search options shared by the single and batch search endpoints."""
+        filters = data.get('filters')
+
+        # Reject malformed filters before they reach the API or the local index
+        if filters is not None:
+            try:
+                validate_filter(filters)
+            except ValueError as e:
+                raise ValueError(f"Invalid filters: {e}")
+
+        return {
+            "max_results": max_results(data),
+            "filters": filters,
+            "rewrite_query": data.get('rewrite_query', False),
+            "backend": data.get('backend', self.backend),
+            "mode": data.get('mode'),
+            "fusion": data.get('fusion'),
+            "store_id": self.select_store(data)
+        }
+
+    def rerank(self, data):
+        """The reranker a search asked for (true picks the default, false turns the default off), or None."""
+        requested = data.get('rerank')
+        reranker = self.reranker if requested is None else requested
+        if not reranker:
+            return None
+        if reranker is True:
+            reranker = self.reranker or DEFAULT_RERANKER
+        check_reranker(reranker)
+        if self.rerank_pool is None or not self.rerank_pool.started:
+            # The default reranker is skipped if its workers failed to start; asking for one is an error
+            if requested is None:
+                return None
+            raise ValueError("Reranking is not available: no rerank workers are running (set RERANKER or RERANK_WORKERS)")
+        return reranker
+
+    def single(self, data):
+        """Search options, reranker and number of hits to return for a single search."""
+        options = self.options(data)
+        reranker = self.rerank(data)
+        top_k = options["max_results"]
+
+        # Rerank a deeper page of candidates and keep the best max_results
+        if reranker:
+            options["max_results"] = min(max(top_k, self.rerank_candidates), MAX_RESULTS)
+        return options, reranker, top_k
+
+    def projection(self, data):
+        """The fields to return for each hit ("snippets": true picks the defaults), or None for whole hits."""
+        fields = data.get('fields')
+        if fields is None and data.get('snippets'):
+            fields = list(DEFAULT_FIELDS)
+        if fields is not None:
+            check_fields(fields)
+        return fields
+
+    def fanout(self, data):
+        """The stores, score normalization and per-store deadline of a search over several vector stores, or None."""
+        store_ids = data.get('vector_store_ids')
+        if store_ids is None:
+            return None
+        check_store_ids(store_ids)
+        if data.get('backend', self.backend) == 'local':
+            raise ValueError("vector_store_ids cannot be combined with the local backend")
+        normalize = data.get('normalize', DEFAULT_NORMALIZE)
+        check_normalize(normalize)
+        timeout = data.get('store_timeout', self.store_timeout)
+        check_timeout(timeout)
+        return {"store_ids": unique_store_ids(store_ids), "normalize": normalize, "timeout": timeout}
+
+
+class CachePolicy:
+    """Which searches the search cache answers, which share a search in flight, and when cached results go stale.
+
+    The apps run the searches and the store version checks (`refresh_due`,
+    then retrieving the store and `store_changed`); the keys and decisions
+    live here so both apps cache and coalesce the same searches. `flights`
+    is None when coalescing is off. A store whose files changed also loses
+    its answers in `semantic_cache`.
+    """
+
+    def __init__(self, search_cache, default_store, flights=None, semantic_cache=None):
+        self.search_cache = search_cache
+        self.default_store = default_store
+        self.flights = flights
+        self.semantic_cache = semantic_cache
+
+    def store(self, store_id=None):
+        """The store a remote search goes to: `store_id`, else the default store; None if there is neither."""
+        return store_id or self.default_store()
+
+    def key(self, store_id, query, max_results=10, filters=None, rewrite_query=False):
+        return make_key(store_id, query, max_results, filters, rewrite_query, None)
+
+    def lookup(self, key):
+        with stage("search_cache_lookup"):
+            return self.search_cache.get(key)
+
+    def keep(self, key, store_id, results):
+        """Cache a search's results if they are a results page; done before coalesced callers are released."""
+        if isinstance(results, dict) and 'data' in results:
+            self.search_cache.set(key, store_id, results)
+
+    def refresh_due(self, store_id):
+        return self.search_cache.version_check_due(store_id)
+
+    def store_changed(self, store_id, store):
+        """Record a store's current version, dropping its cached searches and answers if it changed."""
+        if not self.search_cache.update_store_version(store_id, store_fingerprint(store)):
+            return False
+        if self.semantic_cache is not None:
+            self.semantic_cache.invalidate_store(store_id)
+        print(f"Vector store {store_id} changed, cached searches and answers invalidated")
+        return True
+
+
+def search_page(query, results):
+    """A remote search's results as a results page; RuntimeError if the search returned nothing."""
+    if not results:
+        raise RuntimeError("Search failed or returned no results")
+    if isinstance(results, dict) and 'data' in results:
+        return results
+    return {
+        "search_query": query,
+        "data": results if isinstance(results, list) else []
+    }
+
+
+class LocalSearch:
+    """Searches of the local mirror, with attribute filters evaluated against the attribute mirror."""
+
+    def __init__(self, index=None, attribute_store=None, mode="vector", fusion="rrf"):
+        self.index = index
+        self.attribute_store = attribute_store
+        self.mode = mode
+        self.fusion = fusion
+
+    def file_ids(self, filters):
+        """The files a filter matches (None without a filter); ValueError if no local index is loaded."""
+        if self.index is None:
+            raise ValueError("Local index not loaded. Set SEARCH_BACKEND=local and build it with scripts/local_index.py")
+        if not filters:
+            return None
+        with stage("attribute_filter"):
+            return self.attribute_store.matching_file_ids(filters)
+
+    def search(self, query, max_results=10, file_ids=None, mode=None, fusion=None):
+        return self.index.search(
+            query,
+            max_results=max_results,
+            mode=mode or self.mode,
+            fusion=fusion or self.fusion,
+            file_ids=file_ids
+        )
+
+
+def content_body(results, wanted):
+    """The full content of the hit `wanted` in a search's results, or None if it is not among them."""
+    item = find_result(results, wanted)
+    if item is None:
+        return None
+    return {
+        "result_id": wanted,
+        "file_id": item.get("file_id"),
+        "filename": item.get("filename"),
+        "content": item.get("content")
+    }
+
+
+def max_results(data):
+    """How many hits a search returns: its "max_results", clamped to 1-MAX_RESULTS."""
+    count = data.get('max_results', 10)
+    if isinstance(count, bool) or not isinstance(count, int):
+        raise ValueError("max_results must be an integer")
+    return min(max(1, count), MAX_RESULTS)
+
+
+def batch_concurrency(data, default, maximum):
+    """How many of a batch's searches may run at once: its "concurrency", clamped to 1-`maximum`."""
+    concurrency = data.get('concurrency', default)
+    if isinstance(concurrency, bool) or not isinstance(concurrency, int):
+        raise ValueError("concurrency must be an integer")
+    return min(max(1, concurrency), maximum)
+
+
+def batch_queries(data, max_queries):
+    """A batch's queries; ValueError unless they are a non-empty list of at most `max_queries` non-blank strings."""
+    queries = data.get('queries')
+    if not isinstance(queries, list) or not queries or not all(isinstance(query, str) and query.strip() for query in queries):
+        raise ValueError("queries must be a non-empty list of strings")
+    if len(queries) > max_queries:
+        raise ValueError(f"At most {max_queries} queries per batch")
+    return queries
+
+
+class BatchSearch:
+    """A batch's distinct queries, their outcomes as they finish, and the batch's response.
+
+    Queries that normalize to the same text are searched once; their outcome
+    is reported at each of their positions in the request.
+    """
+
+    def __init__(self, queries):
+        self.queries = queries
+        self.started = time.perf_counter()
+        self.positions = {}
+        for i, query in enumerate(queries):
+            self.positions.setdefault(normalize_query(query), []).append(i)
+        self.outcomes = []
+        self.ordered = [None] * len(queries)
+
+    def distinct(self):
+        """(positions, query) for each distinct query."""
+        return [(indexes, self.queries[indexes[0]]) for indexes in self.positions.values()]
+
+    @staticmethod
+    def outcome(query, results=None, cached=False, error=None, started=None):
+        """One query's outcome; `started` is when its search began (none for cached results)."""
+        return {
+            "query": query,
+            "results": results,
+            "cached": cached,
+            "error": error,
+            "latency_ms": round((time.perf_counter() - started) * 1000, 2) if started is not None else 0.0
+        }
+
+    def add(self, indexes, outcome):
+        """Record a finished query; returns its NDJSON line for streamed batches."""
+        self.outcomes.append(outcome)
+        for i in indexes:
+            self.ordered[i] = {**outcome, "query": self.queries[i]}
+        return ndjson({"indexes": indexes, **outcome})
+
+    def stats(self):
+        return batch_stats(self.outcomes, len(self.queries), self.started)
+
+    def body(self):
+        """The whole batch, in request order, once every query has finished."""
+        return {"results": self.ordered, "stats": self.stats()}
+
+
+def batch_stats(outcomes, total, started):
+    """Aggregate throughput and latency for a finished batch."""
+    seconds = time.perf_counter() - started
+    latencies = [outcome["latency_ms"] for outcome in outcomes if not outcome["cached"]]
+    return {
+        "queries": total,
+        "unique_queries": len(outcomes),
+        "cache_hits": sum(outcome["cached"] for outcome in outcomes),
+        "errors": sum(outcome["error"] is not None for outcome in outcomes),
+        "seconds": round(seconds, 3),
+        "queries_per_second": round(total / seconds, 1) if seconds else None,
+        "latency_ms": {
+            "p50": percentile(latencies, 0.5),
+            "p99": percentile(latencies, 0.99)
+        }
+    }
@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+Local mirror of vector store file attributes, with indexes for filtering.
+
+Filters use the same grammar as the vector store search API:
+
+    {"type": "eq" | "ne" | "gt" | "gte" | "lt" | "lte", "key": "...", "value": ...}
+    {"type": "and" | "or", "filters": [ ...filters ]}
+
+`validate_filter` checks a filter before it is sent, and `AttributeStore`
+evaluates one locally. Each attribute key has an inverted index (value ->
+rows) for equality and a sorted numeric index for ranges, so a filter is
+evaluated as a few array lookups combined into a boolean mask over all files
+instead of a loop over every file's attributes.
+
+    python attribute_store.py sync        mirror attributes from the vector store
+    python attribute_store.py query '{"type": "eq", "key": "topic", "value": "cameras"}'
+"""
+import argparse
+import json
+import os
+import threading
+
+import numpy as np
+from dotenv import load_dotenv
+
+from openai_http import request_json
+
+ATTRIBUTE_STORE_PATH = "file_attributes.json"
+
+COMPARISON_TYPES = ("eq", "ne", "gt", "gte", "lt", "lte")
+RANGE_TYPES = ("gt", "gte", "lt", "lte")
+COMPOUND_TYPES = ("and", "or")
+
+
+def is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def validate_filter(filter, path="filters"):
+    """Raise ValueError describing the first problem in a filter, if any."""
+    if not isinstance(filter, dict):
+        raise ValueError(f"{path} must be an object")
+    filter_type = filter.get("type")
+    if filter_type in COMPOUND_TYPES:
+        filters = filter.get("filters")
+        if not isinstance(filters, list) or not filters:
+            raise ValueError(f"{path}.filters must be a non-empty list")
+        for i, child in enumerate(filters):
+            validate_filter(child, f"{path}.filters[{i}]")
+    elif filter_type in COMPARISON_TYPES:
+        if not isinstance(filter.get("key"), str) or not filter["key"]:
+            raise ValueError(f"{path}.key must be a non-empty string")
+        if "value" not in filter:
+            raise ValueError(f"{path}.value is required")
+        value = filter["value"]
+        if not isinstance(value, (str, int, float, bool)):
+            raise ValueError(f"{path}.value must be a string, number or boolean")
+        if filter_type in RANGE_TYPES and not is_number(value):
+            raise ValueError(f"{path}.value must be a number for '{filter_type}'")
+    else:
+        raise ValueError(f"{path}.type must be one of: {', '.join(COMPARISON_TYPES + COMPOUND_TYPES)}")
+
+
+def matches(filter, attributes):
+    """Evaluate a filter against one file's attributes (reference implementation).
+
+    A comparison on a key the file does not have never matches.
+    """
+    filter_type = filter["type"]
+    if filter_type == "and":
+        return all(matches(child, attributes) for child in filter["filters"])
+    if filter_type == "or":
+        return any(matches(child, attributes) for child in filter["filters"])
+
+    if filter["key"] not in attributes:
+        return False
+    actual = attributes[filter["key"]]
+    expected = filter["value"]
+    if filter_type in ("eq", "ne"):
+        equal = value_key(actual) == value_key(expected)
+        return equal if filter_type == "eq" else not equal
+    if not is_number(actual):
+        return False
+    if filter_type == "gt":
+        return actual > expected
+    if filter_type == "gte":
+        return actual >= expected
+    if filter_type == "lt":
+        return actual < expected
+    return actual <= expected
+
+
+def value_key(value):
+    """Hashable key that keeps True distinct from 1 and treats 1 and 1.0 as equal."""
+    if isinstance(value, bool):
+        return ("bool", value)
+    if is_number(value):
+        return ("number", float(value))
+    if isinstance(value, str):
+        return ("string", value)
+    # Generated attributes can hold lists or objects; they only ever match by equality
+    return ("json", json.dumps(value, sort_keys=True))
+
+
+class KeyIndex:
+    """Indexes for one attribute key over all rows."""
+
+    def __init__(self, size):
+        self.present = np.zeros(size, dtype=bool)
+        self.values = {}
+        self.numbers = None
+        self.number_rows = None
+
+    def add(self, row, value):
+        self.present[row] = True
+        self.values.setdefault(value_key(value), []).append(row)
+
+    def finish(self):
+        """Freeze posting lists into arrays and build the sorted numeric index."""
+        self.values = {value: np.array(rows, dtype=np.int64) for value, rows in self.values.items()}
+        number_keys = [value for value in self.values if value[0] == "number"]
+        rows = [self.values[value] for value in number_keys]
+        numbers = [np.full(len(r), value[1]) for value, r in zip(number_keys, rows)]
+        if rows:
+            numbers = np.concatenate(numbers)
+            rows = np.concatenate(rows)
+            order = np.argsort(numbers, kind="stable")
+            self.numbers = numbers[order]
+            self.number_rows = rows[order]
+        else:
+            self.numbers = np.zeros(0)
+            self.number_rows = np.zeros(0, dtype=np.int64)
+
+
+class AttributeStore:
+    """File attributes keyed by file ID, saved as JSON and indexed in memory for filtering."""
+
+    def __init__(self, path=ATTRIBUTE_STORE_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        try:
+            with open(path, "r") as f:
+                self.attributes = json.load(f)
+        except FileNotFoundError:
+            self.attributes = {}
+        self.indexes = None
+
+    def __len__(self):
+        return len(self.attributes)
+
+    def get(self, file_id):
+        return self.attributes.get(file_id)
+
+    def set(self, file_id, attributes):
+        with self.lock:
+            self.attributes[file_id] = attributes
+            self.indexes = None
+
+    def remove(self, file_id):
+        with self.lock:
+            self.attributes.pop(file_id, None)
+            self.indexes = None
+
+    def save(self):
+        """Write the store atomically."""
+        with self.lock:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self.attributes, f)
+            os.replace(tmp_path, self.path)
+
+    def build_indexes(self):
+        """(Re)build the per-key indexes; done lazily on the first filter after a change."""
+        with self.lock:
+            file_ids = list(self.attributes)
+            indexes = {}
+            for row, file_id in enumerate(file_ids):
+                for key, value in self.attributes[file_id].items():
+                    if key not in indexes:
+                        indexes[key] = KeyIndex(len(file_ids))
+                    indexes[key].add(row, value)
+            for index in indexes.values():
+                index.finish()
+            self.file_ids = np.array(file_ids, dtype=object)
+            self.indexes = indexes
+        return indexes
+
+    def mask(self, filter):
+        """Return a boolean mask over `self.file_ids` of the files matching a filter."""
+        indexes = self.indexes if self.indexes is not None else self.build_indexes()
+        size = len(self.file_ids)
+        filter_type = filter["type"]
+        if filter_type in COMPOUND_TYPES:
+            masks = [self.mask(child) for child in filter["filters"]]
+            combine = np.logical_and if filter_type == "and" else np.logical_or
+            return combine.reduce(masks)
+
+        result = np.zeros(size, dtype=bool)
+        index = indexes.get(filter["key"])
+        if index is None:
+            return result
+        value = filter["value"]
+        if filter_type in ("eq", "ne"):
+            rows = index.values.get(value_key(value))
+            if rows is not None:
+                result[rows] = True
+            return result if filter_type == "eq" else index.present & ~result
+
+        side = "right" if filter_type in ("gt", "lte") else "left"
+        cut = np.searchsorted(index.numbers, value, side=side)
+        rows = index.number_rows[cut:] if filter_type in ("gt", "gte") else index.number_rows[:cut]
+        result[rows] = True
+        return result
+
+    def matching_file_ids(self, filter):
+        """Return the set of file IDs whose attributes match a filter."""
+        validate_filter(filter)
+        mask = self.mask(filter)
+        return set(self.file_ids[mask].tolist())
+
+    def sync_from_vector_store(self, vector_store_id):
+        """Replace the mirror with the attributes of every file attached to a vector store."""
+        attributes = {}
+        after = None
+        while True:
+            path = f"/vector_stores/{vector_store_id}/files?limit=100"
+            if after:
+                path += f"&after={after}"
+            page = request_json("GET", path)
+            for store_file in page["data"]:
+                attributes[store_file["id"]] = store_file.get("attributes") or {}
+            if not page.get("has_more") or not page["data"]:
+                break
+            after = page["data"][-1]["id"]
+
+        with self.lock:
+            self.attributes = attributes
+            self.indexes = None
+        return len(attributes)
+
+
+def main():
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Mirror and query vector store file attributes locally")
+    parser.add_argument("--path", default=ATTRIBUTE_STORE_PATH, help=f"Attribute store path (default: {ATTRIBUTE_STORE_PATH})")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    sync = subparsers.add_parser("sync", help="Mirror the attributes of every file in the vector store")
+    sync.add_argument("--vector-store-id", help="Vector store to mirror (default: from vector_store_info.json)")
+
+    query = subparsers.add_parser("query", help="List the files matching a filter")
+    query.add_argument("filter", help="JSON filter in the vector store search grammar")
+
+    args = parser.parse_args()
+    store = AttributeStore(args.path)
+
+    if args.command == "sync":
+        vector_store_id = args.vector_store_id
+        if not vector_store_id:
+            from search_vector_store import load_vector_store_info
+            vector_store_info = load_vector_store_info()
+            if not vector_store_info:
+                return
+            vector_store_id = vector_store_info["vector_store_id"]
+        count = store.sync_from_vector_store(vector_store_id)
+        store.save()
+        print(f"Mirrored attributes for {count} files to {args.path}")
+    else:
+        try:
+            filter = json.loads(args.filter)
+            file_ids = store.matching_file_ids(filter)
+        except (json.JSONDecodeError, ValueError) as e:
+            print(f"Error: invalid filter: {e}")
+            return
+        print(f"{len(file_ids)} of {len(store)} files match")
+        for file_id in sorted(file_ids):
+            print(f"  {file_id}: {json.dumps(store.get(file_id))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Measure local attribute filter evaluation over a large synthetic file set.
+
+Compares the indexed evaluator in attribute_store.py with evaluating the
+filter against every file's attributes in turn, and checks that both return
+the same files.
+    python benchmark_attribute_filters.py --files 100000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from attribute_store import AttributeStore, matches
+
+DOCUMENT_TYPES = ["manual", "faq", "release_notes", "troubleshooting", "datasheet"]
+TOPICS = [f"topic_{i}" for i in range(50)]
+
+FILTERS = {
+    "eq": {"type": "eq", "key": "document_type", "value": "faq"},
+    "ne": {"type": "ne", "key": "topic", "value": "topic_7"},
+    "range": {"type": "gte", "key": "page_count", "value": 400},
+    "and": {"type": "and", "filters": [
+        {"type": "eq", "key": "is_technical", "value": True},
+        {"type": "lt", "key": "complexity_level", "value": 3}
+    ]},
+    "nested": {"type": "or", "filters": [
+        {"type": "and", "filters": [
+            {"type": "eq", "key": "document_type", "value": "datasheet"},
+            {"type": "gt", "key": "page_count", "value": 250}
+        ]},
+        {"type": "eq", "key": "topic", "value": "topic_3"}
+    ]}
+}
+
+
+def synthetic_attributes(count, seed=0):
+    rng = random.Random(seed)
+    return {
+        f"file-{i:08d}": {
+            "document_type": rng.choice(DOCUMENT_TYPES),
+            "topic": rng.choice(TOPICS),
+            "complexity_level": rng.randint(1, 10),
+            "is_technical": rng.random() < 0.6,
+            "page_count": rng.randint(1, 500)
+        }
+        for i in range(count)
+    }
+
+
+def time_ms(fn, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - started) * 1000 / repeat, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark indexed vs per-file attribute filter evaluation")
+    parser.add_argument("--files", type=int, default=100000, help="Synthetic files (default: 100000)")
+    parser.add_argument("--repeat", type=int, default=20, help="Evaluations per filter for the indexed path (default: 20)")
+
+    args = parser.parse_args()
+
+    attributes = synthetic_attributes(args.files)
+    with tempfile.TemporaryDirectory() as workdir:
+        store = AttributeStore(os.path.join(workdir, "file_attributes.json"))
+        store.attributes = attributes
+
+        started = time.perf_counter()
+        store.build_indexes()
+        print(f"Indexed {args.files:,} files in {(time.perf_counter() - started) * 1000:.0f} ms\n")
+
+        print(f"{'filter':<8} {'matches':>8} {'indexed ms':>11} {'scan ms':>9} {'speedup':>8}")
+        for name, filter in FILTERS.items():
+            indexed_ms, file_ids = time_ms(lambda: store.matching_file_ids(filter), args.repeat)
+            scan_ms, scanned = time_ms(lambda: {file_id for file_id, attrs in attributes.items() if matches(filter, attrs)}, 1)
+            assert file_ids == scanned, f"{name}: indexed and scanned results differ"
+            print(f"{name:<8} {len(file_ids):>8} {indexed_ms:>11.2f} {scan_ms:>9.2f} {scan_ms / indexed_ms:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Measure chunk pipeline throughput, deduplication and peak memory on a large synthetic corpus.
+
+Source documents are generated on disk (Zipf-distributed words, with a share
+of documents republished as near-copies of earlier ones with about one word
+per paragraph edited), then chunked, deduplicated and packed by
+chunk_pipeline.py:
+    python benchmark_chunk_pipeline.py --megabytes 1024 --dedup minhash
+
+Peak RSS is for the whole process, so compare dedup methods in separate runs.
+Pass --sources to run over real documents instead.
+"""
+import argparse
+import itertools
+import os
+import random
+import tempfile
+
+from chunk_pipeline import ChunkPipeline, DEFAULT_DEDUP, DEDUP_METHODS, DEFAULT_OVERLAP, DEFAULT_PACK_BYTES, DEFAULT_WINDOW, peak_rss_mb
+
+PARAGRAPH_WORDS = 200
+DOCUMENT_PARAGRAPHS = 50
+
+
+def synthetic_document(seed, cum_weights, vocabulary, edit_seed=None):
+    """Paragraphs of one document; with `edit_seed`, one word per paragraph is replaced."""
+    rng = random.Random(seed)
+    edits = random.Random(edit_seed) if edit_seed is not None else None
+    paragraphs = []
+    for _ in range(DOCUMENT_PARAGRAPHS):
+        words = rng.choices(vocabulary, cum_weights=cum_weights, k=PARAGRAPH_WORDS)
+        if edits:
+            words[edits.randrange(PARAGRAPH_WORDS)] = "edited"
+        paragraphs.append(" ".join(words))
+    return "\n\n".join(paragraphs) + "\n"
+
+
+def synthetic_sources(directory, megabytes, duplicate_rate, vocabulary_size=50000, seed=0):
+    """Write about `megabytes` of documents; returns the number that are near-copies of an earlier one."""
+    rng = random.Random(seed)
+    vocabulary = [f"w{i}" for i in range(vocabulary_size)]
+    cum_weights = list(itertools.accumulate(1.0 / (rank + 1) for rank in range(vocabulary_size)))
+    target = megabytes * 1024 * 1024
+    originals = []
+    written = 0
+    copies = 0
+    count = 0
+    while written < target:
+        if originals and rng.random() < duplicate_rate:
+            text = synthetic_document(rng.choice(originals), cum_weights, vocabulary, edit_seed=count)
+            copies += 1
+        else:
+            text = synthetic_document(count, cum_weights, vocabulary)
+            originals.append(count)
+        # Spread the files over subdirectories to keep directory listings small
+        path = os.path.join(directory, f"{count // 1000:04d}", f"doc_{count:07d}.txt")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(text)
+        written += len(text)
+        count += 1
+    return copies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the streaming chunk pipeline")
+    parser.add_argument("--megabytes", type=int, default=1024, help="Size of the synthetic corpus (default: 1024)")
+    parser.add_argument("--duplicate-rate", type=float, default=0.2, help="Share of documents that are edited copies (default: 0.2)")
+    parser.add_argument("--sources", nargs="+", help="Chunk these files or directories instead of a synthetic corpus")
+    parser.add_argument("--dedup", choices=DEDUP_METHODS, default=DEFAULT_DEDUP, help=f"Duplicate detection (default: {DEFAULT_DEDUP})")
+    parser.add_argument("--window", type=int, default=DEFAULT_WINDOW, help=f"Tokens per window (default: {DEFAULT_WINDOW})")
+    parser.add_argument("--overlap", type=int, default=DEFAULT_OVERLAP, help=f"Tokens shared by consecutive windows (default: {DEFAULT_OVERLAP})")
+    parser.add_argument("--pack-bytes", type=int, default=DEFAULT_PACK_BYTES, help=f"Target size of each packed file (default: {DEFAULT_PACK_BYTES})")
+
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        sources = args.sources
+        if not sources:
+            sources = [os.path.join(workdir, "sources")]
+            os.makedirs(sources[0])
+            copies = synthetic_sources(sources[0], args.megabytes, args.duplicate_rate)
+            print(f"Generated {args.megabytes} MB with {copies:,} near-copy documents "
+                  f"(peak RSS {peak_rss_mb():.1f} MB)\n")
+
+        pipeline = ChunkPipeline(os.path.join(workdir, "chunks"), window=args.window, overlap=args.overlap,
+                                 dedup=args.dedup, pack_bytes=args.pack_bytes)
+        for _ in pipeline.run(sources):
+            pass
+        summary = pipeline.summary()
+
+    print(f"dedup:            {args.dedup}")
+    print(f"input:            {summary['input_bytes'] / (1024 * 1024):,.1f} MB in {summary['documents']:,} documents")
+    print(f"windows:          {summary['windows']:,} ({summary['duplicates']:,} duplicates dropped)")
+    print(f"packed files:     {summary['files']:,} ({summary['output_bytes'] / (1024 * 1024):,.1f} MB)")
+    print(f"time:             {summary['seconds']:.1f} s")
+    print(f"throughput:       {summary['mb_per_second']:.2f} MB/s, {summary['windows_per_second']:,.0f} windows/s")
+    print(f"peak RSS:         {summary['peak_rss_mb']:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Measure BM25 indexing throughput and keyword, vector and hybrid query latency.
+
+By default a synthetic corpus is generated (Zipf-distributed words with
+embedded part numbers and error codes) and indexed with the offline hashing
+embedder, so the benchmark needs no API access:
+    python benchmark_hybrid_search.py --chunks 100000
+
+Pass --chunks-dir to index real chunk files instead.
+"""
+import argparse
+import glob
+import json
+import os
+import random
+import tempfile
+import time
+
+from bm25_index import build_bm25
+from local_index import build_index, load_local_index
+from request_metrics import percentile
+from semantic_cache import get_embedder
+
+
+def synthetic_corpus(directory, count, words_per_chunk=120, vocabulary_size=20000, seed=0):
+    """Write `count` chunk files and return their paths along with sample identifier queries."""
+    rng = random.Random(seed)
+    vocabulary = [f"w{i}" for i in range(vocabulary_size)]
+    weights = [1.0 / (rank + 1) for rank in range(vocabulary_size)]
+    identifiers = []
+    paths = []
+    for i in range(count):
+        words = rng.choices(vocabulary, weights=weights, k=words_per_chunk)
+        if i % 50 == 0:
+            identifier = f"ERR-{i:06d}"
+            identifiers.append(identifier)
+            words.append(f"error {identifier} on CD{i % 97}-256")
+        path = os.path.join(directory, f"chunk_{i:06d}.json")
+        with open(path, "w") as f:
+            json.dump({"text": " ".join(words)}, f)
+        paths.append(path)
+    return paths, identifiers
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark BM25 indexing and hybrid search latency")
+    parser.add_argument("--chunks", type=int, default=100000, help="Synthetic chunks to generate (default: 100000)")
+    parser.add_argument("--chunks-dir", help="Index these chunk files instead of a synthetic corpus")
+    parser.add_argument("--queries", type=int, default=200, help="Queries per mode (default: 200)")
+    parser.add_argument("--max-results", type=int, default=10, help="Results per query (default: 10)")
+
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        if args.chunks_dir:
+            chunk_files = sorted(glob.glob(os.path.join(args.chunks_dir, "*.json")))
+            identifiers = []
+        else:
+            print(f"Generating {args.chunks} synthetic chunks...")
+            chunk_files, identifiers = synthetic_corpus(workdir, args.chunks)
+
+        index_dir = os.path.join(workdir, "index")
+        summary = build_index(chunk_files, get_embedder("hashing"), index_dir=index_dir,
+                              manifest_path=os.path.join(workdir, "manifest.json"), bm25=True)
+        index = load_local_index(index_dir)
+
+        # Time the BM25 build on its own, separate from reading files and embedding
+        texts = [chunk["text"] for chunk in index.chunks]
+        started = time.perf_counter()
+        bm25_summary = build_bm25(texts, index.index_dir)
+        bm25_seconds = time.perf_counter() - started
+        index = load_local_index(index_dir)
+
+        print(f"\nIndexed {summary['chunks']} chunks in {summary['seconds']:.1f}s (embedding included)")
+        print(f"BM25 build: {bm25_seconds:.2f}s, {len(texts) / bm25_seconds:,.0f} chunks/s, "
+              f"{bm25_summary['terms']:,} terms, {bm25_summary['postings']:,} postings")
+
+        rng = random.Random(1)
+        word_queries = [" ".join(rng.choice(texts).split()[:6]) for _ in range(args.queries)]
+        queries = {
+            "words": word_queries,
+            "identifier": [rng.choice(identifiers) for _ in range(args.queries)] if identifiers else []
+        }
+
+        print(f"\n{'mode':<10} {'queries':<11} {'p50 ms':>9} {'p99 ms':>9}")
+        for mode in ("keyword", "vector", "hybrid"):
+            for kind, query_list in queries.items():
+                if not query_list:
+                    continue
+                latencies = []
+                for query in query_list:
+                    started = time.perf_counter()
+                    index.search(query, max_results=args.max_results, mode=mode)
+                    latencies.append((time.perf_counter() - started) * 1000)
+                print(f"{mode:<10} {kind:<11} {percentile(latencies, 0.5):>9.2f} {percentile(latencies, 0.99):>9.2f}")
+
+        # How often the chunk containing an exact identifier is in the results
+        if identifiers:
+            print(f"\n{'mode':<10} {'identifier hit@1':>17} {f'hit@{args.max_results}':>9}")
+            sample = identifiers[:min(len(identifiers), args.queries)]
+            for mode in ("vector", "keyword", "hybrid"):
+                first = anywhere = 0
+                for identifier in sample:
+                    data = index.search(identifier, max_results=args.max_results, mode=mode)["data"]
+                    positions = [i for i, item in enumerate(data) if identifier in item["content"][0]["text"]]
+                    first += bool(positions) and positions[0] == 0
+                    anywhere += bool(positions)
+                print(f"{mode:<10} {first / len(sample):>17.3f} {anywhere / len(sample):>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Measure vector store listing against an account with many stores.
+
+Compares the previous listing (first page only), a full sequential walk
+that retrieves every store one at a time, and the streaming listing with
+concurrent detail fetches. Run against the mock API, which adds a fixed
+latency to every list and retrieve call:
+    python scripts/mock_openai_server.py --metadata-delay 0.05
+    OPENAI_BASE_URL=http://localhost:8001/v1 python scripts/benchmark_list_vector_stores.py --stores 1000
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+import openai
+
+from vector_store_listing import format_store, iter_store_details, iter_vector_stores
+
+load_dotenv()
+
+
+def ensure_stores(client, count):
+    """Create benchmark stores until the account has at least `count` of them."""
+    existing = sum(1 for _ in iter_vector_stores(client))
+    missing = count - existing
+    if missing > 0:
+        print(f"Creating {missing} vector stores...")
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            list(executor.map(lambda i: client.beta.vector_stores.create(name=f"benchmark-store-{i}"),
+                              range(existing, count)))
+
+
+def first_page(client):
+    """The previous implementation: one page from vector_stores.list()."""
+    for store in client.beta.vector_stores.list().data:
+        yield format_store(store)
+
+
+def sequential_details(client):
+    for store in iter_vector_stores(client):
+        yield format_store(client.beta.vector_stores.retrieve(vector_store_id=store.id))
+
+
+def time_listing(stores):
+    """Consume a listing and return (store count, seconds to first store, total seconds)."""
+    started = time.perf_counter()
+    first = None
+    count = 0
+    for _ in stores:
+        if first is None:
+            first = time.perf_counter() - started
+        count += 1
+    return count, first or 0.0, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark paginated and concurrent vector store listing")
+    parser.add_argument("--stores", type=int, default=1000, help="Stores to make sure exist first (default: 1000)")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[8, 32], help="Detail fetch concurrency levels (default: 8 32)")
+    parser.add_argument("--files", type=int, default=0, help="Also list up to N file IDs per store in the concurrent runs")
+    parser.add_argument("--skip-sequential", action="store_true", help="Skip the slow sequential detail walk")
+
+    args = parser.parse_args()
+
+    client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    ensure_stores(client, args.stores)
+
+    runs = [
+        ("first page", lambda: first_page(client)),
+        ("all pages", lambda: (format_store(store) for store in iter_vector_stores(client)))
+    ]
+    if not args.skip_sequential:
+        runs.append(("sequential details", lambda: sequential_details(client)))
+    for concurrency in args.concurrency:
+        runs.append((f"concurrent details x{concurrency}",
+                     lambda c=concurrency: iter_store_details(client, iter_vector_stores(client),
+                                                              concurrency=c, files_limit=args.files)))
+
+    print(f"\n{'listing':<26} {'stores':>7} {'first s':>8} {'total s':>8} {'stores/s':>9}")
+    for name, listing in runs:
+        count, first, total = time_listing(listing())
+        print(f"{name:<26} {count:>7} {first:>8.2f} {total:>8.2f} {count / total:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
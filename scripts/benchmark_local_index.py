@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Compare the local index mirror with remote vector store search.
+
+Reports latency percentiles for exact (brute-force) and, if the index has
+one, IVF searches on the mirror, and for remote searches. Recall@k is the
+share of the reference top-k file IDs the other search also returned:
+IVF against exact local search, and the local mirror against the remote
+store.
+
+Queries come from --queries-file (one per line) or are sampled from the
+indexed chunks.
+    python local_index.py build --chunks-dir english_chunks --ivf-lists 256
+    python benchmark_local_index.py --queries 200 --max-results 10
+"""
+import argparse
+import random
+import time
+
+from dotenv import load_dotenv
+
+from local_index import INDEX_DIR, load_local_index
+from request_metrics import percentile
+from search_vector_store import load_vector_store_info, search_vector_store
+
+load_dotenv()
+
+
+def sample_queries(index, count, words=8, seed=0):
+    """Use the opening words of random chunks as queries."""
+    rng = random.Random(seed)
+    rows = rng.sample(range(len(index)), min(count, len(index)))
+    return [" ".join(index.chunks[row]["text"].split()[:words]) for row in rows]
+
+
+def recall(reference, candidate):
+    if not reference:
+        return 1.0
+    return len(set(reference) & set(candidate)) / len(reference)
+
+
+def run(search_fn, queries):
+    """Run every query and return (sorted latencies in ms, file IDs per query)."""
+    latencies = []
+    file_ids = []
+    for query in queries:
+        started = time.perf_counter()
+        results = search_fn(query) or {}
+        latencies.append((time.perf_counter() - started) * 1000)
+        file_ids.append([item["file_id"] for item in results.get("data", [])])
+    return sorted(latencies), file_ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark local index recall and latency against remote search")
+    parser.add_argument("--index-dir", default=INDEX_DIR, help=f"Index directory (default: {INDEX_DIR})")
+    parser.add_argument("--queries-file", help="File with one query per line (default: sample from the index)")
+    parser.add_argument("--queries", type=int, default=100, help="Queries to sample when no file is given (default: 100)")
+    parser.add_argument("--max-results", type=int, default=10, help="k for top-k and recall@k (default: 10)")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 8, 16], help="IVF lists to scan (default: 4 8 16)")
+    parser.add_argument("--skip-remote", action="store_true", help="Only benchmark the local index")
+
+    args = parser.parse_args()
+
+    index = load_local_index(args.index_dir)
+    if args.queries_file:
+        with open(args.queries_file, "r") as f:
+            queries = [line.strip() for line in f if line.strip()]
+    else:
+        queries = sample_queries(index, args.queries)
+
+    # Embed once up front so the query embedding is not counted against search
+    vectors = dict(zip(queries, index.embedder.embed(queries)))
+
+    def local_search(nprobe):
+        def search(query):
+            rows, _ = index.top_k(vectors[query], args.max_results, nprobe=nprobe)
+            return {"data": [{"file_id": index.chunks[row]["file_id"]} for row in rows]}
+        return search
+
+    print(f"{len(queries)} queries against {len(index)} chunks, k={args.max_results}\n")
+    print(f"{'search':<18} {'p50 ms':>9} {'p99 ms':>9} {'recall@k':>9}")
+
+    exact_latencies, exact_ids = run(local_search(0), queries)
+    print(f"{'local exact':<18} {percentile(exact_latencies, 0.5):>9.2f} {percentile(exact_latencies, 0.99):>9.2f} {'1.000':>9}")
+
+    if index.centroids is not None:
+        for nprobe in args.nprobe:
+            latencies, file_ids = run(local_search(nprobe), queries)
+            mean_recall = sum(map(recall, exact_ids, file_ids)) / len(queries)
+            print(f"{f'local ivf/{nprobe}':<18} {percentile(latencies, 0.5):>9.2f} {percentile(latencies, 0.99):>9.2f} {mean_recall:>9.3f}")
+
+    if not args.skip_remote:
+        vector_store_info = load_vector_store_info()
+        if not vector_store_info:
+            return
+        vector_store_id = vector_store_info["vector_store_id"]
+        latencies, remote_ids = run(lambda query: search_vector_store(vector_store_id, query, max_results=args.max_results), queries)
+        mean_recall = sum(map(recall, remote_ids, exact_ids)) / len(queries)
+        print(f"{'remote':<18} {percentile(latencies, 0.5):>9.2f} {percentile(latencies, 0.99):>9.2f} {'-':>9}")
+        print(f"\nLocal exact recall@{args.max_results} against remote results: {mean_recall:.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Measure reranking throughput and latency under concurrent search load.
+
+Each simulated request reranks a synthetic page of candidates (Zipf-distributed
+words, about 1,500 characters each). Three ways of running the reranker are
+compared at the same concurrency:
+    inline   scored in the request thread, as post-processing did before
+    pickle   scored on the process pool with the texts pickled to the worker
+    shared   scored on the process pool with the texts in shared memory
+    python benchmark_rerank.py --concurrency 16 --requests 400
+
+Process pool throughput grows with the number of cores; inline scoring is
+held to one core by the GIL however many request threads there are.
+"""
+import argparse
+import itertools
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from request_metrics import percentile
+from rerank import RerankPool, RERANKERS, DEFAULT_RERANKER, DEFAULT_CANDIDATES, check_reranker, worker_reranker
+
+
+def synthetic_pages(count, candidates, words_per_candidate=250, vocabulary_size=20000, seed=0):
+    """Return `count` (query, texts) pairs."""
+    rng = random.Random(seed)
+    vocabulary = [f"w{i}" for i in range(vocabulary_size)]
+    cum_weights = list(itertools.accumulate(1.0 / (rank + 1) for rank in range(vocabulary_size)))
+    pages = []
+    for _ in range(count):
+        texts = [" ".join(rng.choices(vocabulary, cum_weights=cum_weights, k=words_per_candidate)) for _ in range(candidates)]
+        query = " ".join(rng.choices(vocabulary[:2000], k=4))
+        pages.append((query, texts))
+    return pages
+
+
+def run(mode, pool, reranker, pages, requests, concurrency):
+    """Time `requests` reranks issued from `concurrency` threads; returns (seconds, latencies in ms)."""
+    def one(i):
+        query, texts = pages[i % len(pages)]
+        started = time.perf_counter()
+        if mode == "inline":
+            worker_reranker(reranker).score(query, texts)
+        else:
+            pool.submit(reranker, query, texts, shared=(mode == "shared")).result()
+        return (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = list(executor.map(one, range(requests)))
+    return time.perf_counter() - started, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark inline vs process pool reranking")
+    parser.add_argument("--reranker", choices=sorted(RERANKERS), default=DEFAULT_RERANKER, help=f"Reranker (default: {DEFAULT_RERANKER})")
+    parser.add_argument("--candidates", type=int, default=DEFAULT_CANDIDATES, help=f"Candidates per request (default: {DEFAULT_CANDIDATES})")
+    parser.add_argument("--requests", type=int, default=400, help="Reranks per mode (default: 400)")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent requests (default: 16)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Pool worker processes (default: one per core)")
+
+    args = parser.parse_args()
+    check_reranker(args.reranker)
+
+    pages = synthetic_pages(50, args.candidates)
+    pool = RerankPool(workers=args.workers, preload_names=(args.reranker,))
+    pool.start()
+    # Start every worker and load the model so start-up is not counted
+    for future in [pool.submit(args.reranker, *pages[0]) for _ in range(args.workers * 2)]:
+        future.result()
+
+    print(f"{args.requests} reranks of {args.candidates} candidates, {args.concurrency} concurrent, "
+          f"{args.workers} workers, {os.cpu_count()} cores\n")
+    print(f"{'mode':<8} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9}")
+    try:
+        for mode in ("inline", "pickle", "shared"):
+            seconds, latencies = run(mode, pool, args.reranker, pages, args.requests, args.concurrency)
+            print(f"{mode:<8} {args.requests / seconds:>9.1f} {percentile(latencies, 0.5):>9.2f} {percentile(latencies, 0.99):>9.2f}")
+    finally:
+        pool.shutdown()
+
+
+if __name__ == "__main__":
+    main()
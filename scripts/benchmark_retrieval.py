@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+"""
+Retrieval quality and latency benchmark over a golden query set.
+
+The golden set is a JSON lines file with one query per line and the files
+that should be retrieved for it, by file ID or filename:
+
+    {"id": "guest-overview", "query": "What are the features of Verkada Guest?", "relevant": ["file-abc123", "guest_overview_0002.json"]}
+
+`id` is optional (the line number is used otherwise). Every query is run
+once per combination of the search options given on the command line, and
+each combination reports recall@k, MRR, hit rate and p50/p95/p99 latency:
+
+    remote   vector store search (max_results, score_threshold, ranker, rewrite_query)
+    local    the local index mirror (max_results, score_threshold, mode)
+    app      POST /api/search-vector-store on a running app (max_results, rewrite_query, mode)
+
+    python benchmark_retrieval.py golden.jsonl --target remote --max-results 5 10 --ranker auto default-2024-11-15
+    python benchmark_retrieval.py golden.jsonl --target local --mode vector keyword hybrid
+
+`--chat N` also sends the first N golden queries through /api/start-thread
+and /api/send-message on the app and reports time-to-first-token and total
+round-trip latency for streamed and polled replies.
+
+Results are saved with --output, and --compare prints the change from a
+previous results file and exits non-zero when a configuration got worse.
+"""
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+import urllib.request
+from datetime import datetime, timezone
+
+from dotenv import load_dotenv
+
+from request_metrics import percentile
+from search_vector_store import load_vector_store_info, search_vector_store
+
+load_dotenv()
+
+OPTIONS = {
+    "remote": ("max_results", "score_threshold", "ranker", "rewrite_query"),
+    "local": ("max_results", "score_threshold", "mode"),
+    "app": ("max_results", "rewrite_query", "mode")
+}
+
+
+def load_golden_set(path):
+    """Read the golden query set; each entry gets an `id`, `query` and a set of `relevant` IDs/filenames."""
+    entries = []
+    with open(path, "r") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if not entry.get("query") or not entry.get("relevant"):
+                raise ValueError(f"{path}:{number}: each entry needs a query and a non-empty relevant list")
+            entries.append({
+                "id": str(entry.get("id", number)),
+                "query": entry["query"],
+                "relevant": set(entry["relevant"])
+            })
+    return entries
+
+
+def post_json(url, payload):
+    req = urllib.request.Request(
+        url,
+        data=json.dumps(payload).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+        method="POST"
+    )
+    return urllib.request.urlopen(req)
+
+
+def latency_summary(latencies):
+    if not latencies:
+        return {"p50": None, "p95": None, "p99": None, "mean": None}
+    return {
+        "p50": round(percentile(latencies, 0.5), 2),
+        "p95": round(percentile(latencies, 0.95), 2),
+        "p99": round(percentile(latencies, 0.99), 2),
+        "mean": round(sum(latencies) / len(latencies), 2)
+    }
+
+
+def configurations(args):
+    """Every combination of the options that apply to the target, as dicts."""
+    names = OPTIONS[args.target]
+    values = [getattr(args, name) for name in names]
+    return [dict(zip(names, combination)) for combination in itertools.product(*values)]
+
+
+def label(config):
+    return " ".join(f"{name}={value}" for name, value in config.items())
+
+
+def make_search(args):
+    """Return search(query, config) -> response dict (or None on error) for the chosen target."""
+    if args.target == "remote":
+        vector_store_info = load_vector_store_info()
+        if not vector_store_info:
+            sys.exit(1)
+        vector_store_id = vector_store_info["vector_store_id"]
+
+        def search(query, config):
+            ranking_options = {}
+            if config["ranker"] != "none":
+                ranking_options["ranker"] = config["ranker"]
+            if config["score_threshold"] is not None:
+                ranking_options["score_threshold"] = config["score_threshold"]
+            return search_vector_store(
+                vector_store_id, query,
+                max_results=config["max_results"],
+                rewrite_query=config["rewrite_query"] == "on",
+                ranking_options=ranking_options or None
+            )
+        return search
+
+    if args.target == "local":
+        from local_index import load_local_index
+        index = load_local_index(args.index_dir)
+
+        def search(query, config):
+            return index.search(query, max_results=config["max_results"],
+                                score_threshold=config["score_threshold"], mode=config["mode"])
+        return search
+
+    def search(query, config):
+        payload = {
+            "query": query,
+            "max_results": config["max_results"],
+            "rewrite_query": config["rewrite_query"] == "on"
+        }
+        if config["mode"] != "vector":
+            payload["mode"] = config["mode"]
+        with post_json(f"{args.url}/api/search-vector-store", payload) as response:
+            return json.load(response)
+    return search
+
+
+def score_query(entry, results, k):
+    """Rank of the first relevant result (or None) and recall@k for one query."""
+    found = set()
+    first_rank = None
+    for rank, item in enumerate(results[:k], 1):
+        keys = {item.get("file_id"), item.get("filename")} & entry["relevant"]
+        if keys:
+            found |= keys
+            if first_rank is None:
+                first_rank = rank
+    # A golden entry may list a file by both ID and filename, so cap at 1
+    return first_rank, min(1.0, len(found) / len(entry["relevant"]))
+
+
+def run_config(golden, search, config, repeat):
+    """Run every golden query `repeat` times under one configuration and summarize."""
+    latencies = []
+    queries = []
+    errors = 0
+    for entry in golden:
+        results = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            try:
+                response = search(entry["query"], config)
+            except Exception as e:
+                print(f"  Error searching '{entry['query']}': {e}")
+                response = None
+            latencies.append((time.perf_counter() - started) * 1000)
+            if results is None:
+                results = response
+        if results is None:
+            errors += 1
+            queries.append({"id": entry["id"], "first_relevant_rank": None, "recall": 0.0, "error": True})
+            continue
+        data = results.get("data", [])
+        first_rank, recall = score_query(entry, data, config["max_results"])
+        queries.append({"id": entry["id"], "first_relevant_rank": first_rank, "recall": recall,
+                        "returned": len(data)})
+
+    count = len(queries)
+    return {
+        "config": config,
+        "label": label(config),
+        "queries": count,
+        "errors": errors,
+        "recall_at_k": round(sum(q["recall"] for q in queries) / count, 4),
+        "mrr": round(sum(1 / q["first_relevant_rank"] for q in queries if q["first_relevant_rank"]) / count, 4),
+        "hit_rate": round(sum(q["first_relevant_rank"] is not None for q in queries) / count, 4),
+        "mean_results": round(sum(q.get("returned", 0) for q in queries) / count, 2),
+        "latency_ms": latency_summary(latencies),
+        "per_query": queries
+    }
+
+
+def send_message(base_url, chat, message, stream):
+    """Send one message and return (ttft_ms, total_ms) measured by the client."""
+    started = time.perf_counter()
+    first_token_at = None
+    payload = {
+        "thread_id": chat["thread_id"],
+        "assistant_id": chat["assistant_id"],
+        "message": message,
+        "stream": stream
+    }
+    with post_json(f"{base_url}/api/send-message", payload) as response:
+        if response.headers.get("Content-Type", "").startswith("text/event-stream"):
+            for line in response:
+                if first_token_at is None and line.startswith(b"event: delta"):
+                    first_token_at = time.perf_counter()
+                if line.startswith(b"event: error"):
+                    raise RuntimeError("Streamed response reported an error")
+        else:
+            json.load(response)
+            first_token_at = time.perf_counter()
+    finished = time.perf_counter()
+    return ((first_token_at or finished) - started) * 1000, (finished - started) * 1000
+
+
+def run_chat(base_url, golden, count):
+    """Round-trip each of the first `count` golden queries through a fresh thread per mode."""
+    summary = {}
+    for mode, stream in [("stream", True), ("poll", False)]:
+        ttfts, totals = [], []
+        errors = 0
+        for entry in golden[:count]:
+            try:
+                with post_json(f"{base_url}/api/start-thread", {}) as response:
+                    chat = json.load(response)
+                ttft, total = send_message(base_url, chat, entry["query"], stream)
+            except Exception as e:
+                print(f"  Error sending '{entry['query']}': {e}")
+                errors += 1
+                continue
+            ttfts.append(ttft)
+            totals.append(total)
+        summary[mode] = {
+            "messages": len(totals),
+            "errors": errors,
+            "ttft_ms": latency_summary(ttfts),
+            "total_ms": latency_summary(totals)
+        }
+    return summary
+
+
+def print_configs(configs):
+    print(f"{'configuration':<64} {'recall@k':>9} {'mrr':>6} {'hit':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for result in configs:
+        latency = result["latency_ms"]
+        print(f"{result['label']:<64} {result['recall_at_k']:>9.3f} {result['mrr']:>6.3f} {result['hit_rate']:>6.3f} "
+              f"{latency['p50']:>9.1f} {latency['p95']:>9.1f} {latency['p99']:>9.1f}"
+              + (f"   ({result['errors']} errors)" if result["errors"] else ""))
+
+
+def compare(current, baseline, quality_tolerance, latency_tolerance):
+    """Print per-configuration changes against a baseline run; return the number of regressions."""
+    previous = {result["label"]: result for result in baseline.get("configs", [])}
+    regressions = 0
+    print(f"\nCompared with {baseline.get('timestamp', 'baseline')}:")
+    print(f"{'configuration':<64} {'Δ recall':>9} {'Δ mrr':>7} {'Δ p95 ms':>10}")
+    for result in current["configs"]:
+        before = previous.get(result["label"])
+        if before is None:
+            print(f"{result['label']:<64} {'(new)':>9}")
+            continue
+        recall_delta = result["recall_at_k"] - before["recall_at_k"]
+        mrr_delta = result["mrr"] - before["mrr"]
+        p95, p95_before = result["latency_ms"]["p95"], before["latency_ms"]["p95"]
+        slower = p95_before and p95 > p95_before * (1 + latency_tolerance)
+        worse = recall_delta < -quality_tolerance or mrr_delta < -quality_tolerance or slower
+        regressions += bool(worse)
+        print(f"{result['label']:<64} {recall_delta:>+9.3f} {mrr_delta:>+7.3f} {p95 - p95_before:>+10.1f}"
+              + ("   REGRESSION" if worse else ""))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark retrieval quality and latency against a golden query set")
+    parser.add_argument("golden", help="Golden query set (JSON lines with query and relevant file IDs/filenames)")
+    parser.add_argument("--target", choices=sorted(OPTIONS), default="remote", help="What to search (default: remote)")
+    parser.add_argument("--url", default="http://localhost:5000", help="Base URL of the running app for --target app and --chat")
+    parser.add_argument("--index-dir", default="local_index", help="Index directory for --target local (default: local_index)")
+    parser.add_argument("--max-results", type=int, nargs="+", default=[10], help="Values of k to try (default: 10)")
+    parser.add_argument("--score-threshold", type=float, nargs="+", default=[None], help="Score thresholds to try")
+    parser.add_argument("--ranker", nargs="+", default=["none"], choices=["none", "auto", "default-2024-11-15"],
+                        help="Rankers to try; none leaves it to the API (default: none)")
+    parser.add_argument("--rewrite-query", nargs="+", default=["off"], choices=["off", "on"], help="Query rewriting settings to try")
+    parser.add_argument("--mode", nargs="+", default=["vector"], choices=["vector", "keyword", "hybrid"],
+                        help="Local ranking modes to try (default: vector)")
+    parser.add_argument("--repeat", type=int, default=1, help="Times to run each query per configuration (default: 1)")
+    parser.add_argument("--chat", type=int, default=0, help="Also round-trip this many golden queries through /api/send-message")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="Results file from an earlier run to compare against")
+    parser.add_argument("--quality-tolerance", type=float, default=0.01, help="Allowed drop in recall@k or MRR (default: 0.01)")
+    parser.add_argument("--latency-tolerance", type=float, default=0.2, help="Allowed relative increase in p95 latency (default: 0.2)")
+
+    args = parser.parse_args()
+
+    golden = load_golden_set(args.golden)
+    search = make_search(args)
+    configs = configurations(args)
+    print(f"{len(golden)} golden queries, {len(configs)} configurations against {args.target}\n")
+
+    results = {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "golden_set": args.golden,
+        "target": args.target,
+        "configs": [run_config(golden, search, config, args.repeat) for config in configs]
+    }
+    print_configs(results["configs"])
+
+    if args.chat:
+        results["chat"] = run_chat(args.url, golden, args.chat)
+        print(f"\n{'chat':<8} {'ttft p50':>9} {'p95':>8} {'p99':>8} {'total p50':>10} {'p95':>8} {'p99':>8}")
+        for mode, summary in results["chat"].items():
+            ttft, total = summary["ttft_ms"], summary["total_ms"]
+            if not summary["messages"]:
+                print(f"{mode:<8} {'no replies':>9}")
+                continue
+            print(f"{mode:<8} {ttft['p50']:>9.0f} {ttft['p95']:>8.0f} {ttft['p99']:>8.0f} "
+                  f"{total['p50']:>10.0f} {total['p95']:>8.0f} {total['p99']:>8.0f}")
+
+    if args.output:
+        with open(f"{args.output}.tmp", "w") as f:
+            json.dump(results, f, indent=2)
+        os.replace(f"{args.output}.tmp", args.output)
+        print(f"\nResults saved to {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.quality_tolerance, args.latency_tolerance)
+        if regressions:
+            print(f"\n{regressions} configuration(s) regressed")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Measure per-search overhead of spawning curl versus the pooled HTTP client.
+
+Run against the mock API with no simulated search latency so only the
+client overhead is measured:
+    python scripts/mock_openai_server.py --search-delay 0
+    OPENAI_BASE_URL=http://localhost:8001/v1 python scripts/benchmark_search_client.py
+"""
+import argparse
+import json
+import os
+import subprocess
+import time
+
+from dotenv import load_dotenv
+
+from openai_http import DEFAULT_BASE_URL, http2_available, post_json
+
+load_dotenv()
+
+
+def curl_search(base_url, vector_store_id, payload):
+    """The previous implementation: one curl process per search."""
+    result = subprocess.run(
+        [
+            "curl", f"{base_url}/vector_stores/{vector_store_id}/search",
+            "-s", "-X", "POST",
+            "-H", f"Authorization: Bearer {os.getenv('OPENAI_API_KEY')}",
+            "-H", "Content-Type: application/json",
+            "-H", "OpenAI-Beta: assistants=v2",
+            "-d", json.dumps(payload)
+        ],
+        capture_output=True,
+        text=True
+    )
+    return json.loads(result.stdout)
+
+
+def pooled_search(base_url, vector_store_id, payload):
+    return post_json(f"/vector_stores/{vector_store_id}/search", payload)
+
+
+def time_searches(search_fn, base_url, vector_store_id, payload, count):
+    latencies = []
+    for _ in range(count):
+        started = time.perf_counter()
+        search_fn(base_url, vector_store_id, payload)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return sorted(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark curl vs pooled HTTP client for vector store search")
+    parser.add_argument("--vector-store-id", default="vs_benchmark", help="Vector store to search")
+    parser.add_argument("--query", default="camera firmware update", help="Search query")
+    parser.add_argument("--requests", type=int, default=50, help="Searches per client (default: 50)")
+
+    args = parser.parse_args()
+
+    base_url = os.getenv("OPENAI_BASE_URL", DEFAULT_BASE_URL)
+    payload = {"query": args.query, "max_num_results": 10}
+
+    print(f"Searching {base_url} ({args.requests} searches per client, HTTP/2: {http2_available()})\n")
+    print(f"{'client':<8} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9}")
+
+    for name, search_fn in [("curl", curl_search), ("pooled", pooled_search)]:
+        # Warm up once so DNS and the first connection are not counted
+        search_fn(base_url, args.vector_store_id, payload)
+        latencies = time_searches(search_fn, base_url, args.vector_store_id, payload, args.requests)
+        mean = sum(latencies) / len(latencies)
+        p50 = latencies[len(latencies) // 2]
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        print(f"{name:<8} {mean:>9.2f} {p50:>9.2f} {p95:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
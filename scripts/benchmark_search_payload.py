@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Measure /api/search-vector-store response size, latency and render time, with
+and without snippets and compression.
+
+Runs against a running app (or the mock API behind it). Each combination of
+response shape (full hits vs snippets) and encoding (identity, gzip, brotli
+when the app supports it) is requested repeatedly; the first request of each
+query fills the search cache, so the timings cover building, compressing and
+sending the response rather than the upstream search.
+    OPENAI_BASE_URL=http://localhost:8001/v1 python app.py
+    python mock_openai_server.py --search-delay 0 --search-passage-chars 2000
+    python benchmark_search_payload.py --url http://localhost:5000 --max-results 50
+
+Render time is the time to decode the body, parse the JSON and format every
+hit with the CLI's display_search_results (whole content for full hits, as
+the browser used to render it); the browser logs its own render time to the
+console (console.debug).
+"""
+import argparse
+import contextlib
+import gzip
+import io
+import json
+import time
+
+import httpx
+
+from request_metrics import percentile
+from response_compression import brotli_available
+from search_vector_store import display_search_results
+
+
+def decode(body, encoding):
+    if encoding == "gzip":
+        return gzip.decompress(body)
+    if encoding == "br":
+        import brotli
+        return brotli.decompress(body)
+    return body
+
+
+def measure(client, url, payload, encoding, requests, full):
+    """Returns (wire bytes, body bytes, latencies in ms, render times in ms, encoding used)."""
+    latencies = []
+    renders = []
+    wire = size = 0
+    used = "identity"
+    for _ in range(requests):
+        started = time.perf_counter()
+        with client.stream("POST", url, json=payload, headers={"Accept-Encoding": encoding}) as response:
+            response.raise_for_status()
+            body = b"".join(response.iter_raw())
+            used = response.headers.get("Content-Encoding", "identity")
+        latencies.append((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        raw = decode(body, used)
+        results = json.loads(raw)
+        with contextlib.redirect_stdout(io.StringIO()):
+            display_search_results(results, full=full)
+        renders.append((time.perf_counter() - started) * 1000)
+        wire, size = len(body), len(raw)
+    return wire, size, latencies, renders, used
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark search response size and render time")
+    parser.add_argument("--url", default="http://localhost:5000", help="App base URL (default: http://localhost:5000)")
+    parser.add_argument("--query", default="camera firmware update", help="Search query")
+    parser.add_argument("--max-results", type=int, default=50, help="Results per search (default: 50)")
+    parser.add_argument("--requests", type=int, default=20, help="Requests per combination (default: 20)")
+
+    args = parser.parse_args()
+
+    url = f"{args.url.rstrip('/')}/api/search-vector-store"
+    base = {"query": args.query, "max_results": args.max_results}
+    shapes = [("full", base), ("snippets", dict(base, snippets=True))]
+    encodings = ["identity", "gzip"] + (["br"] if brotli_available() else [])
+
+    print(f"{args.max_results} results for '{args.query}', {args.requests} requests each\n")
+    print(f"{'response':<10} {'encoding':<9} {'bytes':>10} {'decoded':>10} {'p50 ms':>8} {'render ms':>10}")
+
+    with httpx.Client(timeout=60) as client:
+        for name, payload in shapes:
+            # Fill the search cache so every measured request is served from it
+            client.post(url, json=payload).raise_for_status()
+            for encoding in encodings:
+                wire, size, latencies, renders, used = measure(client, url, payload, encoding, args.requests, full=(name == "full"))
+                print(f"{name:<10} {used:<9} {wire:>10,} {size:>10,} {percentile(latencies, 0.5):>8.2f} {percentile(renders, 0.5):>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Compare time-to-first-token for streamed and polled /api/send-message replies.
+
+Run the app against the mock API first:
+    python scripts/mock_openai_server.py
+    OPENAI_BASE_URL=http://localhost:8001/v1 python app.py
+"""
+import argparse
+import json
+import time
+import urllib.request
+
+from request_metrics import percentile
+
+
+def post_json(url, payload):
+    req = urllib.request.Request(
+        url,
+        data=json.dumps(payload).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+        method="POST"
+    )
+    return urllib.request.urlopen(req)
+
+
+def start_thread(base_url):
+    with post_json(f"{base_url}/api/start-thread", {}) as response:
+        return json.load(response)
+
+
+def send_message(base_url, chat, message, stream):
+    """Send one message and return (ttft_seconds, total_seconds) measured by the client."""
+    started = time.perf_counter()
+    first_token_at = None
+    payload = {
+        "thread_id": chat["thread_id"],
+        "assistant_id": chat["assistant_id"],
+        "message": message,
+        "stream": stream
+    }
+    with post_json(f"{base_url}/api/send-message", payload) as response:
+        if response.headers.get("Content-Type", "").startswith("text/event-stream"):
+            for line in response:
+                if first_token_at is None and line.startswith(b"event: delta"):
+                    first_token_at = time.perf_counter()
+                if line.startswith(b"event: error"):
+                    raise RuntimeError("Streamed response reported an error")
+        else:
+            json.load(response)
+            first_token_at = time.perf_counter()
+    return first_token_at - started, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark streamed vs polled chat replies")
+    parser.add_argument("--url", default="http://localhost:5000", help="Base URL of the running app")
+    parser.add_argument("--requests", type=int, default=10, help="Messages to send per mode (default: 10)")
+    parser.add_argument("--message", default="What are the features of Verkada Guest?", help="Message to send")
+
+    args = parser.parse_args()
+
+    for mode, stream in [("stream", True), ("poll", False)]:
+        chat = start_thread(args.url)
+        ttfts, totals = [], []
+        for _ in range(args.requests):
+            ttft, total = send_message(args.url, chat, args.message, stream)
+            ttfts.append(ttft * 1000)
+            totals.append(total * 1000)
+
+        print(f"{mode}:")
+        print(f"  TTFT  mean {sum(ttfts) / len(ttfts):8.1f} ms   p50 {percentile(ttfts, 0.5):8.1f} ms   p95 {percentile(ttfts, 0.95):8.1f} ms")
+        print(f"  Total mean {sum(totals) / len(totals):8.1f} ms   p50 {percentile(totals, 0.5):8.1f} ms   p95 {percentile(totals, 0.95):8.1f} ms")
+
+    with urllib.request.urlopen(f"{args.url}/api/response-timings") as response:
+        print("\nServer-side timings:")
+        print(json.dumps(json.load(response), indent=2))
+
+
+if __name__ == "__main__":
+    main()
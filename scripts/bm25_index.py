@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+BM25 keyword index over the local mirror, and hybrid keyword + vector search.
+
+Semantic search tends to miss exact identifiers such as part numbers and
+error codes. This index is built from the chunk text in a local index
+directory (see local_index.py) and uses the same row numbers as its vectors,
+so the two rankings can be fused directly.
+
+Postings are stored term by term in flat arrays next to the vectors and are
+memory-mapped on load:
+
+    bm25_terms.json     vocabulary (term -> term ID) and corpus statistics
+    bm25_offsets.i64    start of each term's postings, plus a final end offset
+    bm25_docs.u32       chunk rows, grouped by term
+    bm25_tfs.u16        term frequency for each posting
+    bm25_lengths.u32    token count of each chunk
+
+Hybrid search fuses the top candidates of both rankings with reciprocal-rank
+fusion (`rrf`) or a weighted blend of min-max normalized scores (`weighted`).
+"""
+import json
+import os
+import re
+import time
+from collections import Counter
+
+import numpy as np
+
+TERMS_FILE = "bm25_terms.json"
+OFFSETS_FILE = "bm25_offsets.i64"
+DOCS_FILE = "bm25_docs.u32"
+TFS_FILE = "bm25_tfs.u16"
+LENGTHS_FILE = "bm25_lengths.u32"
+
+K1 = 1.2
+B = 0.75
+RRF_K = 60
+DEFAULT_FUSION = "rrf"
+DEFAULT_ALPHA = 0.5
+DEFAULT_CANDIDATES = 100
+
+# Words, numbers and identifiers joined by -, _, . or / such as "cd62-256" or "err_4012"
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-_./][a-z0-9]+)*")
+PART_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    """Lowercase tokens; compound identifiers are kept whole and also split into their parts."""
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        tokens.append(token)
+        parts = PART_PATTERN.findall(token)
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+
+def write_array(array, path):
+    array.tofile(f"{path}.tmp")
+    os.replace(f"{path}.tmp", path)
+
+
+def build_bm25(texts, index_dir):
+    """Build the BM25 postings for a list of chunk texts (row order matters) and return a summary."""
+    started = time.perf_counter()
+    vocabulary = {}
+    term_ids = []
+    doc_ids = []
+    tfs = []
+    lengths = np.zeros(len(texts), dtype=np.uint32)
+
+    for row, text in enumerate(texts):
+        tokens = tokenize(text)
+        lengths[row] = len(tokens)
+        for term, tf in Counter(tokens).items():
+            term_ids.append(vocabulary.setdefault(term, len(vocabulary)))
+            doc_ids.append(row)
+            tfs.append(tf)
+
+    # Group postings by term; the stable sort keeps rows ascending within a term
+    term_ids = np.array(term_ids, dtype=np.int64)
+    order = np.argsort(term_ids, kind="stable")
+    offsets = np.searchsorted(term_ids[order], np.arange(len(vocabulary) + 1)).astype(np.int64)
+
+    write_array(np.array(doc_ids, dtype=np.uint32)[order], os.path.join(index_dir, DOCS_FILE))
+    write_array(np.minimum(np.array(tfs, dtype=np.int64)[order], np.iinfo(np.uint16).max).astype(np.uint16),
+                os.path.join(index_dir, TFS_FILE))
+    write_array(offsets, os.path.join(index_dir, OFFSETS_FILE))
+    write_array(lengths, os.path.join(index_dir, LENGTHS_FILE))
+
+    terms_path = os.path.join(index_dir, TERMS_FILE)
+    with open(f"{terms_path}.tmp", "w") as f:
+        json.dump({
+            "count": len(texts),
+            "postings": len(doc_ids),
+            "average_length": float(lengths.mean()) if len(texts) else 0.0,
+            "terms": vocabulary
+        }, f)
+    os.replace(f"{terms_path}.tmp", terms_path)
+
+    return {
+        "chunks": len(texts),
+        "terms": len(vocabulary),
+        "postings": len(doc_ids),
+        "seconds": round(time.perf_counter() - started, 2)
+    }
+
+
+def load_array(path, dtype, count):
+    if count == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", shape=(count,))
+
+
+class BM25Index:
+    """BM25 postings for a local index directory, memory-mapped read-only."""
+
+    def __init__(self, index_dir):
+        with open(os.path.join(index_dir, TERMS_FILE), "r") as f:
+            metadata = json.load(f)
+        self.terms = metadata["terms"]
+        self.count = metadata["count"]
+        self.average_length = metadata["average_length"] or 1.0
+        self.offsets = load_array(os.path.join(index_dir, OFFSETS_FILE), np.int64, len(self.terms) + 1)
+        self.docs = load_array(os.path.join(index_dir, DOCS_FILE), np.uint32, metadata["postings"])
+        self.tfs = load_array(os.path.join(index_dir, TFS_FILE), np.uint16, metadata["postings"])
+        self.lengths = load_array(os.path.join(index_dir, LENGTHS_FILE), np.uint32, self.count)
+
+        # Per-chunk length normalization is the same for every query
+        self.norms = (K1 * (1 - B + B * np.asarray(self.lengths, dtype=np.float32) / self.average_length)).astype(np.float32)
+
+    def scores(self, query):
+        """Return the BM25 score of every chunk for a query."""
+        scores = np.zeros(self.count, dtype=np.float32)
+        for term in set(tokenize(query)):
+            term_id = self.terms.get(term)
+            if term_id is None:
+                continue
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            docs = self.docs[start:end]
+            tfs = self.tfs[start:end].astype(np.float32)
+            df = end - start
+            idf = np.log(1 + (self.count - df + 0.5) / (df + 0.5))
+            scores[docs] += idf * tfs * (K1 + 1) / (tfs + self.norms[docs])
+        return scores
+
+
+def top_rows(scores, k):
+    """Rows of the k highest scores, best first, skipping zero scores."""
+    k = min(k, int(np.count_nonzero(scores)))
+    if k == 0:
+        return np.array([], dtype=np.int64)
+    best = np.argpartition(-scores, k - 1)[:k]
+    return best[np.argsort(-scores[best])]
+
+
+def fuse(vector_scores, keyword_scores, vector_rows, keyword_rows, fusion=DEFAULT_FUSION, alpha=DEFAULT_ALPHA):
+    """Fuse two rankings of candidate rows; returns {row: score in [0, 1]}.
+
+    `vector_scores` and `keyword_scores` map a row to its score in each
+    ranking; `alpha` weights the vector side in the weighted blend.
+    """
+    candidates = set(vector_rows.tolist()) | set(keyword_rows.tolist())
+    if not candidates:
+        return {}
+    if fusion == "rrf":
+        fused = dict.fromkeys(candidates, 0.0)
+        for rows in (vector_rows, keyword_rows):
+            for rank, row in enumerate(rows.tolist(), 1):
+                fused[row] += 1.0 / (RRF_K + rank)
+        # Scale so a row ranked first by both scores 1.0
+        return {row: score * (RRF_K + 1) / 2 for row, score in fused.items()}
+    if fusion == "weighted":
+        def normalized(score_of):
+            values = {row: float(score_of(row)) for row in candidates}
+            low, high = min(values.values()), max(values.values())
+            span = (high - low) or 1.0
+            return {row: (value - low) / span for row, value in values.items()}
+        vector = normalized(vector_scores)
+        keyword = normalized(keyword_scores)
+        return {row: alpha * vector[row] + (1 - alpha) * keyword[row] for row in candidates}
+    raise ValueError(f"Unknown fusion '{fusion}'. Choose from: rrf, weighted")
+
+
+def hybrid_search(index, bm25, query, max_results=10, fusion=DEFAULT_FUSION, alpha=DEFAULT_ALPHA,
+                  candidates=DEFAULT_CANDIDATES, nprobe=None, allowed=None):
+    """Search a LocalIndex and its BM25 postings together; same response shape as LocalIndex.search.
+
+    `allowed` is an optional boolean row mask restricting both rankings.
+    """
+    query_vector = index.embedder.embed([query])[0]
+    vector_rows, _ = index.top_k(query_vector, candidates, nprobe, allowed)
+    keyword_scores = bm25.scores(query)
+    if allowed is not None:
+        keyword_scores[~allowed] = 0
+    keyword_rows = top_rows(keyword_scores, candidates)
+
+    fused = fuse(
+        lambda row: index.vectors[row] @ query_vector,
+        lambda row: keyword_scores[row],
+        vector_rows, keyword_rows, fusion=fusion, alpha=alpha
+    )
+    ranked = sorted(fused.items(), key=lambda item: item[1], reverse=True)[:max_results]
+    return index.result_page(query, [row for row, _ in ranked], [score for _, score in ranked])
+
+
+def keyword_search(index, bm25, query, max_results=10, allowed=None):
+    """BM25-only search with the same response shape as LocalIndex.search."""
+    scores = bm25.scores(query)
+    if allowed is not None:
+        scores[~allowed] = 0
+    rows = top_rows(scores, max_results)
+    # BM25 scores are unbounded; scale to the best match for display
+    top = float(scores[rows[0]]) if len(rows) else 1.0
+    return index.result_page(query, rows, [float(scores[row]) / top for row in rows])
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Concurrent, resumable uploads of chunk files to the OpenAI Files API.
+
+Uploads run on a bounded thread pool. A rate-limit response pauses every
+worker until the server's retry-after (or a jittered backoff) has passed.
+Progress is checkpointed to a manifest mapping each local path to its file
+ID and content hash, so a rerun skips files that were already uploaded and
+have not changed. sync_vector_store.py adds the vector stores it attached
+each file to. Paths are consumed lazily with a bounded number of uploads
+in flight, so they can come from a generator that is still producing files
+(see chunk_pipeline.py).
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+
+import openai
+
+from openai_http import RETRY_MAX_DELAY, backoff_delay
+from store_registry import write_json_atomic
+
+MANIFEST_PATH = "upload_manifest.json"
+DEFAULT_CONCURRENCY = 8
+MAX_RETRIES = 5
+
+# Save the manifest after this many completed uploads
+CHECKPOINT_EVERY = 50
+
+
+def file_sha256(path):
+    """Hash a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_manifest(path=MANIFEST_PATH):
+    """Load the upload manifest, or an empty one if it does not exist yet."""
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_manifest(manifest, path=MANIFEST_PATH):
+    """Write the manifest atomically so an interrupted run never leaves it half-written."""
+    write_json_atomic(path, manifest)
+
+
+class RateLimitGate:
+    """Shared pause that holds every worker back after a rate-limit response."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.resume_at = 0.0
+
+    def wait(self):
+        delay = self.resume_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def pause(self, seconds):
+        with self.lock:
+            self.resume_at = max(self.resume_at, time.monotonic() + min(seconds, RETRY_MAX_DELAY))
+
+
+def retry_after_seconds(error):
+    """Return the retry delay requested by a rate-limit error, if any."""
+    headers = getattr(getattr(error, "response", None), "headers", {}) or {}
+    for header, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        try:
+            return float(headers[header]) * scale
+        except (KeyError, ValueError):
+            continue
+    return None
+
+
+def upload_file(client, path, gate, max_retries=MAX_RETRIES):
+    """Upload one file, backing off on rate limits and transient errors."""
+    for attempt in range(max_retries + 1):
+        gate.wait()
+        try:
+            with open(path, "rb") as f:
+                return client.files.create(file=f, purpose="assistants")
+        except openai.RateLimitError as e:
+            if attempt == max_retries:
+                raise
+            gate.pause(retry_after_seconds(e) or backoff_delay(attempt))
+        except (openai.APIConnectionError, openai.InternalServerError):
+            if attempt == max_retries:
+                raise
+            time.sleep(backoff_delay(attempt))
+
+
+def plan_upload(path, manifest):
+    """Return (path, sha256, size, mtime) if a file needs uploading, or None if it was uploaded unchanged.
+
+    Size and mtime are compared first so unchanged files are not re-hashed;
+    files whose metadata changed are hashed and only re-uploaded if their
+    content differs.
+    """
+    stat = os.stat(path)
+    entry = manifest.get(path)
+    if entry and entry.get("size") == stat.st_size and entry.get("mtime") == stat.st_mtime:
+        return None
+
+    digest = file_sha256(path)
+    if entry and entry.get("sha256") == digest:
+        entry["mtime"] = stat.st_mtime
+        return None
+
+    return path, digest, stat.st_size, stat.st_mtime
+
+
+def plan_uploads(paths, manifest):
+    """Split paths into files that need uploading and files already uploaded unchanged.
+
+    Returns (to_upload, unchanged) where to_upload holds (path, sha256, size,
+    mtime) tuples.
+    """
+    to_upload = []
+    unchanged = []
+    for path in paths:
+        planned = plan_upload(path, manifest)
+        if planned is None:
+            unchanged.append(path)
+        else:
+            to_upload.append(planned)
+    return to_upload, unchanged
+
+
+def bulk_upload(client, paths, manifest_path=MANIFEST_PATH, concurrency=DEFAULT_CONCURRENCY, progress_every=100):
+    """Upload files concurrently, skipping ones already in the manifest with the same content.
+
+    `paths` may be any iterable; it is read as uploads complete, with at
+    most twice `concurrency` files queued. Returns a summary dict with the
+    updated manifest, the failed uploads and throughput figures.
+    """
+    # Retries are handled here so one rate limit pauses every worker
+    client = client.with_options(max_retries=0)
+    manifest = load_manifest(manifest_path)
+
+    gate = RateLimitGate()
+    failed = []
+    skipped = 0
+    uploaded = 0
+    uploaded_bytes = 0
+    started = time.perf_counter()
+
+    def record(future, planned):
+        nonlocal uploaded, uploaded_bytes
+        path, digest, size, mtime = planned
+        try:
+            file = future.result()
+        except Exception as e:
+            failed.append({
+                "filename": path,
+                "error": str(e),
+                "timestamp": datetime.now().isoformat()
+            })
+            print(f"Error uploading {path}: {str(e)}")
+            return
+
+        # Earlier uploads still attached to vector stores stay recorded so a sync can detach them
+        previous = manifest.get(path) or {}
+        superseded = previous.get("superseded", [])
+        if previous.get("vector_stores"):
+            superseded = superseded + [{"file_id": previous["file_id"], "vector_stores": previous["vector_stores"]}]
+        manifest[path] = {
+            "file_id": file.id,
+            "sha256": digest,
+            "size": size,
+            "mtime": mtime,
+            "uploaded_at": datetime.now().isoformat()
+        }
+        if superseded:
+            manifest[path]["superseded"] = superseded
+        uploaded += 1
+        uploaded_bytes += size
+        if uploaded % CHECKPOINT_EVERY == 0:
+            save_manifest(manifest, manifest_path)
+
+        if uploaded % progress_every == 0:
+            elapsed = time.perf_counter() - started
+            print(f"Uploaded {uploaded} files "
+                  f"({uploaded / elapsed:.1f} files/s, {uploaded_bytes / elapsed / 1024:.1f} KB/s)")
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        pending = {}
+        try:
+            for path in paths:
+                planned = plan_upload(path, manifest)
+                if planned is None:
+                    skipped += 1
+                    continue
+                pending[executor.submit(upload_file, client, path, gate)] = planned
+
+                # Wait for uploads to finish before reading more paths
+                while len(pending) >= concurrency * 2:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        record(future, pending.pop(future))
+
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    record(future, pending.pop(future))
+        finally:
+            # On Ctrl-C or an error, let in-flight uploads finish and record them,
+            # so a rerun neither uploads them again nor leaves their files orphaned
+            executor.shutdown(wait=True, cancel_futures=True)
+            for future, planned in pending.items():
+                if not future.cancelled():
+                    record(future, planned)
+            save_manifest(manifest, manifest_path)
+
+    elapsed = time.perf_counter() - started
+
+    return {
+        "manifest": manifest,
+        "uploaded": uploaded,
+        "skipped": skipped,
+        "failed": failed,
+        "bytes": uploaded_bytes,
+        "seconds": elapsed,
+        "files_per_second": uploaded / elapsed if elapsed else 0.0,
+        "bytes_per_second": uploaded_bytes / elapsed if elapsed else 0.0
+    }
@@ -2,8 +2,15 @@
 import os
 import json
 import time
+import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from dotenv import load_dotenv
 import openai
+from bulk_upload import RateLimitGate, retry_after_seconds
+from openai_http import backoff_delay
+from search_cache import invalidate_shared_cache
+from store_registry import write_json_atomic
 
 # Load environment variables from .env file
 load_dotenv()
@@ -11,6 +18,18 @@ load_dotenv()
 # Initialize OpenAI client
 client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
+# File batch scheduling
+DEFAULT_BATCH_SIZE = 100
+MAX_BATCH_SIZE = 500
+MIN_BATCH_SIZE = 1
+DEFAULT_CONCURRENCY = 4
+MAX_FILE_ATTEMPTS = 3
+
+# Adaptive backoff while polling a batch (seconds)
+POLL_INITIAL_INTERVAL = 0.5
+POLL_MAX_INTERVAL = 5.0
+POLL_BACKOFF_FACTOR = 1.5
+
 def load_uploaded_files():
     """Load the uploaded files from the JSON file."""
     with open("uploaded_files.json", "r") as f:
@@ -28,32 +47,123 @@ def create_vector_store(name):
         print(f"Error creating vector store: {e}")
         return None
 
-def add_files_to_vector_store(vector_store_id, file_ids):
-    """Add files to the vector store."""
-    try:
-        # Add files in batches to avoid rate limits
-        batch_size = 10
-        total_files = len(file_ids)
-        
-        for i in range(0, total_files, batch_size):
-            batch = file_ids[i:i+batch_size]
-            print(f"Adding batch {i//batch_size + 1}/{(total_files + batch_size - 1)//batch_size}...")
-            
-            response = client.beta.vector_stores.file_batches.create(
-                vector_store_id=vector_store_id,
-                file_ids=batch
-            )
-            
-            print(f"Batch {i//batch_size + 1} added: {response.id}")
+def wait_for_batch(vector_store_id, batch_id):
+    """Poll a file batch until it finishes processing, backing off between checks."""
+    interval = POLL_INITIAL_INTERVAL
+    while True:
+        batch = client.beta.vector_stores.file_batches.retrieve(
+            vector_store_id=vector_store_id,
+            batch_id=batch_id
+        )
+        if batch.status != "in_progress":
+            return batch
+        time.sleep(interval)
+        interval = min(interval * POLL_BACKOFF_FACTOR, POLL_MAX_INTERVAL)
+
+def list_failed_batch_files(vector_store_id, batch_id):
+    """Return the IDs of the files in a batch that failed to process."""
+    return [
+        batch_file.id
+        for batch_file in client.beta.vector_stores.file_batches.list_files(
+            vector_store_id=vector_store_id,
+            batch_id=batch_id,
+            filter="failed",
+            limit=100
+        )
+    ]
+
+def attach_batch(vector_store_id, file_ids, gate):
+    """Submit one file batch and wait for it. Returns the IDs of files that failed."""
+    gate.wait()
+    # Rate limits are surfaced immediately so the scheduler can shrink its batches
+    batch = client.with_options(max_retries=0).beta.vector_stores.file_batches.create(
+        vector_store_id=vector_store_id,
+        file_ids=file_ids
+    )
+    batch = wait_for_batch(vector_store_id, batch.id)
+    if batch.status == "completed" and batch.file_counts.failed == 0:
+        return []
+    if batch.status != "completed":
+        return list(file_ids)
+    return list_failed_batch_files(vector_store_id, batch.id)
+
+def add_files_to_vector_store(vector_store_id, file_ids, batch_size=DEFAULT_BATCH_SIZE,
+                              concurrency=DEFAULT_CONCURRENCY, max_attempts=MAX_FILE_ATTEMPTS):
+    """Add files to the vector store in concurrent batches, waiting for each to finish.
+
+    Files that fail to process are retried in later batches up to
+    `max_attempts` times. The batch size halves on rate-limit responses and
+    grows back as batches succeed. Returns a summary of the outcome.
+    """
+    pending = deque(file_ids)
+    attempts = {file_id: 0 for file_id in file_ids}
+    total_files = len(file_ids)
+    completed = 0
+    failed = []
+    size = min(batch_size, MAX_BATCH_SIZE)
+    gate = RateLimitGate()
+    started = time.perf_counter()
+    
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        running = {}
+        while pending or running:
+            # Keep up to `concurrency` batches in flight
+            while pending and len(running) < concurrency:
+                batch = [pending.popleft() for _ in range(min(size, len(pending)))]
+                for file_id in batch:
+                    attempts[file_id] += 1
+                running[executor.submit(attach_batch, vector_store_id, batch, gate)] = batch
             
-            # Sleep to avoid rate limits
-            if i + batch_size < total_files:
-                time.sleep(2)
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                batch = running.pop(future)
+                try:
+                    batch_failed = future.result()
+                except openai.RateLimitError as e:
+                    # Shrink batches and put the files back without counting the attempt
+                    size = max(MIN_BATCH_SIZE, size // 2)
+                    gate.pause(retry_after_seconds(e) or backoff_delay(0))
+                    for file_id in batch:
+                        attempts[file_id] -= 1
+                    pending.extendleft(reversed(batch))
+                    print(f"Rate limited, reducing batch size to {size}")
+                    continue
+                except Exception as e:
+                    print(f"Error adding batch to vector store: {e}")
+                    batch_failed = batch
+                else:
+                    # Grow back towards the configured size after a successful batch
+                    size = min(batch_size, MAX_BATCH_SIZE, size + max(1, size // 4))
+                
+                completed += len(batch) - len(batch_failed)
+                for file_id in batch_failed:
+                    if attempts[file_id] < max_attempts:
+                        pending.append(file_id)
+                    else:
+                        failed.append(file_id)
+                
+                elapsed = time.perf_counter() - started
+                rate = completed / elapsed if elapsed else 0.0
+                remaining = total_files - completed - len(failed)
+                eta = f"{remaining / rate:.0f}s" if rate else "unknown"
+                print(f"Attached {completed}/{total_files} files "
+                      f"({len(failed)} failed, {len(pending)} queued) - {rate:.1f} files/s, ETA {eta}")
     
-    except Exception as e:
-        print(f"Error adding files to vector store: {e}")
+    # Cached search results no longer reflect the store's files
+    invalidate_shared_cache(vector_store_id, client)
+    
+    return {
+        "completed": completed,
+        "failed": failed,
+        "seconds": time.perf_counter() - started
+    }
 
 def main():
+    parser = argparse.ArgumentParser(description="Create a vector store from uploaded_files.json")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help=f"Files per batch, up to {MAX_BATCH_SIZE} (default: {DEFAULT_BATCH_SIZE})")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help=f"Batches in flight (default: {DEFAULT_CONCURRENCY})")
+    args = parser.parse_args()
+    
     # Load the uploaded files
     uploaded_files = load_uploaded_files()
     
@@ -69,7 +179,9 @@ def main():
     
     if vector_store_id:
         # Add files to the vector store
-        add_files_to_vector_store(vector_store_id, file_ids)
+        result = add_files_to_vector_store(vector_store_id, file_ids, batch_size=args.batch_size, concurrency=args.concurrency)
+        if result["failed"]:
+            print(f"Warning: {len(result['failed'])} files could not be added: {', '.join(result['failed'][:10])}")
         print(f"Vector store creation complete. Vector Store ID: {vector_store_id}")
         
         # Save the vector store ID to a file for future reference
@@ -91,8 +203,8 @@ def main():
         except Exception as e:
             print(f"Warning: Could not retrieve additional details: {e}")
         
-        with open("vector_store_info.json", "w") as f:
-            json.dump(store_info, f, indent=2)
+        # Atomic, so a running app never reads a half-written file
+        write_json_atomic("vector_store_info.json", store_info)
         print(f"Vector store info saved to vector_store_info.json")
     else:
         print("Failed to create vector store.")
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Search several vector stores at once and merge their hits into one ranking.
+
+Every store is searched concurrently and given the same deadline; stores that
+fail or miss it are left out of the merged results and reported in the
+response's `stores` list instead of holding the whole search up. Their
+searches are not abandoned halfway: they finish in the background, so with the
+app's search cache a slow store's results are usually ready for the next
+identical search. Stores are searched on one thread pool of MAX_WORKERS shared
+by all requests, in the calling request's context, so stage timings recorded
+while searching reach its trace.
+
+Scores from different stores are not on a common scale (a store of short,
+similar chunks scores higher across the board), so each store's scores are
+normalized before merging:
+
+    minmax   scaled to 0-1 within each store (default)
+    zscore   standard deviations from each store's mean
+    none     raw scores, for stores whose scores are known to be comparable
+
+Each store's hits are already in score order, so the top k of the merged
+ranking is taken with a k-way heap merge of the per-store lists. A chunk found
+in more than one store (a file attached to several) is returned once, with its
+best score. Merged hits carry the normalized `score`, the store's own
+`store_score` and the `vector_store_id` they came from.
+"""
+import asyncio
+import heapq
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from request_metrics import submit_in_context
+from search_snippets import item_text
+
+DEFAULT_STORE_TIMEOUT = 5.0
+MAX_STORE_TIMEOUT = 60.0
+MAX_STORES = 20
+NORMALIZERS = ("minmax", "zscore", "none")
+DEFAULT_NORMALIZE = "minmax"
+
+# Store searches in flight at once across all requests; more wait for a free thread
+MAX_WORKERS = 32
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="fanout-search")
+
+# Searches still running after their deadline; referenced so they are not garbage collected
+_stragglers = set()
+
+
+def check_store_ids(store_ids):
+    """Raise ValueError unless `store_ids` is a non-empty list of at most MAX_STORES IDs."""
+    if not isinstance(store_ids, list) or not store_ids or not all(isinstance(store_id, str) and store_id for store_id in store_ids):
+        raise ValueError("vector_store_ids must be a non-empty list of vector store IDs")
+    if len(store_ids) > MAX_STORES:
+        raise ValueError(f"At most {MAX_STORES} vector stores per search")
+
+
+def check_normalize(normalize):
+    if normalize not in NORMALIZERS:
+        raise ValueError(f"Unknown score normalization '{normalize}'. Choose from: {', '.join(NORMALIZERS)}")
+
+
+def check_timeout(timeout):
+    if isinstance(timeout, bool) or not isinstance(timeout, (int, float)) or not 0 < timeout <= MAX_STORE_TIMEOUT:
+        raise ValueError(f"store_timeout must be a number of seconds between 0 and {MAX_STORE_TIMEOUT:g}")
+
+
+def unique_store_ids(store_ids):
+    """The IDs in order with repeats removed."""
+    return list(dict.fromkeys(store_ids))
+
+
+def normalize_scores(scores, method=DEFAULT_NORMALIZE):
+    """One store's scores rescaled by `method`; a store whose hits all score the same maps them to 1.0 (minmax) or 0.0 (zscore)."""
+    if method == "none" or not scores:
+        return list(scores)
+    if method == "zscore":
+        mean = sum(scores) / len(scores)
+        deviation = math.sqrt(sum((score - mean) ** 2 for score in scores) / len(scores))
+        return [(score - mean) / deviation if deviation else 0.0 for score in scores]
+    low, high = min(scores), max(scores)
+    return [(score - low) / (high - low) if high > low else 1.0 for score in scores]
+
+
+def store_hits(store_id, results, method=DEFAULT_NORMALIZE):
+    """One store's hits with normalized scores, best first."""
+    items = [item for item in (results or {}).get("data", []) if isinstance(item, dict)]
+    raw = [float(item.get("score") or 0.0) for item in items]
+    hits = [
+        dict(item, score=round(score, 4), store_score=original, vector_store_id=store_id)
+        for item, original, score in zip(items, raw, normalize_scores(raw, method))
+    ]
+    hits.sort(key=lambda hit: hit["score"], reverse=True)
+    return hits
+
+
+def merge_hits(ranked_lists, top_k):
+    """The best `top_k` hits of several best-first lists, each chunk once."""
+    merged = []
+    seen = set()
+    for hit in heapq.merge(*ranked_lists, key=lambda hit: hit["score"], reverse=True):
+        key = (hit.get("file_id"), item_text(hit))
+        if key in seen:
+            continue
+        seen.add(key)
+        merged.append(hit)
+        if len(merged) == top_k:
+            break
+    return merged
+
+
+def store_summary(outcome):
+    """An outcome without its results, for the response's `stores` list."""
+    return {key: value for key, value in outcome.items() if key != "results"}
+
+
+def merge_results(query, outcomes, top_k, normalize=DEFAULT_NORMALIZE):
+    """One search response from the outcomes of `search_stores`.
+
+    Raises RuntimeError if no store answered.
+    """
+    answered = [outcome for outcome in outcomes if outcome["status"] == "ok"]
+    if not answered:
+        reasons = ", ".join(f"{outcome['vector_store_id']}: {outcome.get('error', outcome['status'])}" for outcome in outcomes)
+        raise RuntimeError(f"No vector store answered ({reasons})")
+
+    ranked = [store_hits(outcome["vector_store_id"], outcome["results"], normalize) for outcome in answered]
+    return {
+        "object": "vector_store.search_results.page",
+        "search_query": query,
+        "data": merge_hits(ranked, top_k),
+        "has_more": False,
+        "next_page": None,
+        "normalize": normalize,
+        "stores": [store_summary(outcome) for outcome in outcomes]
+    }
+
+
+def outcome(store_id, status, ms, results=None, error=None):
+    record = {"vector_store_id": store_id, "status": status, "ms": round(ms, 1)}
+    if status == "ok":
+        record["results"] = results
+        record["hits"] = len(results.get("data", []))
+    elif error:
+        record["error"] = error
+    return record
+
+
+def search_outcome(store_id, results, error, started):
+    ms = (time.perf_counter() - started) * 1000
+    if error is None and not isinstance(results, dict):
+        error = "Search failed"
+    return outcome(store_id, "error" if error else "ok", ms, results, error)
+
+
+def timed(search, store_id):
+    started = time.perf_counter()
+    try:
+        return search_outcome(store_id, search(store_id), None, started)
+    except Exception as e:
+        return search_outcome(store_id, None, str(e), started)
+
+
+def search_stores(search, store_ids, timeout=DEFAULT_STORE_TIMEOUT):
+    """Call `search(store_id)` for every store concurrently and wait at most `timeout` seconds.
+
+    `search` returns one store's results (None or an exception counts as a
+    failure). Returns one outcome per store, in the order given, with its
+    status ("ok", "error" or "timeout"), latency and results.
+    """
+    futures = [submit_in_context(_executor, timed, search, store_id) for store_id in store_ids]
+    wait(futures, timeout=timeout)
+    return [
+        future.result() if future.done() else outcome(store_id, "timeout", timeout * 1000)
+        for store_id, future in zip(store_ids, futures)
+    ]
+
+
+async def timed_async(search, store_id):
+    started = time.perf_counter()
+    try:
+        return search_outcome(store_id, await search(store_id), None, started)
+    except Exception as e:
+        return search_outcome(store_id, None, str(e), started)
+
+
+async def search_stores_async(search, store_ids, timeout=DEFAULT_STORE_TIMEOUT):
+    """`search_stores` for a coroutine function `search`."""
+    tasks = [asyncio.ensure_future(timed_async(search, store_id)) for store_id in store_ids]
+    await asyncio.wait(tasks, timeout=timeout)
+
+    outcomes = []
+    for store_id, task in zip(store_ids, tasks):
+        if task.done():
+            outcomes.append(task.result())
+            continue
+        # Let it finish in the background rather than cancel a search other requests may share
+        _stragglers.add(task)
+        task.add_done_callback(_stragglers.discard)
+        outcomes.append(outcome(store_id, "timeout", timeout * 1000))
+    return outcomes
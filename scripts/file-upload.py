@@ -3,7 +3,10 @@ from dotenv import load_dotenv
 import os
 import glob
 import json
-from datetime import datetime
+import argparse
+from bulk_upload import bulk_upload, MANIFEST_PATH, DEFAULT_CONCURRENCY
+from store_registry import write_json_atomic
+from chunk_pipeline import ChunkPipeline, DEFAULT_WINDOW, DEFAULT_OVERLAP, DEFAULT_DEDUP, DEDUP_METHODS, DEFAULT_PACK_BYTES
 
 load_dotenv()  # Load environment variables from .env file
 
@@ -11,44 +14,66 @@ client = OpenAI(
     api_key=os.getenv("OPENAI_API_KEY"),
 )
 
-# Get all JSON files from the english_chunks directory
-chunk_files = glob.glob("english_chunks/*.json")
-uploaded_files = []
-failed_files = []
+parser = argparse.ArgumentParser(description="Upload chunk files and create a vector store from them")
+parser.add_argument("--chunks-dir", default="english_chunks", help="Directory of JSON chunk files (default: english_chunks)")
+parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help=f"Parallel uploads (default: {DEFAULT_CONCURRENCY})")
+parser.add_argument("--manifest", default=MANIFEST_PATH, help=f"Checkpoint manifest path (default: {MANIFEST_PATH})")
+parser.add_argument("--skip-vector-store", action="store_true", help="Only upload files, do not create a vector store")
+parser.add_argument("--source", action="append", help="Chunk these source files or directories into --chunks-dir first (repeatable)")
+parser.add_argument("--window", type=int, default=DEFAULT_WINDOW, help=f"Tokens per chunk window with --source (default: {DEFAULT_WINDOW})")
+parser.add_argument("--overlap", type=int, default=DEFAULT_OVERLAP, help=f"Tokens shared by consecutive windows (default: {DEFAULT_OVERLAP})")
+parser.add_argument("--dedup", choices=DEDUP_METHODS, default=DEFAULT_DEDUP, help=f"Duplicate window detection (default: {DEFAULT_DEDUP})")
+parser.add_argument("--pack-bytes", type=int, default=DEFAULT_PACK_BYTES, help=f"Target size of each packed chunk file (default: {DEFAULT_PACK_BYTES})")
+args = parser.parse_args()
 
-# Step 1: Upload files
-for chunk_file in chunk_files:
+pipeline = None
+if args.source:
+    # Chunk the sources and upload each packed file as soon as it is written
+    pipeline = ChunkPipeline(args.chunks_dir, window=args.window, overlap=args.overlap, dedup=args.dedup,
+                             pack_bytes=args.pack_bytes)
+    chunk_files = []
+
+    def produced_files():
+        for path in pipeline.run(args.source):
+            chunk_files.append(path)
+            yield path
+
+    paths = produced_files()
+else:
+    # Get all JSON files from the chunks directory
+    chunk_files = sorted(glob.glob(os.path.join(args.chunks_dir, "*.json")))
+    paths = chunk_files
+
+# Step 1: Upload files, skipping ones already uploaded with the same content
+result = bulk_upload(client, paths, manifest_path=args.manifest, concurrency=args.concurrency)
+if pipeline:
+    summary = pipeline.summary()
+    print(f"Chunked {summary['documents']} documents ({summary['input_bytes'] / (1024 * 1024):.1f} MB) into "
+          f"{summary['windows']} windows, dropped {summary['duplicates']} duplicates, packed {summary['files']} files "
+          f"({summary['mb_per_second']} MB/s, peak RSS {summary['peak_rss_mb']} MB)")
+manifest = result["manifest"]
+failed_files = result["failed"]
+uploaded_files = [
+    {"filename": chunk_file, "file_id": manifest[chunk_file]["file_id"]}
+    for chunk_file in chunk_files
+    if chunk_file in manifest
+]
+
+# Step 2: Create a vector store from the uploaded files
+if not args.skip_vector_store:
     try:
-        file = client.files.create(
-            file=open(chunk_file, "rb"),
-            purpose="assistants"
+        file_ids = [file["file_id"] for file in uploaded_files]
+        vector_store = client.beta.vector_stores.create(
+            name="english_chunks_store",
+            file_ids=file_ids
         )
-        uploaded_files.append({"filename": chunk_file, "file_id": file.id})
-        print(f"Successfully uploaded {chunk_file} with file ID: {file.id}")
-    except Exception as e:
-        error_details = {
-            "filename": chunk_file,
-            "error": str(e),
-            "timestamp": datetime.now().isoformat()
-        }
-        failed_files.append(error_details)
-        print(f"Error uploading {chunk_file}: {str(e)}")
+        print(f"Successfully created vector store with ID: {vector_store.id}")
 
-# Step 2: Create a vector store from the uploaded files
-try:
-    file_ids = [file["file_id"] for file in uploaded_files]
-    vector_store = client.beta.vector_stores.create(
-        name="english_chunks_store",
-        file_ids=file_ids
-    )
-    print(f"Successfully created vector store with ID: {vector_store.id}")
-    
-    # Save vector store ID for future use
-    with open("vector_store_info.json", "w") as f:
-        json.dump({"vector_store_id": vector_store.id}, f, indent=2)
-        
-except Exception as e:
-    print(f"Error creating vector store: {str(e)}")
+        # Save vector store ID for future use
+        write_json_atomic("vector_store_info.json", {"vector_store_id": vector_store.id})
+
+    except Exception as e:
+        print(f"Error creating vector store: {str(e)}")
 
 # Save the successful uploads
 with open("uploaded_files.json", "w") as f:
@@ -59,8 +84,10 @@ if failed_files:
     with open("failed_uploads.json", "w") as f:
         json.dump(failed_files, f, indent=2)
 
-print(f"\nTotal files uploaded successfully: {len(uploaded_files)}")
+print(f"\nTotal files uploaded this run: {result['uploaded']}")
+print(f"Total files skipped (already uploaded): {result['skipped']}")
 print(f"Total files failed: {len(failed_files)}")
+print(f"Throughput: {result['files_per_second']:.1f} files/s, {result['bytes_per_second'] / 1024:.1f} KB/s over {result['seconds']:.1f}s")
 print("Successful uploads saved to uploaded_files.json")
 if failed_files:
     print("Failed uploads saved to failed_uploads.json")
@@ -1,7 +1,10 @@
 #!/usr/bin/env python3
 import os
+import time
+import argparse
 from dotenv import load_dotenv
 import openai
+from vector_store_listing import iter_vector_stores, iter_store_details, format_store, DEFAULT_CONCURRENCY
 
 # Load environment variables from .env file
 load_dotenv()
@@ -10,10 +13,9 @@ load_dotenv()
 client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
 def list_vector_stores():
-    """List all vector stores."""
+    """List all vector stores, walking every page."""
     try:
-        response = client.beta.vector_stores.list()
-        return response.data
+        return list(iter_vector_stores(client))
     except Exception as e:
         print(f"Error listing vector stores: {e}")
         return []
@@ -27,37 +29,58 @@ def get_vector_store_details(vector_store_id):
         print(f"Error retrieving vector store details: {e}")
         return None
 
-def display_vector_stores(vector_stores):
-    """Display vector stores in a readable format."""
-    if not vector_stores:
-        print("No vector stores found.")
-        return
-    
-    print(f"\nFound {len(vector_stores)} vector stores:\n")
-    
-    for i, store in enumerate(vector_stores, 1):
-        print(f"Vector Store {i}:")
-        print(f"  ID: {store.id}")
-        print(f"  Name: {store.name}")
-        print(f"  Created at: {store.created_at}")
-        
-        if hasattr(store, 'bytes'):
-            print(f"  Size: {store.bytes} bytes")
-        
-        if hasattr(store, 'file_counts'):
-            print(f"  Files:")
-            print(f"    Total: {store.file_counts.total}")
-            print(f"    Completed: {store.file_counts.completed}")
-            print(f"    In progress: {store.file_counts.in_progress}")
-            print(f"    Failed: {store.file_counts.failed}")
-            print(f"    Cancelled: {store.file_counts.cancelled}")
-        
+def display_store(i, store_data):
+    """Print one formatted store dict as it arrives."""
+    print(f"Vector Store {i}:")
+    print(f"  ID: {store_data['id']}")
+    if "error" in store_data:
+        print(f"  Error: {store_data['error']}")
         print("-" * 80)
+        return
+    print(f"  Name: {store_data['name']}")
+    print(f"  Created at: {store_data['created_at']}")
+    if "bytes" in store_data:
+        print(f"  Size: {store_data['bytes']} bytes")
+    if "file_counts" in store_data:
+        counts = store_data["file_counts"]
+        print("  Files:")
+        print(f"    Total: {counts['total']}")
+        print(f"    Completed: {counts['completed']}")
+        print(f"    In progress: {counts['in_progress']}")
+        print(f"    Failed: {counts['failed']}")
+        print(f"    Cancelled: {counts['cancelled']}")
+    if "file_ids" in store_data:
+        print(f"  File IDs: {', '.join(store_data['file_ids']) or '(none)'}")
+    print("-" * 80)
 
 def main():
+    parser = argparse.ArgumentParser(description="List every vector store in the account")
+    parser.add_argument("--details", action="store_true", help="Retrieve each store's details concurrently")
+    parser.add_argument("--files", type=int, default=0, help="Also list up to N file IDs per store (implies --details)")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help=f"Stores fetched in parallel with --details (default: {DEFAULT_CONCURRENCY})")
+
+    args = parser.parse_args()
+
     print("Listing all vector stores...")
-    vector_stores = list_vector_stores()
-    display_vector_stores(vector_stores)
+    started = time.perf_counter()
+
+    # Print stores as pages (and detail fetches) complete instead of waiting for the whole listing
+    try:
+        if args.details or args.files:
+            stores = iter_store_details(client, iter_vector_stores(client), concurrency=args.concurrency, files_limit=args.files)
+        else:
+            stores = (format_store(store) for store in iter_vector_stores(client))
+        count = 0
+        for count, store_data in enumerate(stores, 1):
+            display_store(count, store_data)
+    except Exception as e:
+        print(f"Error listing vector stores: {e}")
+        return
+
+    if count == 0:
+        print("No vector stores found.")
+    else:
+        print(f"\nFound {count} vector stores in {time.perf_counter() - started:.1f}s")
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Load test the /api/* routes of one or more running app instances.
+
+Start the mock API and both serving modes, then compare them:
+    python scripts/mock_openai_server.py --first-token-delay 2
+    OPENAI_BASE_URL=http://localhost:8001/v1 python app.py
+    OPENAI_BASE_URL=http://localhost:8001/v1 hypercorn async_app:app --bind localhost:5001
+    python scripts/load_test.py --target sync=http://localhost:5000 --target async=http://localhost:5001
+"""
+import argparse
+import asyncio
+import time
+from http.cookiejar import CookieJar, DefaultCookiePolicy
+
+import httpx
+
+from request_metrics import percentile
+
+
+async def chat_request(client, base_url):
+    """Start a thread and send one message on it, as a new visitor would."""
+    response = await client.post(f"{base_url}/api/start-thread")
+    response.raise_for_status()
+    chat = response.json()
+    response = await client.post(f"{base_url}/api/send-message", json={
+        "thread_id": chat["thread_id"],
+        "assistant_id": chat["assistant_id"],
+        "message": "What are the features of Verkada Guest?"
+    })
+    response.raise_for_status()
+
+
+async def search_request(client, base_url):
+    response = await client.post(f"{base_url}/api/search-vector-store", json={
+        "query": "camera firmware update",
+        "max_results": 10
+    })
+    response.raise_for_status()
+
+
+async def list_request(client, base_url):
+    response = await client.get(f"{base_url}/api/vector-stores")
+    response.raise_for_status()
+
+
+SCENARIOS = {
+    "chat": chat_request,
+    "search": search_request,
+    "list": list_request,
+}
+
+
+async def run_load(base_url, scenario, total, concurrency, timeout):
+    """Issue `total` requests with at most `concurrency` in flight; return (latencies, errors, elapsed)."""
+    request_fn = SCENARIOS[scenario]
+    latencies = []
+    errors = 0
+    remaining = iter(range(total))
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    # Every request is a new visitor, so session cookies are never stored on the shared client
+    cookies = CookieJar(policy=DefaultCookiePolicy(allowed_domains=[]))
+
+    async with httpx.AsyncClient(limits=limits, timeout=timeout, cookies=cookies) as client:
+        async def worker():
+            nonlocal errors
+            for _ in remaining:
+                started = time.perf_counter()
+                try:
+                    await request_fn(client, base_url)
+                    latencies.append(time.perf_counter() - started)
+                except Exception:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return latencies, errors, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the Document Assistant API")
+    parser.add_argument("--target", action="append", required=True,
+                        help="NAME=URL of an app instance to test (repeatable)")
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="chat",
+                        help="Request mix to send (default: chat)")
+    parser.add_argument("--requests", type=int, default=200, help="Total requests per target (default: 200)")
+    parser.add_argument("--concurrency", type=int, default=50, help="Requests in flight (default: 50)")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-request timeout in seconds")
+
+    args = parser.parse_args()
+
+    print(f"Scenario: {args.scenario}, {args.requests} requests, concurrency {args.concurrency}\n")
+    print(f"{'target':<10} {'ok':>6} {'errors':>6} {'req/s':>8} {'p50 ms':>9} {'p99 ms':>9}")
+
+    for target in args.target:
+        name, _, base_url = target.partition("=")
+        latencies, errors, elapsed = asyncio.run(
+            run_load(base_url.rstrip("/"), args.scenario, args.requests, args.concurrency, args.timeout)
+        )
+        if latencies:
+            p50 = percentile(latencies, 0.5) * 1000
+            p99 = percentile(latencies, 0.99) * 1000
+        else:
+            p50 = p99 = float("nan")
+        print(f"{name:<10} {len(latencies):>6} {errors:>6} {len(latencies) / elapsed:>8.1f} {p50:>9.1f} {p99:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
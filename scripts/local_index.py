@@ -0,0 +1,391 @@
+#!/usr/bin/env python3
+"""
+Local mirror of the vector store for searches without a network round trip.
+
+The same chunk files the uploader sends are embedded with a pluggable
+embedder (see semantic_cache.py) and written to a build directory inside the
+index directory:
+
+    vectors.f32    float32 matrix of unit-length embeddings, memory-mapped on load
+    metadata.json  embedder, dimensions and per-row file ID, filename, hash and text
+    ivf.npz        optional inverted-file index (k-means centroids and posting lists)
+    bm25_*         optional BM25 keyword postings (see bm25_index.py)
+
+Each build gets a new directory, and `current.json` names the one to load.
+The pointer is replaced atomically once a build is complete, so a reader
+loads every file from the same build. The build before the current one is
+kept for readers that resolved the pointer just before it changed; older
+ones are removed.
+
+A chunk file is one row, except packs from chunk_pipeline.py: a pack (about
+64 KB) is far over the embedder's input limit, so each of its windows is a row
+of its own, with the pack's file ID.
+
+Searches are a vectorized dot product over the matrix followed by a partial
+sort, or, with an IVF index, over only the rows in the closest lists. With
+BM25 postings, keyword and hybrid (fused keyword + vector) searches are also
+available. Results
+use the same shape as the vector store search endpoint, with each file's
+attributes from the attribute mirror (attribute_store.py), so callers can
+switch between the remote store and the mirror.
+
+    python local_index.py build --chunks-dir english_chunks --embedder openai [--ivf-lists 256] [--bm25]
+    python local_index.py search "camera firmware update" [--mode hybrid]
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+from dotenv import load_dotenv
+
+from attribute_store import AttributeStore, ATTRIBUTE_STORE_PATH
+from bm25_index import DEFAULT_ALPHA, DEFAULT_FUSION, TERMS_FILE, BM25Index, build_bm25, hybrid_search, keyword_search
+from bulk_upload import MANIFEST_PATH, file_sha256, load_manifest
+from semantic_cache import get_embedder, normalize_rows
+from store_registry import write_json_atomic
+
+INDEX_DIR = "local_index"
+CURRENT_FILE = "current.json"
+BUILD_PREFIX = "build-"
+VECTORS_FILE = "vectors.f32"
+METADATA_FILE = "metadata.json"
+IVF_FILE = "ivf.npz"
+
+EMBED_BATCH_SIZE = 64
+DEFAULT_NPROBE = 8
+KMEANS_ITERATIONS = 10
+SEARCH_MODES = ("vector", "keyword", "hybrid")
+
+# Fields tried, in order, when pulling the text out of a JSON chunk
+TEXT_FIELDS = ("text", "content", "page_content", "chunk")
+
+
+def chunk_texts(path):
+    """Return the searchable texts of a chunk file, one per index row.
+
+    JSON chunks with a text field use that field, split into the windows
+    listed in `windows` if there are any (packs); anything else is indexed
+    as the raw file contents, which is also what gets uploaded.
+    """
+    with open(path, "r") as f:
+        raw = f.read()
+    try:
+        chunk = json.loads(raw)
+    except json.JSONDecodeError:
+        return [raw]
+    if isinstance(chunk, dict):
+        for field in TEXT_FIELDS:
+            if isinstance(chunk.get(field), str):
+                text = chunk[field]
+                windows = chunk.get("windows")
+                if windows:
+                    return [text[start:end] for start, end in windows]
+                return [text]
+    return [raw]
+
+
+def current_build(index_dir):
+    """The directory holding the index's current build (the index directory itself for indexes built before builds were versioned)."""
+    try:
+        with open(os.path.join(index_dir, CURRENT_FILE), "r") as f:
+            return os.path.join(index_dir, json.load(f)["build"])
+    except FileNotFoundError:
+        return index_dir
+
+
+def remove_old_builds(index_dir, keep):
+    """Delete build directories other than the ones named in `keep`."""
+    for name in os.listdir(index_dir):
+        path = os.path.join(index_dir, name)
+        if name.startswith(BUILD_PREFIX) and name not in keep and os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def kmeans(vectors, lists, iterations=KMEANS_ITERATIONS, seed=0):
+    """Spherical k-means over unit vectors; returns (centroids, assignments)."""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=lists, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = np.argmax(vectors @ centroids.T, axis=1)
+        for i in range(lists):
+            members = vectors[assignments == i]
+            if len(members):
+                centroids[i] = members.sum(axis=0)
+        centroids = normalize_rows(centroids)
+    return centroids, np.argmax(vectors @ centroids.T, axis=1)
+
+
+def build_index(chunk_files, embedder, index_dir=INDEX_DIR, manifest_path=MANIFEST_PATH, ivf_lists=0, bm25=False):
+    """Embed chunk files into an index directory and return a summary.
+
+    Rows whose text hash is already in the existing index reuse its
+    embedding, so rebuilding after a sync only embeds new or changed text.
+    File IDs come from the upload manifest so results match the remote store.
+    With `bm25`, keyword postings are built for the same rows.
+    """
+    started = time.perf_counter()
+    os.makedirs(index_dir, exist_ok=True)
+    manifest = load_manifest(manifest_path)
+
+    # Embeddings from the previous build, keyed by content hash
+    previous = {}
+    try:
+        old = LocalIndex(index_dir)
+        if old.embedder_name == embedder.name:
+            previous = {chunk["sha256"]: old.vectors[row] for row, chunk in enumerate(old.chunks)}
+    except FileNotFoundError:
+        pass
+
+    chunks = []
+    for path in chunk_files:
+        entry = manifest.get(path) or {}
+        file_id = entry.get("file_id") or f"local-{file_sha256(path)[:24]}"
+        for window, text in enumerate(chunk_texts(path)):
+            chunks.append({
+                "file_id": file_id,
+                "filename": os.path.basename(path),
+                "path": path,
+                "window": window,
+                "sha256": hashlib.sha256(text.encode("utf-8")).hexdigest(),
+                "text": text
+            })
+
+    to_embed = [row for row, chunk in enumerate(chunks) if chunk["sha256"] not in previous]
+    embedded = {}
+    for start in range(0, len(to_embed), EMBED_BATCH_SIZE):
+        rows = to_embed[start:start + EMBED_BATCH_SIZE]
+        for row, vector in zip(rows, embedder.embed([chunks[row]["text"] for row in rows])):
+            embedded[row] = vector
+        done = min(start + EMBED_BATCH_SIZE, len(to_embed))
+        if done % (EMBED_BATCH_SIZE * 20) == 0 or done == len(to_embed):
+            print(f"Embedded {done}/{len(to_embed)} chunks")
+
+    dimensions = len(next(iter(embedded.values()))) if embedded else (
+        len(next(iter(previous.values()))) if previous else 0)
+    vectors = np.zeros((len(chunks), dimensions), dtype=np.float32)
+    for row, chunk in enumerate(chunks):
+        vectors[row] = embedded[row] if row in embedded else previous[chunk["sha256"]]
+    del previous
+
+    # Write a new build directory and only then point the index at it
+    replaced = current_build(index_dir)
+    build_name = f"{BUILD_PREFIX}{time.time_ns()}"
+    build_dir = os.path.join(index_dir, build_name)
+    os.makedirs(build_dir)
+    vectors.tofile(os.path.join(build_dir, VECTORS_FILE))
+
+    ivf = ivf_lists and len(chunks) > ivf_lists
+    if ivf:
+        centroids, assignments = kmeans(vectors, ivf_lists)
+        order = np.argsort(assignments, kind="stable")
+        offsets = np.searchsorted(assignments[order], np.arange(ivf_lists + 1))
+        with open(os.path.join(build_dir, IVF_FILE), "wb") as f:
+            np.savez(f, centroids=centroids, order=order, offsets=offsets)
+
+    bm25_summary = build_bm25([chunk["text"] for chunk in chunks], build_dir) if bm25 else None
+
+    with open(os.path.join(build_dir, METADATA_FILE), "w") as f:
+        json.dump({
+            "embedder": embedder.name,
+            "dimensions": dimensions,
+            "count": len(chunks),
+            "built_at": time.time(),
+            "chunks": chunks
+        }, f)
+
+    write_json_atomic(os.path.join(index_dir, CURRENT_FILE), {"build": build_name})
+    remove_old_builds(index_dir, {build_name, os.path.basename(replaced)})
+
+    return {
+        "chunks": len(chunks),
+        "embedded": len(to_embed),
+        "reused": len(chunks) - len(to_embed),
+        "ivf_lists": ivf_lists if ivf else 0,
+        "bm25_terms": bm25_summary["terms"] if bm25_summary else 0,
+        "seconds": round(time.perf_counter() - started, 2)
+    }
+
+
+class LocalIndex:
+    """The current build of an index directory, with the vectors memory-mapped read-only.
+
+    `attribute_store` supplies the attributes returned with each hit.
+    """
+
+    def __init__(self, index_dir=INDEX_DIR, embedder=None, attribute_store=None):
+        index_dir = current_build(index_dir)
+        with open(os.path.join(index_dir, METADATA_FILE), "r") as f:
+            metadata = json.load(f)
+        self.index_dir = index_dir
+        self.embedder_name = metadata["embedder"]
+        self.embedder = embedder
+        self.attribute_store = attribute_store
+        self.chunks = metadata["chunks"]
+        shape = (metadata["count"], metadata["dimensions"])
+        if metadata["count"]:
+            self.vectors = np.memmap(os.path.join(index_dir, VECTORS_FILE), dtype=np.float32, mode="r", shape=shape)
+        else:
+            self.vectors = np.zeros(shape, dtype=np.float32)
+
+        self.centroids = None
+        try:
+            with np.load(os.path.join(index_dir, IVF_FILE)) as ivf:
+                self.centroids = ivf["centroids"]
+                self.order = ivf["order"]
+                self.offsets = ivf["offsets"]
+        except FileNotFoundError:
+            pass
+
+        self.bm25 = None
+        if os.path.exists(os.path.join(index_dir, TERMS_FILE)):
+            self.bm25 = BM25Index(index_dir)
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def allowed_rows(self, file_ids):
+        """Boolean mask of the rows whose file ID is in `file_ids`."""
+        return np.fromiter((chunk["file_id"] in file_ids for chunk in self.chunks), dtype=bool, count=len(self.chunks))
+
+    def top_k(self, query_vector, k, nprobe=None, allowed=None):
+        """Return (rows, scores) of the k most similar chunks, best first.
+
+        With an IVF index, only the `nprobe` closest lists are scored; pass
+        nprobe=0 to force an exact brute-force search. `allowed` is a boolean
+        row mask from a pre-filter; only those rows are scored, exactly.
+        """
+        if nprobe is None:
+            nprobe = DEFAULT_NPROBE
+        if allowed is not None:
+            rows = np.flatnonzero(allowed)
+            scores = self.vectors[rows] @ query_vector
+        elif self.centroids is not None and nprobe:
+            closest = np.argsort(self.centroids @ query_vector)[::-1][:nprobe]
+            # Sorted row order keeps reads from the memory map sequential
+            rows = np.sort(np.concatenate([self.order[self.offsets[i]:self.offsets[i + 1]] for i in closest]))
+            scores = self.vectors[rows] @ query_vector
+        else:
+            rows = None
+            scores = self.vectors @ query_vector
+
+        k = min(k, len(scores))
+        if k == 0:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.float32)
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        return (rows[best] if rows is not None else best), scores[best]
+
+    def search(self, query, max_results=10, score_threshold=None, nprobe=None, mode="vector",
+               fusion=DEFAULT_FUSION, alpha=DEFAULT_ALPHA, file_ids=None):
+        """Search the mirror and return a response shaped like the vector store search endpoint.
+
+        `mode` is vector, keyword (BM25 only) or hybrid (both, fused with
+        `fusion`); the last two need an index built with BM25 postings.
+        `file_ids` restricts results to those files, e.g. the matches of an
+        attribute filter.
+        """
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode '{mode}'. Choose from: {', '.join(SEARCH_MODES)}")
+        if mode != "vector" and self.bm25 is None:
+            raise ValueError(f"{mode} search needs BM25 postings; rebuild the index with --bm25")
+        allowed = self.allowed_rows(file_ids) if file_ids is not None else None
+        if mode == "keyword":
+            results = keyword_search(self, self.bm25, query, max_results=max_results, allowed=allowed)
+        elif mode == "hybrid":
+            results = hybrid_search(self, self.bm25, query, max_results=max_results, fusion=fusion, alpha=alpha,
+                                    nprobe=nprobe, allowed=allowed)
+        else:
+            query_vector = self.embedder.embed([query])[0]
+            rows, scores = self.top_k(query_vector, max_results, nprobe, allowed)
+            results = self.result_page(query, rows, scores)
+        if score_threshold is not None:
+            results["data"] = [item for item in results["data"] if item["score"] >= score_threshold]
+        return results
+
+    def result_page(self, query, rows, scores):
+        """Format ranked rows as a vector store search response."""
+        data = []
+        for row, score in zip(rows, scores):
+            chunk = self.chunks[row]
+            data.append({
+                "file_id": chunk["file_id"],
+                "filename": chunk["filename"],
+                "score": round(float(score), 4),
+                "attributes": dict(self.attribute_store.get(chunk["file_id"]) or {}) if self.attribute_store else {},
+                "content": [{"type": "text", "text": chunk["text"]}]
+            })
+        return {
+            "object": "vector_store.search_results.page",
+            "search_query": query,
+            "data": data,
+            "has_more": False,
+            "next_page": None
+        }
+
+
+def load_local_index(index_dir=INDEX_DIR, client=None, attribute_store=None):
+    """Open an index directory with the embedder it was built with.
+
+    `client` is only used by the openai embedder; one is created if not given.
+    """
+    index = LocalIndex(index_dir, attribute_store=attribute_store)
+    if index.embedder_name == "openai" and client is None:
+        client = openai_client()
+    index.embedder = get_embedder(index.embedder_name, client)
+    return index
+
+
+def openai_client():
+    import openai
+    return openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+
+def main():
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Build or search a local mirror of the vector store")
+    parser.add_argument("--index-dir", default=INDEX_DIR, help=f"Index directory (default: {INDEX_DIR})")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build = subparsers.add_parser("build", help="Embed the chunk files into the index")
+    build.add_argument("--chunks-dir", default="english_chunks", help="Directory of JSON chunk files (default: english_chunks)")
+    build.add_argument("--embedder", default="openai", help="Embedding backend: openai or hashing (default: openai)")
+    build.add_argument("--manifest", default=MANIFEST_PATH, help=f"Upload manifest used for file IDs (default: {MANIFEST_PATH})")
+    build.add_argument("--ivf-lists", type=int, default=0, help="Build an IVF index with this many lists (default: 0, brute force)")
+    build.add_argument("--bm25", action="store_true", help="Also build BM25 keyword postings for keyword and hybrid search")
+
+    search = subparsers.add_parser("search", help="Search the index")
+    search.add_argument("query", help="The search query")
+    search.add_argument("--max-results", type=int, default=10, help="Maximum number of results")
+    search.add_argument("--nprobe", type=int, help=f"IVF lists to scan, 0 for exact search (default: {DEFAULT_NPROBE})")
+    search.add_argument("--mode", choices=SEARCH_MODES, default="vector", help="Ranking to use (default: vector)")
+    search.add_argument("--fusion", choices=["rrf", "weighted"], default=DEFAULT_FUSION, help=f"How hybrid mode combines rankings (default: {DEFAULT_FUSION})")
+    search.add_argument("--attributes", default=ATTRIBUTE_STORE_PATH, help=f"Attribute mirror returned with hits (default: {ATTRIBUTE_STORE_PATH})")
+    search.add_argument("--alpha", type=float, default=DEFAULT_ALPHA, help=f"Vector weight for weighted fusion (default: {DEFAULT_ALPHA})")
+
+    args = parser.parse_args()
+
+    if args.command == "build":
+        chunk_files = sorted(glob.glob(os.path.join(args.chunks_dir, "*.json")))
+        client = openai_client() if args.embedder == "openai" else None
+        summary = build_index(chunk_files, get_embedder(args.embedder, client), index_dir=args.index_dir,
+                              manifest_path=args.manifest, ivf_lists=args.ivf_lists, bm25=args.bm25)
+        print(f"Indexed {summary['chunks']} chunks ({summary['embedded']} embedded, {summary['reused']} reused) "
+              f"in {summary['seconds']}s")
+    else:
+        from search_vector_store import display_search_results
+        index = load_local_index(args.index_dir, attribute_store=AttributeStore(args.attributes))
+        started = time.perf_counter()
+        results = index.search(args.query, max_results=args.max_results, nprobe=args.nprobe,
+                               mode=args.mode, fusion=args.fusion, alpha=args.alpha)
+        print(f"Searched {len(index)} chunks in {(time.perf_counter() - started) * 1000:.1f} ms")
+        display_search_results(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+In-process TTL cache for small, slow-changing API metadata such as the
+assistant ID for a vector store and the vector store listing.
+
+`get_or_load` is single-flight: when an entry is missing, one caller runs
+the loader while concurrent callers for the same key wait for its result
+instead of issuing duplicate API calls (or creating duplicate assistants).
+"""
+import asyncio
+import threading
+import time
+from collections import defaultdict
+
+
+class TTLCache:
+    """Dictionary of values that expire after a time-to-live."""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.key_locks = defaultdict(threading.Lock)
+        self.async_key_locks = defaultdict(asyncio.Lock)
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+
+    def get(self, key, count=True):
+        """Return the cached value for a key, or None if it is missing or expired."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                self.entries.pop(key, None)
+                if count:
+                    self.misses += 1
+                return None
+            if count:
+                self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, ttl=None):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+
+    def invalidate(self, key=None):
+        """Drop one key, or every key when none is given."""
+        with self.lock:
+            if key is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(key, None)
+
+    def get_or_load(self, key, loader, ttl=None):
+        """Return the cached value, calling `loader()` once across threads on a miss."""
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        with self.lock:
+            key_lock = self.key_locks[key]
+        with key_lock:
+            # Another thread may have loaded it while we waited
+            value = self.get(key, count=False)
+            if value is not None:
+                return value
+            value = loader()
+            self.loads += 1
+            self.set(key, value, ttl)
+            return value
+
+    async def get_or_load_async(self, key, loader, ttl=None):
+        """Async variant of get_or_load; `loader` is a coroutine function."""
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        async with self.async_key_locks[key]:
+            value = self.get(key, count=False)
+            if value is not None:
+                return value
+            value = await loader()
+            self.loads += 1
+            self.set(key, value, ttl)
+            return value
+
+    def stats(self):
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "loads": self.loads
+            }
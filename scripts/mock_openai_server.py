@@ -0,0 +1,642 @@
+#!/usr/bin/env python3
+"""
+Local mock of the parts of the OpenAI API used by this project.
+
+Point the app or the scripts at it with:
+    OPENAI_BASE_URL=http://localhost:8001/v1 python app.py
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+
+from flask import Flask, Response, jsonify, request
+
+app = Flask(__name__)
+
+# Simulated latencies (seconds), overridable from the command line
+settings = {
+    "first_token_delay": 1.0,
+    "token_delay": 0.02,
+    "search_delay": 0.3,
+    "upload_delay": 0.05,
+    "rate_limit_rate": 0.0,
+    "batch_delay": 0.5,
+    "file_failure_rate": 0.0,
+    "completion_delay": 0.5,
+    "metadata_delay": 0.05,
+    "search_passage_chars": 0,
+    # Extra search latency for particular vector stores, by ID
+    "store_delays": {},
+}
+
+state_lock = threading.Lock()
+assistants = {}
+threads = {}
+messages = {}
+runs = {}
+vector_stores = {}
+store_files = {}
+file_batches = {}
+files = {}
+
+
+def new_id(prefix):
+    return f"{prefix}_{uuid.uuid4().hex[:24]}"
+
+
+CITATION_MARKER = "【4:0†source】"
+
+
+def mock_answer(question):
+    """Build a deterministic answer for a question, citing one file."""
+    words = f"This is a mock answer to your question: {question}".split()
+    words += [CITATION_MARKER]
+    words += ["Lorem", "ipsum", "dolor", "sit", "amet."] * 6
+    return [word + " " for word in words]
+
+
+def cited_file_id():
+    """An uploaded file if there is one, otherwise a file ID the search results also use."""
+    return next(iter(files), "file-mock0000")
+
+
+def citations(text):
+    """File citation annotations for the citation markers in a text."""
+    annotations = []
+    start = text.find(CITATION_MARKER)
+    while start != -1:
+        annotations.append({
+            "type": "file_citation",
+            "text": CITATION_MARKER,
+            "start_index": start,
+            "end_index": start + len(CITATION_MARKER),
+            "file_citation": {"file_id": cited_file_id()},
+        })
+        start = text.find(CITATION_MARKER, start + 1)
+    return annotations
+
+
+def make_message(thread_id, role, text, assistant_id=None, run_id=None):
+    return {
+        "id": new_id("msg"),
+        "object": "thread.message",
+        "created_at": int(time.time()),
+        "thread_id": thread_id,
+        "role": role,
+        "content": [{"type": "text", "text": {"value": text, "annotations": citations(text) if role == "assistant" else []}}],
+        "assistant_id": assistant_id,
+        "run_id": run_id,
+        "attachments": [],
+        "metadata": {},
+        "status": "completed",
+    }
+
+
+def run_duration(tokens):
+    return settings["first_token_delay"] + len(tokens) * settings["token_delay"]
+
+
+def run_snapshot(run):
+    """Return the run object with its status derived from the elapsed time."""
+    snapshot = {k: v for k, v in run.items() if not k.startswith("_")}
+    if snapshot["status"] in ("queued", "in_progress"):
+        elapsed = time.time() - run["_started"]
+        if elapsed >= run_duration(run["_tokens"]):
+            finish_run(run)
+            snapshot["status"] = "completed"
+        else:
+            snapshot["status"] = "in_progress"
+    return snapshot
+
+
+def finish_run(run):
+    with state_lock:
+        if run["status"] == "completed":
+            return
+        run["status"] = "completed"
+        message = make_message(run["thread_id"], "assistant", "".join(run["_tokens"]),
+                               assistant_id=run["assistant_id"], run_id=run["id"])
+        messages[run["thread_id"]].append(message)
+        return message
+
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def list_page(items, keep=None):
+    """Return a cursor-paginated list response honouring limit/after/order query parameters.
+
+    `keep` filters items after the cursor is applied, so `after` can name an
+    item the filter excludes.
+    """
+    limit = min(int(request.args.get("limit", 20)), 100)
+    after = request.args.get("after")
+    if request.args.get("order", "desc") == "desc":
+        items = list(reversed(items))
+    if after:
+        ids = [item["id"] for item in items]
+        items = items[ids.index(after) + 1:] if after in ids else []
+    if keep:
+        items = [item for item in items if keep(item)]
+    page = items[:limit]
+    return jsonify({
+        "object": "list",
+        "data": page,
+        "first_id": page[0]["id"] if page else None,
+        "last_id": page[-1]["id"] if page else None,
+        "has_more": len(items) > limit,
+    })
+
+
+# Assistants
+@app.route('/v1/assistants', methods=['POST'])
+def create_assistant():
+    data = request.json or {}
+    assistant = {
+        "id": new_id("asst"),
+        "object": "assistant",
+        "created_at": int(time.time()),
+        "name": data.get("name"),
+        "instructions": data.get("instructions"),
+        "model": data.get("model"),
+        "tools": data.get("tools", []),
+        "tool_resources": data.get("tool_resources", {}),
+        "metadata": {},
+    }
+    assistants[assistant["id"]] = assistant
+    return jsonify(assistant)
+
+
+@app.route('/v1/assistants/<assistant_id>', methods=['GET'])
+def retrieve_assistant(assistant_id):
+    if assistant_id not in assistants:
+        return jsonify({"error": {"message": "No assistant found", "type": "invalid_request_error"}}), 404
+    return jsonify(assistants[assistant_id])
+
+
+@app.route('/v1/assistants/<assistant_id>', methods=['DELETE'])
+def delete_assistant(assistant_id):
+    deleted = assistants.pop(assistant_id, None) is not None
+    return jsonify({"id": assistant_id, "object": "assistant.deleted", "deleted": deleted})
+
+
+# Threads and messages
+@app.route('/v1/threads', methods=['POST'])
+def create_thread():
+    thread = {"id": new_id("thread"), "object": "thread", "created_at": int(time.time()), "metadata": {}}
+    threads[thread["id"]] = thread
+    messages[thread["id"]] = []
+    return jsonify(thread)
+
+
+@app.route('/v1/threads/<thread_id>', methods=['DELETE'])
+def delete_thread(thread_id):
+    deleted = threads.pop(thread_id, None) is not None
+    messages.pop(thread_id, None)
+    return jsonify({"id": thread_id, "object": "thread.deleted", "deleted": deleted})
+
+
+@app.route('/v1/threads/<thread_id>/messages', methods=['POST'])
+def create_message(thread_id):
+    if thread_id not in threads:
+        return jsonify({"error": {"message": "No thread found", "type": "invalid_request_error"}}), 404
+    data = request.json or {}
+    message = make_message(thread_id, data.get("role", "user"), data.get("content", ""))
+    messages[thread_id].append(message)
+    return jsonify(message)
+
+
+@app.route('/v1/threads/<thread_id>/messages', methods=['GET'])
+def list_messages(thread_id):
+    if thread_id not in threads:
+        return jsonify({"error": {"message": "No thread found", "type": "invalid_request_error"}}), 404
+    run_id = request.args.get("run_id")
+    return list_page(messages[thread_id], keep=(lambda message: message["run_id"] == run_id) if run_id else None)
+
+
+# Runs
+@app.route('/v1/threads/<thread_id>/runs', methods=['POST'])
+def create_run(thread_id):
+    if thread_id not in threads:
+        return jsonify({"error": {"message": "No thread found", "type": "invalid_request_error"}}), 404
+    data = request.json or {}
+    question = next((m["content"][0]["text"]["value"] for m in reversed(messages[thread_id])
+                     if m["role"] == "user"), "")
+    run = {
+        "id": new_id("run"),
+        "object": "thread.run",
+        "created_at": int(time.time()),
+        "thread_id": thread_id,
+        "assistant_id": data.get("assistant_id"),
+        "status": "queued",
+        "model": "gpt-4-turbo-preview",
+        "instructions": "",
+        "tools": [],
+        "metadata": {},
+        "_started": time.time(),
+        "_tokens": mock_answer(question),
+    }
+    runs[run["id"]] = run
+
+    if not data.get("stream"):
+        return jsonify(run_snapshot(run))
+
+    def generate():
+        yield sse("thread.run.created", run_snapshot(run))
+        time.sleep(settings["first_token_delay"])
+        message_id = new_id("msg")
+        yield sse("thread.message.created", {
+            "id": message_id, "object": "thread.message", "created_at": int(time.time()),
+            "thread_id": thread_id, "role": "assistant", "content": [], "run_id": run["id"],
+            "assistant_id": run["assistant_id"], "attachments": [], "metadata": {},
+            "status": "in_progress",
+        })
+        for token in run["_tokens"]:
+            yield sse("thread.message.delta", {
+                "id": message_id, "object": "thread.message.delta",
+                "delta": {"content": [{"index": 0, "type": "text", "text": {"value": token, "annotations": []}}]},
+            })
+            time.sleep(settings["token_delay"])
+        message = finish_run(run)
+        if message:
+            message["id"] = message_id
+            yield sse("thread.message.completed", message)
+        yield sse("thread.run.completed", run_snapshot(run))
+        yield "event: done\ndata: [DONE]\n\n"
+
+    return Response(generate(), mimetype='text/event-stream')
+
+
+@app.route('/v1/threads/<thread_id>/runs/<run_id>', methods=['GET'])
+def retrieve_run(thread_id, run_id):
+    run = runs.get(run_id)
+    if not run or run["thread_id"] != thread_id:
+        return jsonify({"error": {"message": "No run found", "type": "invalid_request_error"}}), 404
+    return jsonify(run_snapshot(run))
+
+
+# Chat completions
+@app.route('/v1/chat/completions', methods=['POST'])
+def create_chat_completion():
+    data = request.json or {}
+    prompt = " ".join(str(m.get("content", "")) for m in data.get("messages", []))
+    time.sleep(settings["completion_delay"])
+    content = json.dumps({
+        "document_type": "manual",
+        "topic": prompt.split()[-1].strip(".") if prompt.split() else "unknown",
+        "is_technical": True,
+    })
+    return jsonify({
+        "id": new_id("chatcmpl"),
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": data.get("model"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop",
+        }],
+        "usage": {
+            "prompt_tokens": len(prompt.split()),
+            "completion_tokens": len(content.split()),
+            "total_tokens": len(prompt.split()) + len(content.split()),
+        },
+    })
+
+
+# Files
+def rate_limited():
+    """Return a 429 response for a fraction of requests, or None."""
+    if random.random() < settings["rate_limit_rate"]:
+        response = jsonify({"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}})
+        response.headers["retry-after-ms"] = "200"
+        return response, 429
+    return None
+
+
+@app.route('/v1/files', methods=['POST'])
+def create_file():
+    limited = rate_limited()
+    if limited:
+        return limited
+    upload = request.files.get("file")
+    if upload is None:
+        return jsonify({"error": {"message": "Missing file", "type": "invalid_request_error"}}), 400
+    content = upload.read()
+    time.sleep(settings["upload_delay"])
+    file = {
+        "id": new_id("file"),
+        "object": "file",
+        "bytes": len(content),
+        "created_at": int(time.time()),
+        "filename": upload.filename,
+        "purpose": request.form.get("purpose", "assistants"),
+        "status": "processed",
+    }
+    files[file["id"]] = file
+    return jsonify(file)
+
+
+@app.route('/v1/files/<file_id>', methods=['GET'])
+def retrieve_file(file_id):
+    time.sleep(settings["metadata_delay"])
+    if file_id in files:
+        return jsonify(files[file_id])
+    # Files named in mock search results exist without being uploaded
+    if file_id.startswith("file-mock"):
+        return jsonify({
+            "id": file_id, "object": "file", "bytes": 0, "created_at": int(time.time()),
+            "filename": f"chunk_{file_id[len('file-mock'):]}.json", "purpose": "assistants", "status": "processed",
+        })
+    return jsonify({"error": {"message": "No such file", "type": "invalid_request_error"}}), 404
+
+
+@app.route('/v1/files/<file_id>', methods=['DELETE'])
+def delete_file(file_id):
+    deleted = files.pop(file_id, None) is not None
+    return jsonify({"id": file_id, "object": "file", "deleted": deleted})
+
+
+# Vector stores
+def make_vector_store(vector_store_id=None, name=None, file_count=0):
+    return {
+        "id": vector_store_id or new_id("vs"),
+        "object": "vector_store",
+        "created_at": int(time.time()),
+        "name": name,
+        "bytes": file_count * 2048,
+        "usage_bytes": file_count * 2048,
+        "status": "completed",
+        "file_counts": {
+            "in_progress": 0,
+            "completed": file_count,
+            "failed": 0,
+            "cancelled": 0,
+            "total": file_count,
+        },
+        "metadata": {},
+    }
+
+
+def get_vector_store(vector_store_id):
+    """Return a vector store, creating it on first use so any ID can be searched."""
+    with state_lock:
+        if vector_store_id not in vector_stores:
+            vector_stores[vector_store_id] = make_vector_store(vector_store_id, name=vector_store_id)
+        return vector_stores[vector_store_id]
+
+
+def attach_files(vector_store_id, file_ids, attributes=None):
+    """Attach files to a store and refresh its file counts."""
+    store = get_vector_store(vector_store_id)
+    with state_lock:
+        attached = store_files.setdefault(vector_store_id, {})
+        for file_id in file_ids:
+            attached[file_id] = {
+                "id": file_id,
+                "object": "vector_store.file",
+                "created_at": int(time.time()),
+                "vector_store_id": vector_store_id,
+                "status": "completed",
+                "usage_bytes": files.get(file_id, {}).get("bytes", 2048),
+                "last_error": None,
+                "attributes": attributes or {},
+            }
+        refresh_file_counts(store)
+
+
+def refresh_file_counts(store):
+    attached = store_files.get(store["id"], {})
+    store["usage_bytes"] = store["bytes"] = sum(f["usage_bytes"] for f in attached.values())
+    store["file_counts"].update({"completed": len(attached), "total": len(attached)})
+
+
+@app.route('/v1/vector_stores', methods=['GET'])
+def list_vector_stores():
+    time.sleep(settings["metadata_delay"])
+    return list_page(sorted(vector_stores.values(), key=lambda store: store["created_at"]))
+
+
+@app.route('/v1/vector_stores', methods=['POST'])
+def create_vector_store():
+    data = request.json or {}
+    store = make_vector_store(name=data.get("name"))
+    vector_stores[store["id"]] = store
+    attach_files(store["id"], data.get("file_ids", []))
+    return jsonify(store)
+
+
+@app.route('/v1/vector_stores/<vector_store_id>/files', methods=['GET'])
+def list_vector_store_files(vector_store_id):
+    time.sleep(settings["metadata_delay"])
+    get_vector_store(vector_store_id)
+    return list_page(list(store_files.get(vector_store_id, {}).values()))
+
+
+@app.route('/v1/vector_stores/<vector_store_id>/files', methods=['POST'])
+def create_vector_store_file(vector_store_id):
+    data = request.json or {}
+    attach_files(vector_store_id, [data["file_id"]], data.get("attributes"))
+    return jsonify(store_files[vector_store_id][data["file_id"]])
+
+
+@app.route('/v1/vector_stores/<vector_store_id>/files/<file_id>', methods=['GET'])
+def retrieve_vector_store_file(vector_store_id, file_id):
+    attached = store_files.get(vector_store_id, {})
+    if file_id not in attached:
+        return jsonify({"error": {"message": "No file found", "type": "invalid_request_error"}}), 404
+    return jsonify(attached[file_id])
+
+
+@app.route('/v1/vector_stores/<vector_store_id>/files/<file_id>', methods=['POST'])
+def update_vector_store_file(vector_store_id, file_id):
+    attached = store_files.get(vector_store_id, {})
+    if file_id not in attached:
+        return jsonify({"error": {"message": "No file found", "type": "invalid_request_error"}}), 404
+    attached[file_id]["attributes"] = (request.json or {}).get("attributes", {})
+    return jsonify(attached[file_id])
+
+
+@app.route('/v1/vector_stores/<vector_store_id>/files/<file_id>', methods=['DELETE'])
+def delete_vector_store_file(vector_store_id, file_id):
+    store = get_vector_store(vector_store_id)
+    with state_lock:
+        deleted = store_files.get(vector_store_id, {}).pop(file_id, None) is not None
+        refresh_file_counts(store)
+    return jsonify({"id": file_id, "object": "vector_store.file.deleted", "deleted": deleted})
+
+
+@app.route('/v1/vector_stores/<vector_store_id>/file_batches', methods=['POST'])
+def create_file_batch(vector_store_id):
+    limited = rate_limited()
+    if limited:
+        return limited
+    data = request.json or {}
+    file_ids = data.get("file_ids", [])
+    failed_ids = [file_id for file_id in file_ids if random.random() < settings["file_failure_rate"]]
+    attach_files(vector_store_id, [file_id for file_id in file_ids if file_id not in failed_ids])
+    batch = {
+        "id": new_id("vsfb"),
+        "object": "vector_store.file_batch",
+        "created_at": int(time.time()),
+        "vector_store_id": vector_store_id,
+        "status": "in_progress",
+        "file_counts": {"in_progress": len(file_ids), "completed": 0, "failed": 0,
+                        "cancelled": 0, "total": len(file_ids)},
+        "_started": time.time(),
+        "_file_ids": file_ids,
+        "_failed_ids": failed_ids,
+    }
+    file_batches[batch["id"]] = batch
+    return jsonify(batch_snapshot(batch))
+
+
+def batch_snapshot(batch):
+    """Return the batch with its status derived from the elapsed time."""
+    if batch["status"] == "in_progress" and time.time() - batch["_started"] >= settings["batch_delay"]:
+        failed = len(batch["_failed_ids"])
+        batch["status"] = "completed"
+        batch["file_counts"].update({"in_progress": 0, "completed": len(batch["_file_ids"]) - failed, "failed": failed})
+    return {k: v for k, v in batch.items() if not k.startswith("_")}
+
+
+@app.route('/v1/vector_stores/<vector_store_id>/file_batches/<batch_id>', methods=['GET'])
+def retrieve_file_batch(vector_store_id, batch_id):
+    if batch_id not in file_batches:
+        return jsonify({"error": {"message": "No batch found", "type": "invalid_request_error"}}), 404
+    return jsonify(batch_snapshot(file_batches[batch_id]))
+
+
+@app.route('/v1/vector_stores/<vector_store_id>/file_batches/<batch_id>/files', methods=['GET'])
+def list_file_batch_files(vector_store_id, batch_id):
+    if batch_id not in file_batches:
+        return jsonify({"error": {"message": "No batch found", "type": "invalid_request_error"}}), 404
+    batch = file_batches[batch_id]
+    status_filter = request.args.get("filter")
+    items = [{
+        "id": file_id,
+        "object": "vector_store.file",
+        "created_at": batch["created_at"],
+        "vector_store_id": vector_store_id,
+        "status": "failed" if file_id in batch["_failed_ids"] else "completed",
+        "usage_bytes": 0,
+        "last_error": {"code": "server_error", "message": "Mock failure"} if file_id in batch["_failed_ids"] else None,
+    } for file_id in batch["_file_ids"]]
+    if status_filter:
+        items = [item for item in items if item["status"] == status_filter]
+    return list_page(items)
+
+
+@app.route('/v1/vector_stores/<vector_store_id>', methods=['GET'])
+def retrieve_vector_store(vector_store_id):
+    time.sleep(settings["metadata_delay"])
+    return jsonify(get_vector_store(vector_store_id))
+
+
+@app.route('/v1/vector_stores/<vector_store_id>', methods=['POST'])
+def update_vector_store(vector_store_id):
+    store = get_vector_store(vector_store_id)
+    data = request.json or {}
+    with state_lock:
+        for field in ("name", "metadata"):
+            if field in data:
+                store[field] = data[field]
+    return jsonify(store)
+
+
+FILLER_WORDS = ("the", "device", "settings", "update", "network", "battery", "menu", "press", "hold", "screen",
+                "connect", "firmware", "reset", "option", "select", "power", "status", "light", "cable", "app")
+
+
+def search_passage(i, query, vector_store_id):
+    """Text of one mock search hit; padded with filler sentences to --search-passage-chars."""
+    text = f"Mock passage {i} from {vector_store_id} about {query}. " * 5
+    rng = random.Random(i)
+    sentences = [text]
+    length = len(text)
+    while length < settings["search_passage_chars"]:
+        sentence = " ".join(rng.choice(FILLER_WORDS) for _ in range(12)).capitalize() + ".\n"
+        sentences.append(sentence)
+        length += len(sentence)
+    return "".join(sentences)
+
+
+@app.route('/v1/vector_stores/<vector_store_id>/search', methods=['POST'])
+def search_vector_store(vector_store_id):
+    get_vector_store(vector_store_id)
+    data = request.json or {}
+    query = data.get("query", "")
+    max_results = data.get("max_num_results", 10)
+    time.sleep(settings["search_delay"] + settings["store_delays"].get(vector_store_id, 0.0))
+    # Each store scores on its own scale, as stores of different content do
+    scale = random.Random(vector_store_id).uniform(0.6, 1.0)
+    results = [{
+        "file_id": f"file-mock{i:04d}",
+        "filename": f"chunk_{i:04d}.json",
+        "score": round(scale * (1.0 - i * 0.03), 4),
+        "attributes": {},
+        "content": [{"type": "text", "text": search_passage(i, query, vector_store_id)}],
+    } for i in range(max_results)]
+    return jsonify({
+        "object": "vector_store.search_results.page",
+        "search_query": query,
+        "data": results,
+        "has_more": False,
+        "next_page": None,
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local mock of the OpenAI API")
+    parser.add_argument("--port", type=int, default=8001, help="Port to listen on (default: 8001)")
+    parser.add_argument("--first-token-delay", type=float, default=1.0,
+                        help="Seconds before a run produces its first token (default: 1.0)")
+    parser.add_argument("--token-delay", type=float, default=0.02,
+                        help="Seconds between streamed tokens (default: 0.02)")
+    parser.add_argument("--search-delay", type=float, default=0.3,
+                        help="Seconds each vector store search takes (default: 0.3)")
+    parser.add_argument("--upload-delay", type=float, default=0.05,
+                        help="Seconds each file upload takes (default: 0.05)")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0,
+                        help="Fraction of uploads and file batches rejected with HTTP 429 (default: 0)")
+    parser.add_argument("--batch-delay", type=float, default=0.5,
+                        help="Seconds a file batch takes to finish processing (default: 0.5)")
+    parser.add_argument("--file-failure-rate", type=float, default=0.0,
+                        help="Fraction of files in a batch that fail to process (default: 0)")
+    parser.add_argument("--completion-delay", type=float, default=0.5,
+                        help="Seconds each chat completion takes (default: 0.5)")
+    parser.add_argument("--metadata-delay", type=float, default=0.05,
+                        help="Seconds each vector store list, retrieve or file list call takes (default: 0.05)")
+    parser.add_argument("--search-passage-chars", type=int, default=0,
+                        help="Pad each search hit's text to about this many characters (default: 0, short passages)")
+    parser.add_argument("--store-delay", action="append", default=[], metavar="ID=SECONDS",
+                        help="Extra seconds searches of one vector store take; repeat for more stores")
+
+    args = parser.parse_args()
+    settings["first_token_delay"] = args.first_token_delay
+    settings["token_delay"] = args.token_delay
+    settings["search_delay"] = args.search_delay
+    settings["upload_delay"] = args.upload_delay
+    settings["rate_limit_rate"] = args.rate_limit_rate
+    settings["batch_delay"] = args.batch_delay
+    settings["file_failure_rate"] = args.file_failure_rate
+    settings["completion_delay"] = args.completion_delay
+    settings["metadata_delay"] = args.metadata_delay
+    settings["search_passage_chars"] = args.search_passage_chars
+    for delay in args.store_delay:
+        store_id, _, seconds = delay.partition("=")
+        try:
+            settings["store_delays"][store_id] = float(seconds)
+        except ValueError:
+            parser.error(f"--store-delay expects ID=SECONDS, got {delay!r}")
+
+    print(f"Mock OpenAI API listening on http://localhost:{args.port}/v1")
+    app.run(port=args.port, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Shared HTTP client for OpenAI REST endpoints that the SDK does not wrap
+(vector store search, file attribute updates).
+
+A single keep-alive connection pool is reused across calls, HTTP/2 is used
+when the `h2` package is installed, and transient failures are retried with
+jittered exponential backoff.
+"""
+import os
+import random
+import threading
+import time
+
+import httpx
+
+DEFAULT_BASE_URL = "https://api.openai.com/v1"
+
+# Timeouts (seconds)
+CONNECT_TIMEOUT = 5.0
+REQUEST_TIMEOUT = 60.0
+
+# Connection pool size
+MAX_CONNECTIONS = 50
+MAX_KEEPALIVE_CONNECTIONS = 20
+
+# Retry policy
+MAX_RETRIES = 3
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 8.0
+RETRY_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+_client = None
+_client_lock = threading.Lock()
+
+# httpx event hooks installed on the pooled client (see add_event_hooks)
+_event_hooks = {"request": [], "response": []}
+
+# Wrappers applied to the pooled client's transport when it is created (see add_transport_wrapper)
+_transport_wrappers = []
+
+
+class APIError(Exception):
+    """Raised when the API returns a non-retryable error or retries are exhausted."""
+
+    def __init__(self, status_code, message):
+        super().__init__(f"HTTP {status_code}: {message}")
+        self.status_code = status_code
+        self.message = message
+
+
+def http2_available():
+    """Return True if the optional h2 package needed for HTTP/2 is installed."""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def get_client():
+    """Return the process-wide pooled client, creating it on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = httpx.Client(
+                    base_url=os.getenv("OPENAI_BASE_URL", DEFAULT_BASE_URL),
+                    headers={
+                        "Authorization": f"Bearer {os.getenv('OPENAI_API_KEY')}",
+                        "Content-Type": "application/json",
+                        "OpenAI-Beta": "assistants=v2"
+                    },
+                    timeout=httpx.Timeout(REQUEST_TIMEOUT, connect=CONNECT_TIMEOUT),
+                    transport=pooled_transport(),
+                    event_hooks={name: list(hooks) for name, hooks in _event_hooks.items()}
+                )
+    return _client
+
+
+def pooled_transport():
+    transport = httpx.HTTPTransport(
+        http2=http2_available(),
+        limits=httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS
+        )
+    )
+    for wrap in _transport_wrappers:
+        transport = wrap(transport)
+    return transport
+
+
+def add_event_hooks(hooks):
+    """Register httpx event hooks ({"request": [...], "response": [...]}) on the pooled client."""
+    with _client_lock:
+        for name, functions in hooks.items():
+            _event_hooks[name].extend(functions)
+        if _client is not None:
+            _client.event_hooks = {name: list(functions) for name, functions in _event_hooks.items()}
+
+
+def add_transport_wrapper(wrap):
+    """Wrap the pooled client's transport with `wrap(transport)`; register before the client is first used."""
+    with _client_lock:
+        if _client is not None:
+            raise RuntimeError("The pooled client already exists; add transport wrappers at startup")
+        _transport_wrappers.append(wrap)
+
+
+def backoff_delay(attempt):
+    """Exponential backoff with full jitter for the given retry attempt (0-based)."""
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+
+def retry_after(response):
+    """Return the server-requested retry delay in seconds, if any."""
+    value = response.headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = response.headers.get("retry-after")
+    if value:
+        try:
+            return float(value)
+        except ValueError:
+            pass
+    return None
+
+
+def error_message(response):
+    """Extract the API error message from a response body."""
+    try:
+        return response.json()["error"]["message"]
+    except Exception:
+        return response.text
+
+
+def request_json(method, path, payload=None, max_retries=MAX_RETRIES):
+    """Send a JSON request to the API and return the parsed JSON response."""
+    client = get_client()
+    for attempt in range(max_retries + 1):
+        try:
+            response = client.request(method, path, json=payload)
+        except httpx.TransportError:
+            if attempt == max_retries:
+                raise
+            delay = backoff_delay(attempt)
+        else:
+            if response.status_code < 400:
+                return response.json()
+            if response.status_code not in RETRY_STATUS_CODES or attempt == max_retries:
+                raise APIError(response.status_code, error_message(response))
+            delay = retry_after(response) or backoff_delay(attempt)
+
+        time.sleep(min(delay, RETRY_MAX_DELAY))
+
+
+def post_json(path, payload, max_retries=MAX_RETRIES):
+    """POST a JSON payload to the API and return the parsed JSON response."""
+    return request_json("POST", path, payload, max_retries=max_retries)
@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+"""
+Request instrumentation exported in the Prometheus text format.
+
+Metrics are in-process counters and fixed-bucket histograms, so recording a
+sample is a dictionary lookup and a few integer updates under a lock:
+
+    app_requests_total{route, method, status}          requests by final status code
+    app_request_duration_seconds{route, method}        time until the response body was sent
+    app_stage_duration_seconds{stage}                  time spent in each stage of a request
+    app_upstream_requests_total{operation, status}     OpenAI API calls by endpoint and status (or error)
+    app_upstream_request_duration_seconds{operation}   time until the API's response headers arrived
+    app_run_poll_iterations                            status checks needed per polled run
+
+Upstream calls are counted by httpx event hooks (see `upstream_hooks`), so
+every SDK and pooled-client request is covered without touching call sites.
+Hooks only see responses; calls that fail without one (connect errors,
+timeouts) are counted by wrapping the client's transport (`UpstreamTransport`),
+with the exception's name as the status.
+
+Each request also gets a `Trace` that collects its stage timings, upstream
+call count and poll iterations. With `REQUEST_TRACE_LOG` set to a file path
+(or `-` for stdout), finished traces are written as JSON lines, sampled at
+`REQUEST_TRACE_SAMPLE` (default 1.0).
+"""
+import bisect
+import contextvars
+import json
+import os
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+POLL_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """A monotonically increasing count per label combination."""
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            items = sorted(self.values.items())
+        for label_values, value in items:
+            lines.append(f"{self.name}{format_labels(self.labels, label_values)} {format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """Observations counted into fixed buckets per label combination."""
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        # Counts are kept per bucket and made cumulative when rendered
+        slot = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            state = self.values.get(label_values)
+            if state is None:
+                state = self.values[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][slot] += 1
+            state[1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            items = sorted((label_values, (list(counts), total)) for label_values, (counts, total) in self.values.items())
+        for label_values, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                labels = format_labels(self.labels + ("le",), label_values + (format_value(bound),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = format_labels(self.labels, label_values)
+            lines.append(f"{self.name}_sum{labels} {format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name, help, labels=()):
+        self.metrics.append(Counter(name, help, labels))
+        return self.metrics[-1]
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.metrics.append(Histogram(name, help, labels, buckets))
+        return self.metrics[-1]
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format."""
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+REQUESTS = REGISTRY.counter("app_requests_total", "HTTP requests by route, method and status code",
+                            ("route", "method", "status"))
+REQUEST_SECONDS = REGISTRY.histogram("app_request_duration_seconds", "Time to handle a request, including streamed bodies",
+                                     ("route", "method"))
+STAGE_SECONDS = REGISTRY.histogram("app_stage_duration_seconds", "Time spent in each stage of a request", ("stage",))
+UPSTREAM_REQUESTS = REGISTRY.counter("app_upstream_requests_total", "OpenAI API requests by operation and status code (or error, without a response)",
+                                     ("operation", "status"))
+UPSTREAM_SECONDS = REGISTRY.histogram("app_upstream_request_duration_seconds",
+                                      "Time until OpenAI API response headers arrived", ("operation",))
+RUN_POLLS = REGISTRY.histogram("app_run_poll_iterations", "Run status checks per polled run", buckets=POLL_BUCKETS)
+
+render = REGISTRY.render
+
+
+class Trace:
+    """Timings collected for one request."""
+
+    __slots__ = ("route", "method", "started", "stages", "upstream_calls", "upstream_seconds", "polls", "lock")
+
+    def __init__(self, route, method):
+        self.route = route
+        self.method = method
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.upstream_calls = 0
+        self.upstream_seconds = 0.0
+        self.polls = 0
+        # Work the request hands to other threads records into the same trace
+        self.lock = threading.Lock()
+
+
+_current = contextvars.ContextVar("request_trace", default=None)
+
+TRACE_LOG = os.getenv("REQUEST_TRACE_LOG")
+TRACE_SAMPLE = float(os.getenv("REQUEST_TRACE_SAMPLE", "1.0"))
+_trace_log_lock = threading.Lock()
+_trace_log_file = None
+
+
+def use_trace(trace):
+    """Make `trace` the current request's trace in this context (e.g. while a streamed body is sent)."""
+    _current.set(trace)
+
+
+def begin_request(route, method):
+    trace = Trace(route, method)
+    _current.set(trace)
+    return trace
+
+
+def finish_request(trace, status):
+    """Record a finished request's metrics and write its trace log line, if enabled."""
+    seconds = time.perf_counter() - trace.started
+    REQUESTS.inc(trace.route, trace.method, status)
+    REQUEST_SECONDS.observe(seconds, trace.route, trace.method)
+    if _current.get() is trace:
+        _current.set(None)
+    if TRACE_LOG and random.random() < TRACE_SAMPLE:
+        with trace.lock:
+            record = {
+                "ts": round(time.time(), 3),
+                "route": trace.route,
+                "method": trace.method,
+                "status": status,
+                "duration_ms": round(seconds * 1000, 2),
+                "stages_ms": {name: round(value * 1000, 2) for name, value in trace.stages.items()},
+                "upstream_calls": trace.upstream_calls,
+                "upstream_ms": round(trace.upstream_seconds * 1000, 2),
+                "polls": trace.polls
+            }
+        write_trace(record)
+
+
+def write_trace(record):
+    global _trace_log_file
+    line = json.dumps(record) + "\n"
+    with _trace_log_lock:
+        if TRACE_LOG == "-":
+            sys.stdout.write(line)
+            return
+        if _trace_log_file is None:
+            _trace_log_file = open(TRACE_LOG, "a", buffering=1)
+        _trace_log_file.write(line)
+
+
+def record_stage(name, seconds):
+    STAGE_SECONDS.observe(seconds, name)
+    trace = _current.get()
+    if trace is not None:
+        with trace.lock:
+            trace.stages[name] = trace.stages.get(name, 0.0) + seconds
+
+
+@contextmanager
+def stage(name):
+    """Time a block as one stage of the current request; works around awaits too."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - started)
+
+
+def submit_in_context(executor, function, *args):
+    """executor.submit in a copy of the current context, so the stages and upstream calls it records count for this request."""
+    return executor.submit(contextvars.copy_context().run, function, *args)
+
+
+def percentile(values, fraction):
+    """The `fraction` quantile (0.5 for p50) of some samples, nearest rank; None without samples."""
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else None
+
+
+def record_polls(count):
+    RUN_POLLS.observe(count)
+    trace = _current.get()
+    if trace is not None:
+        with trace.lock:
+            trace.polls += count
+
+
+def operation_name(method, path):
+    """Collapse an API path to its endpoint, e.g. GET threads/{id}/runs/{id}.
+
+    OpenAI paths alternate between a collection and an object ID, so every
+    second segment after the version prefix is an ID.
+    """
+    segments = path.strip("/").split("/")
+    if segments and segments[0] == "v1":
+        segments = segments[1:]
+    return method + " " + "/".join("{id}" if i % 2 else segment for i, segment in enumerate(segments))
+
+
+def record_upstream(request, status):
+    started = request.extensions.get("metrics_started")
+    seconds = time.perf_counter() - started if started is not None else 0.0
+    operation = operation_name(request.method, request.url.path)
+    UPSTREAM_REQUESTS.inc(operation, status)
+    UPSTREAM_SECONDS.observe(seconds, operation)
+    trace = _current.get()
+    if trace is not None:
+        with trace.lock:
+            trace.upstream_calls += 1
+            trace.upstream_seconds += seconds
+
+
+def upstream_hooks():
+    """httpx event hooks that count and time every request made by a sync client."""
+    def on_request(request):
+        request.extensions["metrics_started"] = time.perf_counter()
+
+    def on_response(response):
+        record_upstream(response.request, response.status_code)
+
+    return {"request": [on_request], "response": [on_response]}
+
+
+def async_upstream_hooks():
+    """The same hooks for an httpx.AsyncClient."""
+    async def on_request(request):
+        request.extensions["metrics_started"] = time.perf_counter()
+
+    async def on_response(response):
+        record_upstream(response.request, response.status_code)
+
+    return {"request": [on_request], "response": [on_response]}
+
+
+class UpstreamTransport:
+    """Wraps a sync httpx transport to count calls that fail before a response arrives."""
+
+    def __init__(self, transport):
+        self.transport = transport
+
+    def handle_request(self, request):
+        try:
+            return self.transport.handle_request(request)
+        except Exception as e:
+            record_upstream(request, type(e).__name__)
+            raise
+
+    def close(self):
+        self.transport.close()
+
+    def __enter__(self):
+        self.transport.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.transport.__exit__(*exc_info)
+
+
+class AsyncUpstreamTransport:
+    """The same wrapper for an async httpx transport."""
+
+    def __init__(self, transport):
+        self.transport = transport
+
+    async def handle_async_request(self, request):
+        try:
+            return await self.transport.handle_async_request(request)
+        except Exception as e:
+            record_upstream(request, type(e).__name__)
+            raise
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+    async def __aenter__(self):
+        await self.transport.__aenter__()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.transport.__aexit__(*exc_info)
@@ -0,0 +1,402 @@
+#!/usr/bin/env python3
+"""
+Re-ranking of search results on a process pool.
+
+A search returns candidates ranked by the vector store; a reranker re-scores
+the top candidates against the query. Scoring is CPU-bound, so it runs in
+worker processes instead of the request thread, and concurrent searches are
+spread over all cores. Candidate texts are copied into one of a fixed set of
+shared memory slots that the workers attach once and read in place; only the
+slot's name and the query are pickled, and the worker sends back one score
+per candidate.
+
+Rerankers:
+    lexical         BM25 over the candidates, blended with the original score (no dependencies)
+    cross-encoder   a sentence-transformers CrossEncoder (RERANK_MODEL), loaded once per worker
+
+If a reranker fails or does not answer within the timeout, the original
+ranking is returned unchanged. The pool only reranks once `start()` has been
+called. Workers are started from a fork server (spawned where there is none):
+a fresh process with this module already imported, rather than a fork of a
+server that may be running threads. They exit when the serving process does.
+
+multiprocessing does not let daemonic processes start children, and
+hypercorn's worker processes are daemonic unless configured otherwise, so the
+async app is served with `daemon = false` (see hypercorn.toml).
+"""
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from bm25_index import tokenize, K1, B
+from search_snippets import item_text
+
+DEFAULT_RERANKER = "lexical"
+DEFAULT_CROSS_ENCODER = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+DEFAULT_TIMEOUT = 2.0
+DEFAULT_CANDIDATES = 20
+LEXICAL_WEIGHT = 0.5
+
+# Longer candidates are truncated; cross-encoders only read the first few hundred tokens anyway
+MAX_TEXT_CHARS = 8000
+
+# Shared memory slots for candidate texts; a page that does not fit, or finds every slot busy, is pickled instead
+SLOT_BYTES = 1024 * 1024
+SLOTS_PER_WORKER = 4
+
+OFFSET_BYTES = np.dtype(np.int64).itemsize
+
+
+class LexicalReranker:
+    """BM25 of the query terms in each candidate, with document frequencies taken over the candidates."""
+
+    name = "lexical"
+    weight = LEXICAL_WEIGHT
+
+    def score(self, query, texts):
+        terms = set(tokenize(query))
+        documents = [Counter(tokenize(text)) for text in texts]
+        lengths = [sum(counts.values()) for counts in documents]
+        average = (sum(lengths) / len(lengths)) or 1.0
+        count = len(documents)
+        idf = {}
+        for term in terms:
+            df = sum(term in counts for counts in documents)
+            idf[term] = np.log(1 + (count - df + 0.5) / (df + 0.5))
+        scores = []
+        for counts, length in zip(documents, lengths):
+            score = 0.0
+            for term in terms:
+                tf = counts.get(term, 0)
+                if tf:
+                    score += idf[term] * tf * (K1 + 1) / (tf + K1 * (1 - B + B * length / average))
+            scores.append(score)
+        return scores
+
+
+class CrossEncoderReranker:
+    """A local cross-encoder that reads the query and each candidate together; its ranking replaces the original."""
+
+    name = "cross-encoder"
+    weight = 1.0
+
+    def __init__(self, model=None):
+        from sentence_transformers import CrossEncoder
+        self.model = CrossEncoder(model or os.getenv("RERANK_MODEL", DEFAULT_CROSS_ENCODER))
+
+    def score(self, query, texts):
+        return self.model.predict([(query, text) for text in texts]).tolist()
+
+
+RERANKERS = {
+    "lexical": LexicalReranker,
+    "cross-encoder": CrossEncoderReranker,
+}
+
+
+def cross_encoder_available():
+    """Return True if the optional sentence-transformers package needed for the cross-encoder is installed."""
+    try:
+        import sentence_transformers  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def check_reranker(name):
+    """Raise ValueError unless `name` is a reranker that can run here."""
+    if name not in RERANKERS:
+        raise ValueError(f"Unknown reranker '{name}'. Choose from: {', '.join(sorted(RERANKERS))}")
+    if name == "cross-encoder" and not cross_encoder_available():
+        raise ValueError("The cross-encoder reranker needs the sentence-transformers package")
+
+
+# Rerankers built in this worker process, by name; models load on first use and stay loaded
+_worker_rerankers = {}
+
+
+def worker_reranker(name):
+    if name not in _worker_rerankers:
+        _worker_rerankers[name] = RERANKERS[name]()
+    return _worker_rerankers[name]
+
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def watch_parent(parent_pid):
+    """Exit once the serving process is gone, so a worker never outlives it."""
+    while process_alive(parent_pid):
+        time.sleep(1)
+    os._exit(0)
+
+
+def start_worker(parent_pid, names):
+    """Worker initializer: watch the parent and load rerankers before the first request needs them."""
+    threading.Thread(target=watch_parent, args=(parent_pid,), daemon=True).start()
+    for name in names:
+        try:
+            worker_reranker(name)
+        except Exception as e:
+            print(f"Warning: Could not load reranker '{name}': {e}")
+
+
+def pack_texts(texts):
+    """Texts laid out for a shared memory slot: count + 1 int64 offsets, then the UTF-8 bytes."""
+    encoded = [text.encode("utf-8") for text in texts]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(data) for data in encoded], out=offsets[1:])
+    return offsets.tobytes() + b"".join(encoded)
+
+
+def read_texts(buffer, count):
+    offsets = np.frombuffer(buffer, dtype=np.int64, count=count + 1).tolist()
+    header = (count + 1) * OFFSET_BYTES
+    return [bytes(buffer[header + start:header + end]).decode("utf-8") for start, end in zip(offsets, offsets[1:])]
+
+
+# Shared memory slots this worker has attached, by name; slots are reused, so each is attached once
+_worker_slots = {}
+
+
+def score_shared(name, query, slot_name, count):
+    """Worker entry point: score the texts in a shared memory slot."""
+    if slot_name not in _worker_slots:
+        _worker_slots[slot_name] = shared_memory.SharedMemory(name=slot_name)
+    texts = read_texts(_worker_slots[slot_name].buf, count)
+    return worker_reranker(name).score(query, texts)
+
+
+def score_texts(name, query, texts):
+    """Worker entry point for texts passed by pickling; used to compare transfer costs."""
+    return worker_reranker(name).score(query, texts)
+
+
+class SharedSlots:
+    """Fixed-size shared memory blocks reused across requests, so a rerank costs a copy rather than an allocation."""
+
+    def __init__(self, count, size=SLOT_BYTES):
+        self.size = size
+        self.blocks = [shared_memory.SharedMemory(create=True, size=size) for _ in range(count)]
+        self.free = list(self.blocks)
+        self.lock = threading.Lock()
+
+    def acquire(self, payload):
+        """Copy `payload` into a free slot and return it, or None if it does not fit or every slot is busy."""
+        if len(payload) > self.size:
+            return None
+        with self.lock:
+            if not self.free:
+                return None
+            block = self.free.pop()
+        block.buf[:len(payload)] = payload
+        return block
+
+    def release(self, block):
+        with self.lock:
+            self.free.append(block)
+
+    def close(self):
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = self.free = []
+
+
+def min_max(values):
+    values = np.asarray(values, dtype=np.float64)
+    span = values.max() - values.min() if len(values) else 0.0
+    return (values - values.min()) / span if span else np.zeros(len(values))
+
+
+def apply_scores(results, scores, weight, top_k):
+    """Results reordered by the blended score and cut to `top_k`; each item keeps its original score."""
+    items = results.get("data", [])
+    original = min_max([item.get("score", 0.0) for item in items])
+    blended = weight * min_max(scores) + (1 - weight) * original
+    order = np.argsort(-blended, kind="stable")[:top_k]
+    data = [dict(items[i], rerank_score=round(float(scores[i]), 4)) for i in order]
+    return dict(results, data=data)
+
+
+def worker_context():
+    """A fork server where the platform has one, so workers never fork from a threaded server; spawn otherwise."""
+    if "forkserver" not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("spawn")
+    context = multiprocessing.get_context("forkserver")
+    # Workers fork from a server that has already imported this module (and numpy)
+    context.set_forkserver_preload([__name__])
+    return context
+
+
+class RerankPool:
+    """Worker processes that rerank search results, falling back to the original ranking on timeout or failure."""
+
+    def __init__(self, workers=None, timeout=DEFAULT_TIMEOUT, preload_names=()):
+        self.workers = workers or os.cpu_count() or 1
+        self.timeout = timeout
+        self.preload_names = tuple(preload_names)
+        self.executor = None
+        self.slots = None
+        self.lock = threading.Lock()
+        self.pickled = 0
+        self.reranked = 0
+        self.timeouts = 0
+        self.errors = 0
+
+    @property
+    def started(self):
+        return self.executor is not None
+
+    def start(self):
+        """Start the workers and wait until one answers; raises RuntimeError if this process cannot have children."""
+        if multiprocessing.current_process().daemon:
+            raise RuntimeError("Daemonic processes cannot start rerank workers (serve with hypercorn's daemon = false)")
+        with self.lock:
+            if self.slots is None:
+                self.slots = SharedSlots(self.workers * SLOTS_PER_WORKER)
+            if self.executor is None:
+                self.executor = self.new_executor()
+        self.executor.submit(int).result()
+
+    def new_executor(self):
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=worker_context(),
+            initializer=start_worker,
+            initargs=(os.getpid(), self.preload_names)
+        )
+
+    def get_executor(self):
+        executor = self.executor
+        if executor is None:
+            raise RuntimeError("The rerank pool has not been started")
+        return executor
+
+    def submit(self, name, query, texts, shared=True):
+        """Score `texts` on a worker; returns a concurrent.futures.Future of the scores."""
+        executor = self.get_executor()
+        slots = self.slots
+        block = slots.acquire(pack_texts(texts)) if shared else None
+        if block is None:
+            if shared:
+                # Oversized, or more requests in flight than slots
+                with self.lock:
+                    self.pickled += 1
+            return executor.submit(score_texts, name, query, texts)
+        try:
+            future = executor.submit(score_shared, name, query, block.name, len(texts))
+        except BaseException:
+            slots.release(block)
+            raise
+        # A timed-out request keeps its slot until the worker is done reading it
+        future.add_done_callback(lambda _: slots.release(block))
+        return future
+
+    def restart(self, executor):
+        """Replace a pool that lost a worker with a fresh one."""
+        with self.lock:
+            if self.executor is executor:
+                self.executor = self.new_executor()
+        executor.shutdown(wait=False)
+
+    def prepare(self, results):
+        items = results.get("data") if isinstance(results, dict) else None
+        return [item_text(item)[:MAX_TEXT_CHARS] for item in items] if items else None
+
+    def finish(self, results, name, top_k, started, scores=None, reason=None):
+        """Count the outcome and build the response; without scores the original ranking is kept."""
+        with self.lock:
+            if scores is not None:
+                self.reranked += 1
+            elif reason == "timeout":
+                self.timeouts += 1
+            else:
+                self.errors += 1
+        if scores is not None:
+            results = apply_scores(results, scores, RERANKERS[name].weight, top_k)
+        else:
+            results = dict(results, data=results.get("data", [])[:top_k])
+        info = {"reranker": name, "applied": scores is not None, "ms": round((time.perf_counter() - started) * 1000, 2)}
+        if reason:
+            info["reason"] = reason
+        return dict(results, rerank=info)
+
+    def rerank(self, results, query, name=DEFAULT_RERANKER, top_k=10):
+        """Rerank search results and keep the best `top_k`; blocks for at most the timeout."""
+        started = time.perf_counter()
+        texts = self.prepare(results)
+        if not texts:
+            return results
+        executor = self.get_executor()
+        try:
+            future = self.submit(name, query, texts)
+            scores = future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            # Drop the job if no worker has picked it up yet
+            future.cancel()
+            return self.finish(results, name, top_k, started, reason="timeout")
+        except BrokenProcessPool as e:
+            print(f"Warning: Reranking failed, restarting the workers: {e}")
+            self.restart(executor)
+            return self.finish(results, name, top_k, started, reason="error")
+        except Exception as e:
+            print(f"Warning: Reranking failed: {e}")
+            return self.finish(results, name, top_k, started, reason="error")
+        return self.finish(results, name, top_k, started, scores)
+
+    async def rerank_async(self, results, query, name=DEFAULT_RERANKER, top_k=10):
+        """rerank() for an event loop; waits on the worker without blocking the loop."""
+        started = time.perf_counter()
+        texts = self.prepare(results)
+        if not texts:
+            return results
+        executor = self.get_executor()
+        try:
+            # On timeout wait_for cancels the job if no worker has picked it up yet
+            scores = await asyncio.wait_for(asyncio.wrap_future(self.submit(name, query, texts)), self.timeout)
+        except asyncio.TimeoutError:
+            return self.finish(results, name, top_k, started, reason="timeout")
+        except BrokenProcessPool as e:
+            print(f"Warning: Reranking failed, restarting the workers: {e}")
+            self.restart(executor)
+            return self.finish(results, name, top_k, started, reason="error")
+        except Exception as e:
+            print(f"Warning: Reranking failed: {e}")
+            return self.finish(results, name, top_k, started, reason="error")
+        return self.finish(results, name, top_k, started, scores)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "workers": self.workers,
+                "started": self.executor is not None,
+                "timeout": self.timeout,
+                "reranked": self.reranked,
+                "pickled": self.pickled,
+                "timeouts": self.timeouts,
+                "errors": self.errors
+            }
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
+        if self.slots is not None:
+            self.slots.close()
+            self.slots = None
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+gzip and brotli compression of JSON API responses.
+
+Search responses with full chunk text run to hundreds of kilobytes and
+compress well. The apps compress JSON bodies above a minimum size with the
+best encoding the client accepts: brotli when the optional `brotli` package
+is installed, otherwise gzip. Streamed responses (SSE, NDJSON) are left
+alone so each event is still delivered as soon as it is written.
+"""
+import gzip
+import re
+
+DEFAULT_MIN_BYTES = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+COMPRESSIBLE_TYPES = ("application/json",)
+
+ACCEPT_PATTERN = re.compile(r"\s*([a-z0-9*-]+)\s*(?:;\s*q\s*=\s*([0-9.]+))?", re.IGNORECASE)
+
+
+def brotli_available():
+    """Return True if the optional brotli package is installed."""
+    try:
+        import brotli  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def choose_encoding(accept_encoding, encodings=None):
+    """The preferred encoding the Accept-Encoding header allows, or None."""
+    accepted = {}
+    for part in (accept_encoding or "").split(","):
+        match = ACCEPT_PATTERN.match(part)
+        if match:
+            try:
+                accepted[match.group(1).lower()] = float(match.group(2)) if match.group(2) else 1.0
+            except ValueError:
+                continue
+    for encoding in encodings or ENCODINGS:
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+# Encodings in order of preference
+ENCODINGS = ("br", "gzip") if brotli_available() else ("gzip",)
+
+
+def compress(body, encoding):
+    if encoding == "br":
+        import brotli
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+def compressible(mimetype, content_encoding, min_bytes, length):
+    return mimetype in COMPRESSIBLE_TYPES and not content_encoding and length >= min_bytes
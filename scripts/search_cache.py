@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Result cache for vector store searches.
+
+Entries are keyed on the vector store and the normalized search parameters,
+bounded by entry count and approximate size, and evicted least-recently-used
+first or when their TTL expires. Entries for a store are dropped when the
+store is switched away from or its files or their attributes change.
+
+By default the cache lives in process memory. Set SEARCH_CACHE_DB to a path
+to share cached results between workers through a local SQLite database.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_MAX_ENTRIES = 1000
+DEFAULT_MAX_BYTES = 50 * 1024 * 1024
+DEFAULT_TTL = 300
+
+# How often to re-check a store's file counts for changes (seconds)
+STORE_VERSION_CHECK_INTERVAL = 30
+
+# Store metadata key bumped by the scripts that edit a store, so edits that keep its size are seen too
+STORE_VERSION_KEY = "content_version"
+
+
+def normalize_query(query):
+    """Lowercase and collapse whitespace so trivially different queries share an entry."""
+    return " ".join(query.lower().split())
+
+
+def make_key(vector_store_id, query, max_results=10, filters=None, rewrite_query=False, ranking_options=None):
+    """Build the cache key for a search."""
+    return json.dumps([
+        vector_store_id,
+        normalize_query(query),
+        max_results,
+        filters,
+        bool(rewrite_query),
+        ranking_options
+    ], sort_keys=True, separators=(",", ":"))
+
+
+def store_fingerprint(store):
+    """Summarize a vector store's contents so file additions and changes can be detected."""
+    file_counts = getattr(store, "file_counts", None)
+    metadata = getattr(store, "metadata", None) or {}
+    return json.dumps([
+        metadata.get(STORE_VERSION_KEY),
+        getattr(store, "usage_bytes", None),
+        getattr(file_counts, "total", None),
+        getattr(file_counts, "completed", None),
+        getattr(file_counts, "in_progress", None)
+    ])
+
+
+class MemoryBackend:
+    """In-process LRU storage."""
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+        return entry
+
+    def set(self, key, vector_store_id, value, size, expires_at):
+        self.delete(key)
+        self.entries[key] = (vector_store_id, value, size, expires_at)
+        self.total_bytes += size
+
+    def delete(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.total_bytes -= entry[2]
+
+    def pop_oldest(self):
+        key, entry = self.entries.popitem(last=False)
+        self.total_bytes -= entry[2]
+
+    def delete_store(self, vector_store_id):
+        keys = [key for key, entry in self.entries.items() if entry[0] == vector_store_id]
+        for key in keys:
+            self.delete(key)
+        return len(keys)
+
+    def clear(self):
+        self.entries.clear()
+        self.total_bytes = 0
+
+    def size(self):
+        return len(self.entries), self.total_bytes
+
+
+class SQLiteBackend:
+    """LRU storage in a local SQLite database shared by every worker that opens it."""
+
+    def __init__(self, db_path):
+        self.conn = sqlite3.connect(db_path, timeout=10, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS search_cache (
+                key TEXT PRIMARY KEY,
+                vector_store_id TEXT NOT NULL,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                expires_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS search_cache_store ON search_cache (vector_store_id)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS search_cache_lru ON search_cache (last_used)")
+
+    def get(self, key):
+        row = self.conn.execute(
+            "SELECT vector_store_id, value, size, expires_at FROM search_cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        self.conn.execute("UPDATE search_cache SET last_used = ? WHERE key = ?", (time.time(), key))
+        return row[0], json.loads(row[1]), row[2], row[3]
+
+    def set(self, key, vector_store_id, value, size, expires_at):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO search_cache VALUES (?, ?, ?, ?, ?, ?)",
+            (key, vector_store_id, json.dumps(value), size, expires_at, time.time())
+        )
+
+    def delete(self, key):
+        self.conn.execute("DELETE FROM search_cache WHERE key = ?", (key,))
+
+    def pop_oldest(self):
+        self.conn.execute(
+            "DELETE FROM search_cache WHERE key = (SELECT key FROM search_cache ORDER BY last_used LIMIT 1)"
+        )
+
+    def delete_store(self, vector_store_id):
+        return self.conn.execute(
+            "DELETE FROM search_cache WHERE vector_store_id = ?", (vector_store_id,)
+        ).rowcount
+
+    def clear(self):
+        self.conn.execute("DELETE FROM search_cache")
+
+    def size(self):
+        count, total_bytes = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM search_cache").fetchone()
+        return count, total_bytes
+
+
+class SearchCache:
+    """Bounded LRU + TTL cache of search results with per-store invalidation."""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES, ttl=DEFAULT_TTL, db_path=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.backend = SQLiteBackend(db_path) if db_path else MemoryBackend()
+        self.lock = threading.Lock()
+        self.store_versions = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        """Return the cached result for a key, or None."""
+        with self.lock:
+            entry = self.backend.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[3] < time.time():
+                self.backend.delete(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, vector_store_id, value):
+        """Cache a result, evicting least-recently-used entries to stay within bounds."""
+        size = len(json.dumps(value))
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            self.backend.set(key, vector_store_id, value, size, time.time() + self.ttl)
+            count, total_bytes = self.backend.size()
+            while count > self.max_entries or total_bytes > self.max_bytes:
+                self.backend.pop_oldest()
+                self.evictions += 1
+                count, total_bytes = self.backend.size()
+
+    def invalidate_store(self, vector_store_id):
+        """Drop every cached result for a vector store."""
+        with self.lock:
+            self._invalidate_store(vector_store_id)
+            self.store_versions.pop(vector_store_id, None)
+
+    def _invalidate_store(self, vector_store_id):
+        self.invalidations += self.backend.delete_store(vector_store_id)
+
+    def clear(self):
+        with self.lock:
+            self.backend.clear()
+            self.store_versions.clear()
+
+    def version_check_due(self, vector_store_id):
+        """Return True if the store's fingerprint has not been checked recently."""
+        with self.lock:
+            checked_at = self.store_versions.get(vector_store_id, (None, 0))[1]
+        return time.time() - checked_at >= STORE_VERSION_CHECK_INTERVAL
+
+    def update_store_version(self, vector_store_id, fingerprint):
+        """Record a store's fingerprint, invalidating its results if it changed. Returns True if invalidated."""
+        with self.lock:
+            previous = self.store_versions.get(vector_store_id, (None, 0))[0]
+            changed = previous is not None and previous != fingerprint
+            if changed:
+                self._invalidate_store(vector_store_id)
+            self.store_versions[vector_store_id] = (fingerprint, time.time())
+            return changed
+
+    def stats(self):
+        with self.lock:
+            count, total_bytes = self.backend.size()
+            lookups = self.hits + self.misses
+            return {
+                "backend": "sqlite" if isinstance(self.backend, SQLiteBackend) else "memory",
+                "entries": count,
+                "bytes": total_bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations
+            }
+
+
+def bump_store_version(client, vector_store_id):
+    """Record an edit in the store's metadata so every app's next version check drops its cached results."""
+    try:
+        store = client.beta.vector_stores.retrieve(vector_store_id=vector_store_id)
+        metadata = dict(getattr(store, "metadata", None) or {})
+        metadata[STORE_VERSION_KEY] = str(time.time_ns())
+        client.beta.vector_stores.update(vector_store_id=vector_store_id, metadata=metadata)
+    except Exception as e:
+        print(f"Warning: Could not bump vector store version: {e}")
+
+
+def invalidate_shared_cache(vector_store_id, client=None):
+    """Invalidate a store's results in the shared SQLite cache, if one is configured.
+
+    With `client`, also bump the store's version (`bump_store_version`) so
+    apps caching in process memory drop the store's results too.
+    """
+    if client is not None:
+        bump_store_version(client, vector_store_id)
+    db_path = os.getenv("SEARCH_CACHE_DB")
+    if not db_path:
+        return
+    try:
+        SearchCache(db_path=db_path).invalidate_store(vector_store_id)
+    except Exception as e:
+        print(f"Warning: Could not invalidate search cache: {e}")
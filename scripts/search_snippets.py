@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Query-aware snippets and field projection for search results.
+
+Search hits carry the full text of their chunk, which the browser and the CLI
+only show a few lines of. `extract_snippets` picks the passages of a hit that
+cover the most query terms and returns each as plain text with the character
+ranges of the matched terms, so callers can highlight them without trusting
+markup from the server. `project_results` keeps only the requested fields of
+each hit; `snippets`, `result_id` and `content_chars` are computed fields.
+
+`result_id` identifies a hit by its file and text, so its full content can be
+fetched later by repeating the search (usually a cache hit) and picking the
+hit with that ID.
+"""
+import bisect
+import hashlib
+import re
+from functools import lru_cache
+
+from bm25_index import tokenize
+
+SNIPPET_CHARS = 240
+MAX_SNIPPET_CHARS = 2000
+MAX_SNIPPETS = 2
+ELLIPSIS = "…"
+
+# Matches beyond this many are not considered when choosing passages
+MAX_MATCHES = 500
+
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i in is it of on or the this to was what when where which who why with you".split()
+)
+
+RESULT_FIELDS = ("file_id", "filename", "score", "rerank_score", "store_score", "vector_store_id", "attributes", "content")
+COMPUTED_FIELDS = ("snippets", "result_id", "content_chars")
+DEFAULT_FIELDS = ("result_id", "file_id", "filename", "score", "rerank_score", "vector_store_id", "attributes", "snippets", "content_chars")
+
+
+def item_text(item):
+    """The full text of one search hit, from the API (`content` parts) or the local mirror."""
+    content = item.get("content")
+    if isinstance(content, str):
+        return content
+    return "\n".join(part.get("text", "") for part in content or [] if isinstance(part, dict) and part.get("type") == "text")
+
+
+def result_id(item, text=None):
+    text = item_text(item) if text is None else text
+    digest = hashlib.sha1(f"{item.get('file_id', '')}\0{text}".encode("utf-8")).hexdigest()
+    return digest[:16]
+
+
+@lru_cache(maxsize=256)
+def term_pattern(query):
+    """Regex matching the query's terms as whole words in lowercased text, or None if the query has none."""
+    tokens = set(tokenize(query))
+    terms = {token for token in tokens if len(token) > 1 and token not in STOPWORDS} or tokens
+    if not terms:
+        return None
+    alternatives = "|".join(re.escape(term) for term in sorted(terms, key=len, reverse=True))
+    return re.compile(rf"(?<![a-z0-9])(?:{alternatives})(?![a-z0-9])")
+
+
+def snap_start(text, start):
+    """Move a passage start forward to the next word boundary."""
+    if start <= 0:
+        return 0
+    space = text.find(" ", start)
+    return space + 1 if 0 <= space < start + 20 else start
+
+
+def snap_end(text, end):
+    """Move a passage end back to the previous word boundary."""
+    if end >= len(text):
+        return len(text)
+    space = text.rfind(" ", end - 20, end)
+    return space if space > 0 else end
+
+
+def snippet(text, start, end, matches=()):
+    """The passage text[start:end] with ellipses where it was cut and its highlight ranges."""
+    prefix = ELLIPSIS if start > 0 else ""
+    suffix = ELLIPSIS if end < len(text) else ""
+    offset = len(prefix) - start
+    return {
+        "text": prefix + text[start:end] + suffix,
+        "highlights": [[match.start() + offset, match.end() + offset] for match in matches]
+    }
+
+
+def extract_snippets(text, query, max_chars=SNIPPET_CHARS, max_snippets=MAX_SNIPPETS):
+    """Up to `max_snippets` non-overlapping passages of about `max_chars`, in text order.
+
+    Passages are chosen by the number of distinct query terms they contain,
+    then by the number of matches. Without any match the opening of the text
+    is returned.
+    """
+    text = " ".join(text.split())
+    max_chars = min(max(20, max_chars), MAX_SNIPPET_CHARS)
+    pattern = term_pattern(query)
+    # Matching lowercased text is faster than a case-insensitive pattern; the rare text
+    # whose length changes when lowercased is matched as is
+    lowered = text.lower()
+    matches = list(pattern.finditer(lowered if len(lowered) == len(text) else text))[:MAX_MATCHES] if pattern else []
+    if not matches:
+        return [snippet(text, 0, snap_end(text, max_chars))] if text else []
+
+    starts = [match.start() for match in matches]
+    terms = [match.group(0) for match in matches]
+    candidates = []
+    previous = None
+    for i, match in enumerate(matches):
+        # Matches close to the previous candidate would give almost the same passage
+        if previous is not None and match.start() - previous < max_chars // 6:
+            continue
+        previous = match.start()
+        # Start the passage a little ahead of the match so it reads from the start of a phrase
+        start = snap_start(text, max(0, match.start() - max_chars // 3))
+        end = snap_end(text, min(len(text), start + max_chars))
+        first = bisect.bisect_left(starts, start)
+        last = bisect.bisect_left(starts, end)
+        while last > first and matches[last - 1].end() > end:
+            last -= 1
+        candidates.append((len(set(terms[first:last])), last - first, -start, start, end, matches[first:last]))
+
+    chosen = []
+    for _, _, _, start, end, inside in sorted(candidates, reverse=True):
+        if all(end <= other_start or start >= other_end for other_start, other_end, _ in chosen):
+            chosen.append((start, end, inside))
+            if len(chosen) == max_snippets:
+                break
+    return [snippet(text, start, end, inside) for start, end, inside in sorted(chosen, key=lambda passage: passage[0])]
+
+
+def check_fields(fields):
+    """Raise ValueError unless `fields` is a list of known field names."""
+    if not isinstance(fields, list) or not all(isinstance(field, str) for field in fields):
+        raise ValueError("fields must be a list of field names")
+    unknown = [field for field in fields if field not in RESULT_FIELDS + COMPUTED_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}. Choose from: {', '.join(RESULT_FIELDS + COMPUTED_FIELDS)}")
+
+
+def project_item(item, query, fields, snippet_chars=SNIPPET_CHARS):
+    text = item_text(item)
+    projected = {}
+    for field in fields:
+        if field == "snippets":
+            projected[field] = extract_snippets(text, query, snippet_chars)
+        elif field == "result_id":
+            projected[field] = result_id(item, text)
+        elif field == "content_chars":
+            projected[field] = len(text)
+        elif field in item:
+            projected[field] = item[field]
+    return projected
+
+
+def project_results(results, query, fields=DEFAULT_FIELDS, snippet_chars=SNIPPET_CHARS):
+    """A copy of a search response with only `fields` kept for each hit."""
+    return dict(results, data=[project_item(item, query, fields, snippet_chars) for item in results.get("data", [])])
+
+
+def find_result(results, wanted_id):
+    """The hit with the given result_id, or None."""
+    return next((item for item in results.get("data", []) if result_id(item) == wanted_id), None)
@@ -1,9 +1,18 @@
 #!/usr/bin/env python3
-import os
+import sys
 import json
+import time
 import argparse
-import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
+from openai_http import post_json
+from attribute_store import validate_filter
+from search_cache import normalize_query
+from request_metrics import percentile
+from search_snippets import extract_snippets, item_text, SNIPPET_CHARS
+from fanout_search import search_stores, merge_results, check_store_ids, unique_store_ids, NORMALIZERS, DEFAULT_NORMALIZE, DEFAULT_STORE_TIMEOUT
+
+DEFAULT_BATCH_CONCURRENCY = 8
 
 # Load environment variables from .env file
 load_dotenv()
@@ -18,12 +27,8 @@ def load_vector_store_info():
         return None
 
 def search_vector_store(vector_store_id, query, max_results=10, filters=None, rewrite_query=False, ranking_options=None):
-    """Search the vector store using a curl POST request."""
+    """Search the vector store over the shared pooled HTTP client."""
     try:
-        # Prepare the curl command
-        api_key = os.getenv("OPENAI_API_KEY")
-        url = f"https://api.openai.com/v1/vector_stores/{vector_store_id}/search"
-        
         # Build the request payload
         payload = {
             "query": query,
@@ -32,6 +37,8 @@ def search_vector_store(vector_store_id, query, max_results=10, filters=None, re
         
         # Add optional parameters if provided
         if filters:
+            # Catch malformed filters locally instead of spending a request on them
+            validate_filter(filters)
             payload["filters"] = filters
         
         if rewrite_query:
@@ -40,45 +47,102 @@ def search_vector_store(vector_store_id, query, max_results=10, filters=None, re
         if ranking_options:
             payload["ranking_options"] = ranking_options
         
-        # Convert payload to JSON string
-        payload_json = json.dumps(payload)
-        
-        # Build the curl command
-        curl_command = [
-            "curl", url,
-            "-X", "POST",
-            "-H", f"Authorization: Bearer {api_key}",
-            "-H", "Content-Type: application/json",
-            "-H", "OpenAI-Beta: assistants=v2",
-            "-d", payload_json
-        ]
-        
-        # Execute the curl command
-        result = subprocess.run(
-            curl_command,
-            capture_output=True,
-            text=True
-        )
-        
-        if result.returncode != 0:
-            print(f"Curl command failed: {result.stderr}")
-            return None
-        
-        # Parse the response
-        try:
-            response = json.loads(result.stdout)
-            return response
-        except json.JSONDecodeError:
-            print(f"Failed to parse response: {result.stdout}")
-            print(f"Raw response: {result.stdout}")
-            return None
+        return post_json(f"/vector_stores/{vector_store_id}/search", payload)
             
     except Exception as e:
         print(f"Error searching vector store: {e}")
         return None
 
-def display_search_results(results):
-    """Display the search results in a readable format."""
+def search_many(vector_store_id, queries, concurrency=DEFAULT_BATCH_CONCURRENCY, **search_kwargs):
+    """Run many searches concurrently, searching queries that normalize to the same text once.
+
+    Yields (positions, query, results, latency_ms) as each distinct query
+    completes, where positions are the indexes of that query in `queries`.
+    """
+    positions = {}
+    for i, query in enumerate(queries):
+        positions.setdefault(normalize_query(query), []).append(i)
+
+    def timed_search(query):
+        started = time.perf_counter()
+        results = search_vector_store(vector_store_id, query, **search_kwargs)
+        return results, (time.perf_counter() - started) * 1000
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = {executor.submit(timed_search, queries[indexes[0]]): indexes for indexes in positions.values()}
+        for future in as_completed(futures):
+            indexes = futures[future]
+            results, latency_ms = future.result()
+            yield indexes, queries[indexes[0]], results, latency_ms
+
+def search_many_stores(vector_store_ids, query, max_results=10, normalize=DEFAULT_NORMALIZE, timeout=DEFAULT_STORE_TIMEOUT, **search_kwargs):
+    """Search several vector stores concurrently and merge their hits into one top `max_results`.
+
+    Stores that fail or take longer than `timeout` seconds are left out and
+    listed with their status in the results' `stores`. Returns None if no
+    store answered.
+    """
+    outcomes = search_stores(
+        lambda store_id: search_vector_store(store_id, query, max_results=max_results, **search_kwargs),
+        unique_store_ids(vector_store_ids),
+        timeout
+    )
+    try:
+        return merge_results(query, outcomes, max_results, normalize)
+    except RuntimeError as e:
+        print(f"Error searching vector stores: {e}")
+        return None
+
+def run_queries_file(vector_store_id, path, output=None, concurrency=DEFAULT_BATCH_CONCURRENCY, **search_kwargs):
+    """Search every line of a file and report throughput; results go to `output` as JSON lines in input order."""
+    with open(path, "r") as f:
+        queries = [line.strip() for line in f if line.strip()]
+    if not queries:
+        print(f"No queries found in {path}")
+        return
+
+    started = time.perf_counter()
+    ordered = [None] * len(queries)
+    latencies = []
+    failed = 0
+    for done, (indexes, query, results, latency_ms) in enumerate(
+            search_many(vector_store_id, queries, concurrency=concurrency, **search_kwargs), 1):
+        latencies.append(latency_ms)
+        failed += results is None
+        for i in indexes:
+            ordered[i] = {"query": queries[i], "latency_ms": round(latency_ms, 2), "results": results}
+        if not output:
+            count = len(results.get("data", [])) if results else "error"
+            print(f"[{done}] {query!r}: {count} results in {latency_ms:.0f} ms")
+
+    elapsed = time.perf_counter() - started
+    if output:
+        with open(output, "w") as f:
+            for record in ordered:
+                f.write(json.dumps(record) + "\n")
+        print(f"Results written to {output}")
+
+    print(f"\n{len(queries)} queries ({len(latencies)} unique, {failed} failed) in {elapsed:.1f}s: "
+          f"{len(queries) / elapsed:.1f} queries/s")
+    print(f"Latency p50 {percentile(latencies, 0.5):.0f} ms, p99 {percentile(latencies, 0.99):.0f} ms")
+
+def highlight(snippet, bold):
+    """Snippet text with its matched terms in bold (on a terminal) or between asterisks."""
+    start_mark, end_mark = ("\033[1m", "\033[0m") if bold else ("*", "*")
+    text = snippet["text"]
+    parts = []
+    position = 0
+    for start, end in snippet["highlights"]:
+        parts.append(text[position:start] + start_mark + text[start:end] + end_mark)
+        position = end
+    return "".join(parts) + text[position:]
+
+def display_search_results(results, full=False, snippet_chars=SNIPPET_CHARS):
+    """Display the search results in a readable format.
+    
+    Each hit's content is shown as the passages that best match the query,
+    with the matched terms highlighted, or in full with `full=True`.
+    """
     if not results:
         print("No results found or error occurred.")
         return
@@ -87,13 +151,24 @@ def display_search_results(results):
     print(f"Number of results: {len(results.get('data', []))}")
     print(f"Has more: {results.get('has_more', False)}")
     
+    # Searches over several stores report how each store did
+    for store in results.get('stores', []):
+        status = f"{store.get('hits', 0)} results" if store['status'] == 'ok' else store['status']
+        error = f" ({store['error']})" if store.get('error') else ""
+        print(f"  Store {store['vector_store_id']}: {status} in {store['ms']:.0f} ms{error}")
+    
     print("\n=== SEARCH RESULTS ===\n")
     
+    query = results.get('search_query') or ''
+    bold = sys.stdout.isatty()
+    
     for i, item in enumerate(results.get('data', []), 1):
         print(f"Result {i}:")
         print(f"  File ID: {item.get('file_id', 'N/A')}")
         print(f"  Filename: {item.get('filename', 'N/A')}")
         print(f"  Score: {item.get('score', 'N/A')}")
+        if 'vector_store_id' in item:
+            print(f"  Vector store: {item['vector_store_id']} (store score {item.get('store_score', 'N/A')})")
         
         # Display attributes if present
         if 'attributes' in item and item['attributes']:
@@ -101,36 +176,58 @@ def display_search_results(results):
             for key, value in item['attributes'].items():
                 print(f"    {key}: {value}")
         
-        # Display content if present
-        if 'content' in item and item['content']:
+        # Display content if present; results from the app may carry snippets instead
+        if item.get('snippets') and not full:
             print("  Content:")
-            for content_item in item['content']:
-                if content_item.get('type') == 'text':
-                    # Truncate long text for display
-                    text = content_item.get('text', '')
-                    if len(text) > 200:
-                        text = text[:200] + "..."
-                    print(f"    {text}")
+            for snippet in item['snippets']:
+                print(f"    {highlight(snippet, bold)}")
+        elif 'content' in item and item['content']:
+            print("  Content:")
+            if full:
+                print(f"    {item_text(item)}")
+            else:
+                for snippet in extract_snippets(item_text(item), query, snippet_chars):
+                    print(f"    {highlight(snippet, bold)}")
         
         print()  # Empty line between results
 
 def main():
     parser = argparse.ArgumentParser(description="Search a vector store")
-    parser.add_argument("query", help="The search query")
+    parser.add_argument("query", nargs="?", help="The search query")
+    parser.add_argument("--queries-file", help="Search every line of this file instead of a single query")
+    parser.add_argument("--output", help="With --queries-file, write results to this JSON lines file")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_BATCH_CONCURRENCY, help=f"With --queries-file, searches in flight (default: {DEFAULT_BATCH_CONCURRENCY})")
     parser.add_argument("--max-results", type=int, default=10, help="Maximum number of results (1-50)")
     parser.add_argument("--filter", help="JSON string of filter criteria")
     parser.add_argument("--rewrite-query", action="store_true", help="Enable query rewriting")
     parser.add_argument("--score-threshold", type=float, help="Score threshold (0.0-1.0)")
     parser.add_argument("--ranker", choices=["auto", "default-2024-11-15"], help="Ranker to use")
+    parser.add_argument("--vector-store-ids", nargs="+", metavar="ID", help="Search these vector stores and merge their results instead of the one in vector_store_info.json")
+    parser.add_argument("--normalize", choices=NORMALIZERS, default=DEFAULT_NORMALIZE, help=f"With --vector-store-ids, how scores are made comparable across stores (default: {DEFAULT_NORMALIZE})")
+    parser.add_argument("--store-timeout", type=float, default=DEFAULT_STORE_TIMEOUT, help=f"With --vector-store-ids, seconds each store has to answer (default: {DEFAULT_STORE_TIMEOUT:g})")
+    parser.add_argument("--full", action="store_true", help="Show the full content of each result instead of snippets")
+    parser.add_argument("--snippet-chars", type=int, default=SNIPPET_CHARS, help=f"Length of each snippet (default: {SNIPPET_CHARS})")
     
     args = parser.parse_args()
     
-    # Load vector store info
-    vector_store_info = load_vector_store_info()
-    if not vector_store_info:
-        return
+    if not args.query and not args.queries_file:
+        parser.error("a query or --queries-file is required")
     
-    vector_store_id = vector_store_info["vector_store_id"]
+    if args.vector_store_ids:
+        if args.queries_file:
+            parser.error("--vector-store-ids cannot be combined with --queries-file")
+        try:
+            check_store_ids(args.vector_store_ids)
+        except ValueError as e:
+            parser.error(str(e))
+        vector_store_id = None
+    else:
+        # Load vector store info
+        vector_store_info = load_vector_store_info()
+        if not vector_store_info:
+            return
+        
+        vector_store_id = vector_store_info["vector_store_id"]
     
     # Parse filter if provided
     filters = None
@@ -155,6 +252,34 @@ def main():
     # Only include ranking_options if not empty
     ranking_options = ranking_options if ranking_options else None
     
+    if args.queries_file:
+        run_queries_file(
+            vector_store_id,
+            args.queries_file,
+            output=args.output,
+            concurrency=args.concurrency,
+            max_results=args.max_results,
+            filters=filters,
+            rewrite_query=args.rewrite_query,
+            ranking_options=ranking_options
+        )
+        return
+    
+    if args.vector_store_ids:
+        print(f"Searching {len(args.vector_store_ids)} vector stores for: {args.query}")
+        results = search_many_stores(
+            args.vector_store_ids,
+            args.query,
+            max_results=args.max_results,
+            normalize=args.normalize,
+            timeout=args.store_timeout,
+            filters=filters,
+            rewrite_query=args.rewrite_query,
+            ranking_options=ranking_options
+        )
+        display_search_results(results, full=args.full, snippet_chars=args.snippet_chars)
+        return
+    
     # Perform the search
     print(f"Searching vector store {vector_store_id} for: {args.query}")
     results = search_vector_store(
@@ -167,7 +292,7 @@ def main():
     )
     
     # Display the results
-    display_search_results(results)
+    display_search_results(results, full=args.full, snippet_chars=args.snippet_chars)
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
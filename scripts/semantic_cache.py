@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Semantic answer cache for chat questions.
+
+Each answered question is embedded and kept per vector store. A new question
+is embedded and compared against the stored ones with a single vectorized
+cosine-similarity product; if the best match is above the threshold, its
+answer is reused instead of starting an assistant run.
+
+Embedders are pluggable: `openai` uses the embeddings API and `hashing` is a
+deterministic local embedder for tests and offline development.
+"""
+import hashlib
+import re
+import threading
+import time
+
+import numpy as np
+
+DEFAULT_THRESHOLD = 0.92
+DEFAULT_MAX_ENTRIES_PER_STORE = 5000
+DEFAULT_TTL = 24 * 60 * 60
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+class HashingEmbedder:
+    """Deterministic bag-of-words embedder using feature hashing of unigrams and bigrams."""
+
+    name = "hashing"
+
+    def __init__(self, dimensions=512):
+        self.dimensions = dimensions
+
+    def embed(self, texts):
+        vectors = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            tokens = TOKEN_PATTERN.findall(text.lower())
+            features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+            for feature in features:
+                digest = hashlib.md5(feature.encode("utf-8")).digest()
+                index = int.from_bytes(digest[:4], "little") % self.dimensions
+                sign = 1.0 if digest[4] & 1 else -1.0
+                vectors[row, index] += sign
+        return normalize_rows(vectors)
+
+
+class OpenAIEmbedder:
+    """Embedder backed by the OpenAI embeddings API."""
+
+    name = "openai"
+
+    def __init__(self, client, model="text-embedding-3-small"):
+        self.client = client
+        self.model = model
+
+    def embed(self, texts):
+        response = self.client.embeddings.create(model=self.model, input=list(texts))
+        vectors = np.array([item.embedding for item in response.data], dtype=np.float32)
+        return normalize_rows(vectors)
+
+
+EMBEDDERS = {
+    "hashing": HashingEmbedder,
+    "openai": OpenAIEmbedder,
+}
+
+
+def get_embedder(name, client=None):
+    """Create an embedder by name."""
+    if name not in EMBEDDERS:
+        raise ValueError(f"Unknown embedder '{name}'. Choose from: {', '.join(sorted(EMBEDDERS))}")
+    if name == "openai":
+        return OpenAIEmbedder(client)
+    return EMBEDDERS[name]()
+
+
+def normalize_rows(vectors):
+    """Scale each row to unit length so dot products are cosine similarities."""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class StoreEntries:
+    """Question embeddings and answers for one vector store, in a growable matrix."""
+
+    def __init__(self, dimensions, capacity=64):
+        self.vectors = np.zeros((capacity, dimensions), dtype=np.float32)
+        self.questions = []
+        self.answers = []
+        self.created_at = []
+
+    def __len__(self):
+        return len(self.answers)
+
+    def append(self, question, answer, embedding):
+        if len(self) == self.vectors.shape[0]:
+            grown = np.zeros((self.vectors.shape[0] * 2, self.vectors.shape[1]), dtype=np.float32)
+            grown[:len(self)] = self.vectors
+            self.vectors = grown
+        self.vectors[len(self)] = embedding
+        self.questions.append(question)
+        self.answers.append(answer)
+        self.created_at.append(time.time())
+
+    def drop_oldest(self, count):
+        """Remove the `count` oldest entries."""
+        remaining = len(self) - count
+        self.vectors[:remaining] = self.vectors[count:len(self)]
+        del self.questions[:count]
+        del self.answers[:count]
+        del self.created_at[:count]
+
+
+class SemanticCache:
+    """Per-store nearest-question answer cache."""
+
+    def __init__(self, embedder, threshold=DEFAULT_THRESHOLD,
+                 max_entries_per_store=DEFAULT_MAX_ENTRIES_PER_STORE, ttl=DEFAULT_TTL):
+        self.embedder = embedder
+        self.threshold = threshold
+        self.max_entries_per_store = max_entries_per_store
+        self.ttl = ttl
+        self.stores = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def embed(self, question):
+        """Embed a single question."""
+        return self.embedder.embed([question])[0]
+
+    def lookup(self, vector_store_id, embedding):
+        """Return (answer, similarity, cached_question) for the closest question above the threshold, or None."""
+        with self.lock:
+            entries = self.stores.get(vector_store_id)
+            if entries is not None:
+                self.expire(entries)
+            if not entries:
+                self.misses += 1
+                return None
+
+            similarities = entries.vectors[:len(entries)] @ embedding
+            best = int(np.argmax(similarities))
+            similarity = float(similarities[best])
+            if similarity < self.threshold:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            return entries.answers[best], similarity, entries.questions[best]
+
+    def add(self, vector_store_id, question, answer, embedding):
+        """Remember the answer to a question for a vector store."""
+        with self.lock:
+            entries = self.stores.get(vector_store_id)
+            if entries is None:
+                entries = self.stores[vector_store_id] = StoreEntries(embedding.shape[0])
+            entries.append(question, answer, embedding)
+            overflow = len(entries) - self.max_entries_per_store
+            if overflow > 0:
+                entries.drop_oldest(overflow)
+                self.evictions += overflow
+
+    def expire(self, entries):
+        """Drop entries older than the TTL (entries are kept in insertion order)."""
+        cutoff = time.time() - self.ttl
+        expired = 0
+        while expired < len(entries) and entries.created_at[expired] < cutoff:
+            expired += 1
+        if expired:
+            entries.drop_oldest(expired)
+            self.evictions += expired
+
+    def invalidate_store(self, vector_store_id):
+        """Forget every answer for a vector store."""
+        with self.lock:
+            entries = self.stores.pop(vector_store_id, None)
+            if entries:
+                self.evictions += len(entries)
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "embedder": self.embedder.name,
+                "threshold": self.threshold,
+                "entries": {store_id: len(entries) for store_id, entries in self.stores.items()},
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions
+            }
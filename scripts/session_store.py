@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+Server-side chat sessions and a warm pool of pre-created threads.
+
+A browser session (identified by a cookie) maps to the assistant thread it
+is chatting in, so the browser no longer carries thread and assistant IDs.
+Sessions live in an in-process LRU by default. Set SESSION_DB to a path to
+keep them in a local SQLite database shared by all workers. Sessions idle
+for longer than the TTL are expired by a background sweeper, which can also
+delete their threads.
+
+Creating a thread is an API round trip, so a small pool of threads is
+created ahead of time (`WarmThreadPool`) and refilled in the background.
+Starting a conversation takes a thread from the pool and only falls back to
+creating one inline when the pool is empty.
+"""
+import asyncio
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+
+DEFAULT_MAX_SESSIONS = 10000
+DEFAULT_SESSION_TTL = 24 * 60 * 60
+DEFAULT_POOL_SIZE = 4
+
+FIELDS = ("thread_id", "assistant_id", "vector_store_id", "messages", "created_at", "last_used")
+
+
+def new_session_id():
+    return secrets.token_urlsafe(24)
+
+
+class MemorySessionBackend:
+    """In-process LRU storage."""
+
+    def __init__(self):
+        self.sessions = OrderedDict()
+
+    def get(self, session_id):
+        session = self.sessions.get(session_id)
+        if session is not None:
+            self.sessions.move_to_end(session_id)
+        return session
+
+    def set(self, session_id, session):
+        self.sessions[session_id] = session
+        self.sessions.move_to_end(session_id)
+
+    def delete(self, session_id):
+        self.sessions.pop(session_id, None)
+
+    def pop_oldest(self):
+        return self.sessions.popitem(last=False)[1]
+
+    def pop_idle(self, cutoff):
+        idle = [session_id for session_id, session in self.sessions.items() if session["last_used"] < cutoff]
+        return [self.sessions.pop(session_id) for session_id in idle]
+
+    def count(self):
+        return len(self.sessions)
+
+
+class SQLiteSessionBackend:
+    """Session storage in a local SQLite database shared by every worker that opens it."""
+
+    def __init__(self, db_path):
+        self.conn = sqlite3.connect(db_path, timeout=10, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                thread_id TEXT NOT NULL,
+                assistant_id TEXT,
+                vector_store_id TEXT,
+                messages INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS sessions_last_used ON sessions (last_used)")
+
+    def get(self, session_id):
+        row = self.conn.execute(
+            f"SELECT {', '.join(FIELDS)} FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        return dict(zip(FIELDS, row)) if row else None
+
+    def set(self, session_id, session):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (session_id,) + tuple(session[field] for field in FIELDS)
+        )
+
+    def delete(self, session_id):
+        self.conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def pop_oldest(self):
+        row = self.conn.execute(
+            f"DELETE FROM sessions WHERE session_id = (SELECT session_id FROM sessions ORDER BY last_used LIMIT 1) "
+            f"RETURNING {', '.join(FIELDS)}"
+        ).fetchone()
+        return dict(zip(FIELDS, row)) if row else None
+
+    def pop_idle(self, cutoff):
+        rows = self.conn.execute(
+            f"DELETE FROM sessions WHERE last_used < ? RETURNING {', '.join(FIELDS)}", (cutoff,)
+        ).fetchall()
+        return [dict(zip(FIELDS, row)) for row in rows]
+
+    def count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+
+class SessionStore:
+    """Browser session -> chat thread mapping, bounded in size and expired after a period of inactivity."""
+
+    def __init__(self, max_sessions=DEFAULT_MAX_SESSIONS, ttl=DEFAULT_SESSION_TTL, db_path=None):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.backend = SQLiteSessionBackend(db_path) if db_path else MemorySessionBackend()
+        self.lock = threading.Lock()
+        self.evicted = []
+        self.expired = 0
+
+    def get(self, session_id):
+        """Return a session and mark it used, or None if it is unknown or idle past the TTL."""
+        if not session_id:
+            return None
+        now = time.time()
+        with self.lock:
+            session = self.backend.get(session_id)
+            if session is None:
+                return None
+            if session["last_used"] < now - self.ttl:
+                self.backend.delete(session_id)
+                self.evicted.append(session)
+                self.expired += 1
+                return None
+            session = dict(session, last_used=now)
+            self.backend.set(session_id, session)
+            return session
+
+    def start(self, session_id, thread_id, assistant_id, vector_store_id):
+        """Point a session at a new conversation thread; returns the session's previous session, if any."""
+        now = time.time()
+        session = {
+            "thread_id": thread_id,
+            "assistant_id": assistant_id,
+            "vector_store_id": vector_store_id,
+            "messages": 0,
+            "created_at": now,
+            "last_used": now
+        }
+        with self.lock:
+            previous = self.backend.get(session_id)
+            self.backend.set(session_id, session)
+            while self.backend.count() > self.max_sessions:
+                self.evicted.append(self.backend.pop_oldest())
+        return previous
+
+    def record_message(self, session_id):
+        with self.lock:
+            session = self.backend.get(session_id)
+            if session is not None:
+                self.backend.set(session_id, dict(session, messages=session["messages"] + 1, last_used=time.time()))
+
+    def sweep(self):
+        """Remove sessions idle past the TTL; returns them with any sessions evicted since the last sweep."""
+        with self.lock:
+            idle = self.backend.pop_idle(time.time() - self.ttl)
+            self.expired += len(idle)
+            removed, self.evicted = self.evicted + idle, []
+        return removed
+
+    def stats(self):
+        with self.lock:
+            return {
+                "sessions": self.backend.count(),
+                "max_sessions": self.max_sessions,
+                "ttl": self.ttl,
+                "expired": self.expired,
+                "backend": "sqlite" if isinstance(self.backend, SQLiteSessionBackend) else "memory"
+            }
+
+
+class WarmThreadPool:
+    """Threads created ahead of time on a background thread so starting a conversation needs no API call."""
+
+    def __init__(self, create_thread, size=DEFAULT_POOL_SIZE):
+        self.create_thread = create_thread
+        self.size = size
+        self.threads = deque()
+        self.lock = threading.Lock()
+        self.refilling = False
+        self.hits = 0
+        self.misses = 0
+
+    def take(self):
+        """Return a pre-created thread ID (or None if the pool is empty) and top the pool back up."""
+        with self.lock:
+            thread_id = self.threads.popleft() if self.threads else None
+            if thread_id:
+                self.hits += 1
+            else:
+                self.misses += 1
+        self.refill()
+        return thread_id
+
+    def refill(self):
+        """Start filling the pool in the background unless a refill is already running."""
+        if self.size <= 0:
+            return
+        with self.lock:
+            if self.refilling or len(self.threads) >= self.size:
+                return
+            self.refilling = True
+        threading.Thread(target=self.fill, daemon=True).start()
+
+    def fill(self):
+        try:
+            while True:
+                with self.lock:
+                    if len(self.threads) >= self.size:
+                        return
+                thread_id = self.create_thread()
+                with self.lock:
+                    self.threads.append(thread_id)
+        except Exception as e:
+            print(f"Warning: Could not pre-create a thread: {e}")
+        finally:
+            with self.lock:
+                self.refilling = False
+
+    def stats(self):
+        with self.lock:
+            return {"size": self.size, "ready": len(self.threads), "hits": self.hits, "misses": self.misses}
+
+
+class AsyncWarmThreadPool(WarmThreadPool):
+    """WarmThreadPool for an event loop; `create_thread` is a coroutine function."""
+
+    def __init__(self, create_thread, size=DEFAULT_POOL_SIZE):
+        super().__init__(create_thread, size)
+        self.task = None
+
+    def refill(self):
+        if self.size <= 0 or self.refilling or len(self.threads) >= self.size:
+            return
+        self.refilling = True
+        self.task = asyncio.get_running_loop().create_task(self.fill())
+
+    async def fill(self):
+        try:
+            while len(self.threads) < self.size:
+                thread_id = await self.create_thread()
+                self.threads.append(thread_id)
+        except Exception as e:
+            print(f"Warning: Could not pre-create a thread: {e}")
+        finally:
+            self.refilling = False
+
+
+def start_sweeper(store, interval, on_removed=None):
+    """Sweep idle sessions every `interval` seconds on a daemon thread, passing removed sessions to `on_removed`."""
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                removed = store.sweep()
+                if removed and on_removed:
+                    on_removed(removed)
+            except Exception as e:
+                print(f"Warning: Session sweep failed: {e}")
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
+async def run_sweeper_async(store, interval, on_removed=None):
+    """Event-loop version of start_sweeper; `on_removed` is a coroutine function. Runs until cancelled."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            removed = store.sweep()
+            if removed and on_removed:
+                await on_removed(removed)
+        except Exception as e:
+            print(f"Warning: Session sweep failed: {e}")
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Request coalescing for identical in-flight work.
+
+When several requests need the same result at the same time (the same
+search, or the same opening question to the same assistant), the first one
+becomes the leader and does the work; the others wait for the leader's
+result instead of issuing their own upstream calls. Nothing is kept once the
+leader finishes, so this complements the caches rather than replacing them:
+the caches serve repeats, coalescing covers the window before the first
+result has been cached.
+
+`do(key, fn)` covers the common case. Work that finishes outside the call
+that started it, such as a streamed reply, uses `begin` and `finish`
+directly; the leader must always call `finish`, with an error if it gave up.
+"""
+import asyncio
+import threading
+
+
+class Flight:
+    """The outcome of one in-flight call, shared by its leader and followers."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.finished = False
+        self.value = None
+        self.error = None
+
+    def resolve(self):
+        self.done.set()
+
+    def wait(self):
+        """Block until the leader finishes; return its value or raise its error."""
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+class AsyncFlight(Flight):
+    """Flight for callers on one event loop."""
+
+    def __init__(self):
+        super().__init__()
+        self.future = asyncio.get_running_loop().create_future()
+
+    def resolve(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+    async def wait(self):
+        # Shielded so a follower that is cancelled does not cancel the flight for the others
+        await asyncio.shield(self.future)
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+class SingleFlight:
+    """Coalesce concurrent calls with the same key across threads."""
+
+    flight_class = Flight
+
+    def __init__(self):
+        self.flights = {}
+        self.lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+
+    def begin(self, key):
+        """Return (flight, leader). The leader must call finish(); followers wait on the flight."""
+        with self.lock:
+            flight = self.flights.get(key)
+            if flight is not None:
+                self.coalesced += 1
+                return flight, False
+            flight = self.flights[key] = self.flight_class()
+            self.leaders += 1
+            return flight, True
+
+    def finish(self, key, flight, value=None, error=None):
+        """Publish the leader's result to its followers; later calls for the same flight are ignored."""
+        with self.lock:
+            if flight.finished:
+                return
+            flight.finished = True
+            flight.value = value
+            flight.error = error
+            if self.flights.get(key) is flight:
+                del self.flights[key]
+        flight.resolve()
+
+    def do(self, key, fn):
+        """Return (value, shared), calling `fn()` only if no identical call is in flight."""
+        flight, leader = self.begin(key)
+        if not leader:
+            return flight.wait(), True
+        try:
+            value = fn()
+        except BaseException as e:
+            self.finish(key, flight, error=failure(e))
+            raise
+        self.finish(key, flight, value)
+        return value, False
+
+    def stats(self):
+        with self.lock:
+            return {"leaders": self.leaders, "coalesced": self.coalesced, "in_flight": len(self.flights)}
+
+
+class AsyncSingleFlight(SingleFlight):
+    """SingleFlight for coroutines on one event loop; `fn` is a coroutine function and `wait` is awaited."""
+
+    flight_class = AsyncFlight
+
+    async def do(self, key, fn):
+        flight, leader = self.begin(key)
+        if not leader:
+            return await flight.wait(), True
+        try:
+            value = await fn()
+        except BaseException as e:
+            self.finish(key, flight, error=failure(e))
+            raise
+        self.finish(key, flight, value)
+        return value, False
+
+
+def failure(error):
+    """The error followers see when the leader stopped with `error`."""
+    if isinstance(error, Exception):
+        return error
+    # Cancellation or generator exit only concerns the leader's own request
+    return RuntimeError("Coalesced call was interrupted")
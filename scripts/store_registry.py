@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Default vector store and per-store assistants, shared safely between workers.
+
+`vector_store_info.json` holds the deployment's default vector store and
+`assistant_info.json` the assistant created for each store:
+
+    {"assistants": {"vs_abc": "asst_123", "vs_def": "asst_456"}}
+
+Switching stores used to overwrite the default and delete the assistant
+file, so every user moved to the new store and the next chat in any store
+created a new assistant. Now a store is chosen per request (`select`) and
+each store keeps its assistant, so moving between stores reuses the
+assistants already created for them.
+
+Both files are written atomically (a temporary file in the same directory,
+flushed to disk, then renamed over the original) while holding an exclusive
+lock on a `<file>.lock` sidecar, so readers never see a half-written file and
+read-modify-write updates from several workers do not lose each other's
+changes. Reads take no lock and only re-read a file when it has been
+replaced, so a new default store reaches every worker on its next request.
+
+A file from before the registry, `{"assistant_id": ...}`, is read as the
+assistant of the default store.
+"""
+import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: threads in this process are still serialized
+    fcntl = None
+
+VECTOR_STORE_INFO_PATH = "vector_store_info.json"
+ASSISTANT_INFO_PATH = "assistant_info.json"
+
+# Where a client names its vector store: a session's choice, or a tenant's on every request
+STORE_COOKIE = "vector_store"
+STORE_HEADER = "X-Vector-Store-Id"
+
+_process_lock = threading.Lock()
+
+
+def write_json_atomic(path, data):
+    """Replace `path` with `data` as JSON so readers see either the old or the new file, never a partial one."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+@contextmanager
+def file_lock(path):
+    """Hold an exclusive lock for updating `path`, across threads and processes."""
+    with _process_lock:
+        if fcntl is None:
+            yield
+            return
+        with open(f"{path}.lock", "a") as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+class JsonFile:
+    """A small JSON object on disk, re-read only when the file changes."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.signature = None
+        self.data = {}
+
+    def load(self):
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            print(f"Warning: Could not read {self.path}: {e}")
+            return {}
+
+    def read(self):
+        """The file's current contents ({} if it is missing or unreadable)."""
+        try:
+            stat = os.stat(self.path)
+            signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            signature = None
+        with self.lock:
+            if signature != self.signature:
+                self.data = self.load() if signature else {}
+                self.signature = signature
+            return self.data
+
+    def update(self, change):
+        """Apply `change(data)` to the latest contents and write the result atomically; returns what `change` returned."""
+        with file_lock(self.path):
+            data = self.load()
+            result = change(data)
+            write_json_atomic(self.path, data)
+            return result
+
+
+class StoreRegistry:
+    """The default vector store and the assistant created for each store."""
+
+    def __init__(self, store_path=VECTOR_STORE_INFO_PATH, assistant_path=ASSISTANT_INFO_PATH):
+        self.store_file = JsonFile(store_path)
+        self.assistant_file = JsonFile(assistant_path)
+
+    def default_store(self):
+        return self.store_file.read().get("vector_store_id")
+
+    def select(self, request, data=None):
+        """The vector store a request works on: the one it names, else its tenant's or session's choice, else the default."""
+        return (
+            (data or {}).get("vector_store_id")
+            or request.headers.get(STORE_HEADER)
+            or request.cookies.get(STORE_COOKIE)
+            or self.default_store()
+        )
+
+    def set_default_store(self, store_id):
+        def change(data):
+            data["vector_store_id"] = store_id
+        self.store_file.update(change)
+
+    def assistant_for(self, store_id):
+        """The assistant recorded for a store, or None."""
+        data = self.assistant_file.read()
+        if "assistants" in data:
+            return data["assistants"].get(store_id)
+        # Written before the registry, for what was then the only store
+        return data.get("assistant_id") if store_id == self.default_store() else None
+
+    def record_assistant(self, store_id, assistant_id, replaces=None):
+        """Record a store's new assistant, unless another worker recorded one since `replaces` was read.
+
+        Returns the assistant now recorded for the store; if it is not
+        `assistant_id`, the caller lost the race and should use the returned
+        one instead.
+        """
+        default_store = self.default_store()
+
+        def change(data):
+            assistants = data.setdefault("assistants", {})
+            legacy = data.pop("assistant_id", None)
+            if legacy and default_store:
+                assistants.setdefault(default_store, legacy)
+            current = assistants.get(store_id)
+            if current and current != replaces:
+                return current
+            assistants[store_id] = assistant_id
+            return assistant_id
+        return self.assistant_file.update(change)
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+import os
+import glob
+import json
+import time
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+import openai
+from bulk_upload import bulk_upload, plan_uploads, load_manifest, save_manifest, MANIFEST_PATH, DEFAULT_CONCURRENCY
+from create_vector_store import add_files_to_vector_store
+from search_cache import invalidate_shared_cache
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Initialize OpenAI client
+client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+def load_vector_store_info():
+    """Load the vector store information from the JSON file."""
+    try:
+        with open("vector_store_info.json", "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        print("Error: vector_store_info.json not found. Please run create_vector_store.py first.")
+        return None
+
+SYNC_STATE_PATH = "sync_state.json"
+
+def load_sync_state():
+    """Load the record of the last successful sync per vector store."""
+    try:
+        with open(SYNC_STATE_PATH, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def save_sync_state(state):
+    tmp_path = f"{SYNC_STATE_PATH}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, SYNC_STATE_PATH)
+
+def file_set_digest(file_ids):
+    """Fingerprint a set of file IDs."""
+    return hashlib.sha256("\n".join(sorted(file_ids)).encode("utf-8")).hexdigest()
+
+def store_matches_last_sync(vector_store_id, desired_ids, sync_state):
+    """Return True if the store still looks exactly as the last sync left it."""
+    last = sync_state.get(vector_store_id)
+    if not last or last["digest"] != file_set_digest(desired_ids):
+        return False
+    store = client.beta.vector_stores.retrieve(vector_store_id=vector_store_id)
+    counts = store.file_counts
+    return counts.total == len(desired_ids) and counts.failed == 0 and counts.cancelled == 0
+
+def list_store_file_ids(vector_store_id):
+    """Return the IDs of every file attached to the vector store, walking all pages."""
+    file_ids = set()
+    for store_file in client.beta.vector_stores.files.list(vector_store_id=vector_store_id, limit=100):
+        file_ids.add(store_file.id)
+    return file_ids
+
+def upload_records(entry):
+    """A manifest entry's current upload and its superseded ones, each with the "vector_stores" this manifest attached it to."""
+    return [entry] + entry.get("superseded", [])
+
+def entry_stores(entry):
+    """Every vector store this manifest attached one of the entry's uploads to."""
+    return {store for record in upload_records(entry) for store in record.get("vector_stores", [])}
+
+def owned_file_ids(manifest, prefix, vector_store_id):
+    """IDs of the files under `prefix` that this manifest attached to the vector store."""
+    return {
+        record["file_id"]
+        for path, entry in manifest.items() if path.startswith(prefix)
+        for record in upload_records(entry) if vector_store_id in record.get("vector_stores", [])
+    }
+
+def record_attachments(manifest, prefix, vector_store_id, attached, detached):
+    """Note which files are now attached to the store; returns the detached file IDs no store uses any more."""
+    unused = set()
+    for path, entry in list(manifest.items()):
+        if not path.startswith(prefix):
+            continue
+        for record in upload_records(entry):
+            stores = record.setdefault("vector_stores", [])
+            if record["file_id"] in detached and vector_store_id in stores:
+                stores.remove(vector_store_id)
+                if not stores:
+                    unused.add(record["file_id"])
+            elif record["file_id"] in attached and vector_store_id not in stores:
+                stores.append(vector_store_id)
+        superseded = [record for record in entry.get("superseded", []) if record["vector_stores"]]
+        if superseded:
+            entry["superseded"] = superseded
+        else:
+            entry.pop("superseded", None)
+    return unused
+
+def detach_files(vector_store_id, file_ids, concurrency):
+    """Detach files from the vector store; returns the IDs that were detached."""
+    def detach(file_id):
+        try:
+            client.beta.vector_stores.files.delete(vector_store_id=vector_store_id, file_id=file_id)
+            return file_id
+        except Exception as e:
+            print(f"Error detaching file {file_id}: {e}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return {file_id for file_id in executor.map(detach, file_ids) if file_id}
+
+def delete_files_from_storage(file_ids, concurrency):
+    """Delete file objects from file storage."""
+    def delete(file_id):
+        try:
+            client.files.delete(file_id)
+        except Exception as e:
+            print(f"Error deleting file {file_id}: {e}")
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(delete, file_ids))
+
+def sync(vector_store_id, chunks_dir, manifest_path=MANIFEST_PATH, concurrency=DEFAULT_CONCURRENCY,
+         delete_files=False, dry_run=False, full=False, prune=False):
+    """Bring the vector store in line with the chunk directory and return the applied delta.
+
+    Only files this manifest attached to the store are detached; other files
+    in the store are left alone unless `prune` is set. With `delete_files`,
+    detached files are deleted from file storage once no store this manifest
+    attached them to still holds them.
+
+    When nothing changed locally and the store's file count still matches the
+    last sync, the store's file listing is skipped unless `full` is set.
+    """
+    started = time.perf_counter()
+    chunk_files = sorted(glob.glob(os.path.join(chunks_dir, "*.json")))
+    chunk_set = set(chunk_files)
+    prefix = os.path.join(chunks_dir, "")
+
+    # File IDs the manifest knew about before this sync
+    previous = load_manifest(manifest_path)
+    previous_ids = {path: entry["file_id"] for path, entry in previous.items() if path.startswith(prefix)}
+
+    # Chunks deleted locally that this store still holds (or that no store holds)
+    def removed_paths(manifest):
+        return [
+            path for path in previous_ids
+            if path not in chunk_set and path in manifest
+            and (vector_store_id in entry_stores(manifest[path]) or not entry_stores(manifest[path]))
+        ]
+
+    if dry_run:
+        to_upload, _ = plan_uploads(chunk_files, previous)
+        changed = {path for path, _, _, _ in to_upload}
+        return {
+            "added": len([path for path in changed if path not in previous_ids]),
+            "modified": len([path for path in changed if path in previous_ids]),
+            "removed": len(removed_paths(previous)),
+            "unchanged": len(chunk_files) - len(changed),
+            "dry_run": True
+        }
+
+    # Upload new and modified chunks only
+    result = bulk_upload(client, chunk_files, manifest_path=manifest_path, concurrency=concurrency)
+    manifest = result["manifest"]
+
+    added = [path for path in chunk_files if path in manifest and path not in previous_ids]
+    modified = [path for path in chunk_files
+                if path in previous_ids and manifest[path]["file_id"] != previous_ids[path]]
+    removed = removed_paths(manifest)
+
+    # Diff the desired file set against what the store holds
+    desired_ids = {manifest[path]["file_id"] for path in chunk_files if path in manifest}
+    sync_state = load_sync_state()
+    if not full and not (added or modified or removed) and store_matches_last_sync(vector_store_id, desired_ids, sync_state):
+        store_ids = desired_ids
+    else:
+        store_ids = list_store_file_ids(vector_store_id)
+    to_attach = sorted(desired_ids - store_ids)
+
+    # Files attached by other tools or people stay unless pruning
+    detachable = store_ids if prune else store_ids & owned_file_ids(manifest, prefix, vector_store_id)
+    to_detach = sorted(detachable - desired_ids)
+
+    attached = desired_ids & store_ids
+    if to_attach:
+        print(f"Attaching {len(to_attach)} files...")
+        attach_result = add_files_to_vector_store(vector_store_id, to_attach)
+        attached |= set(to_attach) - set(attach_result["failed"])
+
+    detached = set()
+    if to_detach:
+        print(f"Detaching {len(to_detach)} files...")
+        detached = detach_files(vector_store_id, to_detach, concurrency)
+
+    unused = record_attachments(manifest, prefix, vector_store_id, attached, detached)
+    if delete_files and unused:
+        # Only file objects this manifest uploaded and no longer attaches anywhere
+        print(f"Deleting {len(unused)} files from file storage...")
+        delete_files_from_storage(sorted(unused), concurrency)
+
+    # Forget chunks that no longer exist locally once no store holds them
+    for path in previous_ids:
+        if path not in chunk_set and path in manifest and not entry_stores(manifest[path]):
+            manifest.pop(path)
+    save_manifest(manifest, manifest_path)
+
+    if to_attach or to_detach:
+        invalidate_shared_cache(vector_store_id, client)
+
+    sync_state[vector_store_id] = {"digest": file_set_digest(desired_ids)}
+    save_sync_state(sync_state)
+
+    return {
+        "added": len(added),
+        "modified": len(modified),
+        "removed": len(removed),
+        "unchanged": result["skipped"],
+        "failed_uploads": len(result["failed"]),
+        "attached": len(to_attach),
+        "detached": len(detached),
+        "seconds": round(time.perf_counter() - started, 2)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Incrementally sync a chunk directory into a vector store")
+    parser.add_argument("--chunks-dir", default="english_chunks", help="Directory of JSON chunk files (default: english_chunks)")
+    parser.add_argument("--vector-store-id", help="Vector store to sync (default: from vector_store_info.json)")
+    parser.add_argument("--manifest", default=MANIFEST_PATH, help=f"Upload manifest path (default: {MANIFEST_PATH})")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help=f"Parallel uploads and detaches (default: {DEFAULT_CONCURRENCY})")
+    parser.add_argument("--delete-files", action="store_true", help="Also delete superseded and removed files from file storage once no synced store uses them")
+    parser.add_argument("--prune", action="store_true", help="Also detach files this sync did not attach (added by other tools or people)")
+    parser.add_argument("--dry-run", action="store_true", help="Report the local delta without uploading or changing the store")
+    parser.add_argument("--full", action="store_true", help="Always compare against the store's full file listing")
+
+    args = parser.parse_args()
+
+    vector_store_id = args.vector_store_id
+    if not vector_store_id:
+        vector_store_info = load_vector_store_info()
+        if not vector_store_info:
+            return
+        vector_store_id = vector_store_info["vector_store_id"]
+
+    print(f"Syncing {args.chunks_dir} into vector store {vector_store_id}")
+    delta = sync(
+        vector_store_id,
+        args.chunks_dir,
+        manifest_path=args.manifest,
+        concurrency=args.concurrency,
+        delete_files=args.delete_files,
+        dry_run=args.dry_run,
+        full=args.full,
+        prune=args.prune
+    )
+
+    print("\n=== SYNC DELTA ===")
+    for key, value in delta.items():
+        print(f"  {key}: {value}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Read assistant replies without re-listing the whole thread.
+
+When a run finishes, only the messages it added are fetched. The list call
+is filtered by `run_id`, ordered oldest first and starts after the newest
+message this process has already seen in the thread (`MessageCursors`), so
+its cost no longer grows with the length of the conversation. Threads this
+process created are marked empty until their first message, which tells
+callers that a question is the opening one of a conversation.
+
+File citations in a reply (markers such as 【4:0†source】 in the text) are
+collected from the message annotations and numbered per cited file, so the
+UI can show a source list instead of dropping them.
+"""
+import threading
+from collections import OrderedDict
+
+DEFAULT_MAX_THREADS = 10000
+
+# Messages a single run can add are few; one page covers them
+RUN_MESSAGES_LIMIT = 100
+
+# Cursor of a thread known to have no messages yet
+EMPTY = ""
+
+
+class MessageCursors:
+    """ID of the newest message seen in each of the most recently used threads."""
+
+    def __init__(self, max_threads=DEFAULT_MAX_THREADS):
+        self.max_threads = max_threads
+        self.cursors = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, thread_id):
+        with self.lock:
+            return self.cursors.get(thread_id)
+
+    def set(self, thread_id, message_id):
+        with self.lock:
+            self.cursors[thread_id] = message_id
+            self.cursors.move_to_end(thread_id)
+            if len(self.cursors) > self.max_threads:
+                self.cursors.popitem(last=False)
+
+    def mark_empty(self, thread_id):
+        self.set(thread_id, EMPTY)
+
+    def is_empty(self, thread_id):
+        return self.get(thread_id) == EMPTY
+
+    def list_params(self, thread_id, run_id):
+        """Keyword arguments for messages.list that fetch only the run's new messages."""
+        params = {"thread_id": thread_id, "run_id": run_id, "order": "asc", "limit": RUN_MESSAGES_LIMIT}
+        cursor = self.get(thread_id)
+        if cursor:
+            params["after"] = cursor
+        return params
+
+
+def message_text(message):
+    """Return (text, citations) for a message; citations are {"marker", "file_id"} dicts in text order."""
+    text = ""
+    citations = []
+    for content in message.content:
+        if content.type != "text":
+            continue
+        text += content.text.value
+        for annotation in content.text.annotations or []:
+            if annotation.type == "file_citation":
+                citations.append({"marker": annotation.text, "file_id": annotation.file_citation.file_id})
+    return text, citations
+
+
+def run_reply(messages):
+    """Join the assistant messages of a run into (text, citations), or (None, []) if there are none."""
+    parts = []
+    citations = []
+    for message in messages:
+        if message.role != "assistant":
+            continue
+        text, message_citations = message_text(message)
+        parts.append(text)
+        citations.extend(message_citations)
+    if not parts:
+        return None, []
+    return "\n\n".join(parts), citations
+
+
+def number_citations(citations, filenames):
+    """Number cited files in order of first citation; every marker for a file gets the same number."""
+    numbers = {}
+    numbered = []
+    for citation in citations:
+        file_id = citation["file_id"]
+        if file_id not in numbers:
+            numbers[file_id] = len(numbers) + 1
+        numbered.append({
+            "index": numbers[file_id],
+            "marker": citation["marker"],
+            "file_id": file_id,
+            "filename": filenames.get(file_id)
+        })
+    return numbered
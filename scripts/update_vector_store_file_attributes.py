@@ -1,9 +1,16 @@
 #!/usr/bin/env python3
 import os
 import json
+import time
+import hashlib
 import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
 import openai
+from openai_http import post_json
+from search_cache import invalidate_shared_cache
+from attribute_store import AttributeStore, ATTRIBUTE_STORE_PATH
 
 # Load environment variables from .env file
 load_dotenv()
@@ -11,6 +18,21 @@ load_dotenv()
 # Initialize OpenAI client
 client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
+# Attribute generation prompt; bump PROMPT_VERSION whenever the prompt or model changes
+PROMPT_VERSION = "1"
+ATTRIBUTE_MODEL = "gpt-4-turbo"
+SYSTEM_PROMPT = "You are an AI assistant that analyzes document content and extracts key attributes."
+USER_PROMPT = "Based on the following content, generate a JSON dictionary of attributes that describe this document. Include attributes like 'document_type', 'topic', 'sentiment', 'complexity_level', 'is_technical', etc. Content: {content}..."
+
+# Generated attributes keyed by content hash and prompt version
+ATTRIBUTE_CACHE_PATH = "attribute_cache.jsonl"
+
+# Files whose attributes have been set, so an interrupted run can resume
+PROGRESS_PATH = "attribute_progress.jsonl"
+
+DEFAULT_CONCURRENCY = 16
+DEFAULT_LLM_CONCURRENCY = 4
+
 def load_vector_store_info():
     """Load the vector store information from the JSON file."""
     try:
@@ -29,22 +51,78 @@ def load_uploaded_files():
         print("Error: uploaded_files.json not found.")
         return None
 
-def get_file_attributes_from_openai(file_content):
+class JsonlStore:
+    """Append-only JSON lines file loaded into a dict, safe to append to from many threads."""
+
+    def __init__(self, path, key_field):
+        self.path = path
+        self.key_field = key_field
+        self.lock = threading.Lock()
+        self.records = {}
+        try:
+            with open(path, "r") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A run interrupted mid-write can leave a partial last line
+                        continue
+                    self.records[record[key_field]] = record
+        except FileNotFoundError:
+            pass
+
+    def get(self, key):
+        return self.records.get(key)
+
+    def put(self, record):
+        with self.lock:
+            self.records[record[self.key_field]] = record
+            with open(self.path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+
+class TokenUsage:
+    """Thread-safe running total of completion token usage."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.requests = 0
+
+    def add(self, usage):
+        if usage is None:
+            return
+        with self.lock:
+            self.prompt_tokens += usage.prompt_tokens
+            self.completion_tokens += usage.completion_tokens
+            self.requests += 1
+
+def attribute_cache_key(file_content):
+    """Key generated attributes by the content, prompt version and model."""
+    digest = hashlib.sha256()
+    digest.update(f"{PROMPT_VERSION}\0{ATTRIBUTE_MODEL}\0".encode("utf-8"))
+    digest.update(file_content.encode("utf-8"))
+    return digest.hexdigest()
+
+def get_file_attributes_from_openai(file_content, usage=None):
     """Generate attributes for a file using OpenAI API."""
     try:
         response = client.chat.completions.create(
-            model="gpt-4-turbo",
+            model=ATTRIBUTE_MODEL,
             messages=[
-                {"role": "system", "content": "You are an AI assistant that analyzes document content and extracts key attributes."},
-                {"role": "user", "content": f"Based on the following content, generate a JSON dictionary of attributes that describe this document. Include attributes like 'document_type', 'topic', 'sentiment', 'complexity_level', 'is_technical', etc. Content: {file_content[:4000]}..."}
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": USER_PROMPT.format(content=file_content[:4000])}
             ],
             response_format={"type": "json_object"}
         )
-        
+
+        if usage is not None:
+            usage.add(response.usage)
+
         # Extract the JSON from the response
         attributes_json = response.choices[0].message.content
         attributes = json.loads(attributes_json)
-        
+
         return attributes
     except Exception as e:
         print(f"Error generating attributes with OpenAI: {e}")
@@ -53,47 +131,80 @@ def get_file_attributes_from_openai(file_content):
 def update_file_attributes(vector_store_id, file_id, attributes):
     """Update the attributes of a file in the vector store."""
     try:
-        # Prepare the curl command
-        api_key = os.getenv("OPENAI_API_KEY")
-        url = f"https://api.openai.com/v1/vector_stores/{vector_store_id}/files/{file_id}"
-        
-        # Convert attributes to JSON string
-        attributes_json = json.dumps({"attributes": attributes})
-        
-        # Build the curl command
-        curl_command = [
-            "curl", url,
-            "-X", "POST",
-            "-H", f"Authorization: Bearer {api_key}",
-            "-H", "Content-Type: application/json",
-            "-H", "OpenAI-Beta: assistants=v2",
-            "-d", attributes_json
-        ]
-        
-        # Execute the curl command
-        import subprocess
-        result = subprocess.run(
-            curl_command,
-            capture_output=True,
-            text=True
+        return post_json(
+            f"/vector_stores/{vector_store_id}/files/{file_id}",
+            {"attributes": attributes}
         )
-        
-        if result.returncode != 0:
-            print(f"Curl command failed: {result.stderr}")
-            return None
-        
-        # Parse the response
-        try:
-            response = json.loads(result.stdout)
-            return response
-        except json.JSONDecodeError:
-            print(f"Failed to parse response: {result.stdout}")
-            return None
-            
     except Exception as e:
         print(f"Error updating file attributes: {e}")
         return None
 
+def attributes_digest(vector_store_id, file_id, attributes):
+    """Fingerprint an attribute update so a resumed run can tell it was already applied."""
+    payload = json.dumps([vector_store_id, file_id, attributes], sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def process_file(file_info, vector_store_id, args, attribute_cache, progress, llm_slots, usage, attribute_store):
+    """Read, generate (or reuse) and set the attributes for one file. Returns a status string."""
+    file_id = file_info["file_id"]
+    filename = file_info["filename"]
+
+    # Determine attributes to set
+    if args.attributes:
+        attributes = json.loads(args.attributes)
+    elif args.generate:
+        # Try to read the file content to generate attributes
+        try:
+            with open(filename, "r") as f:
+                file_content = f.read()
+        except FileNotFoundError:
+            print(f"Warning: Could not find file {filename} locally. Using basic attributes.")
+            file_content = None
+            attributes = {
+                "document_type": "unknown",
+                "processed": True,
+                "filename": os.path.basename(filename)
+            }
+
+        if file_content is not None:
+            cache_key = attribute_cache_key(file_content)
+            cached = attribute_cache.get(cache_key)
+            if cached is not None:
+                attributes = cached["attributes"]
+            else:
+                with llm_slots:
+                    attributes = get_file_attributes_from_openai(file_content, usage)
+                if not attributes:
+                    print(f"Failed to generate attributes for file: {filename}")
+                    return "failed"
+                attribute_cache.put({"key": cache_key, "attributes": attributes})
+    else:
+        # Use basic attributes
+        attributes = {
+            "processed": True,
+            "filename": os.path.basename(filename)
+        }
+
+    # Skip files a previous run already updated with the same attributes
+    digest = attributes_digest(vector_store_id, file_id, attributes)
+    done = progress.get(file_id)
+    if not args.force and done is not None and done["digest"] == digest:
+        if attribute_store.get(file_id) is None:
+            attribute_store.set(file_id, attributes)
+        return "skipped"
+
+    # Update the file attributes
+    response = update_file_attributes(vector_store_id, file_id, attributes)
+
+    if response:
+        progress.put({"file_id": file_id, "digest": digest})
+        attribute_store.set(file_id, attributes)
+        print(f"Successfully updated attributes for file: {filename}")
+        return "updated"
+
+    print(f"Failed to update attributes for file: {filename}")
+    return "failed"
+
 def main():
     parser = argparse.ArgumentParser(description="Update attributes for vector store files")
     parser.add_argument("--file-id", help="Specific file ID to update (optional)")
@@ -101,24 +212,34 @@ def main():
     parser.add_argument("--sample", type=int, help="Update a sample of N files")
     parser.add_argument("--attributes", help="JSON string of attributes to set (optional)")
     parser.add_argument("--generate", action="store_true", help="Generate attributes using OpenAI")
-    
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help=f"Files processed in parallel (default: {DEFAULT_CONCURRENCY})")
+    parser.add_argument("--llm-concurrency", type=int, default=DEFAULT_LLM_CONCURRENCY, help=f"Attribute generation calls in flight (default: {DEFAULT_LLM_CONCURRENCY})")
+    parser.add_argument("--force", action="store_true", help="Update files even if a previous run already set the same attributes")
+
     args = parser.parse_args()
-    
+
+    if args.attributes:
+        try:
+            json.loads(args.attributes)
+        except json.JSONDecodeError:
+            print("Error: Invalid JSON in --attributes")
+            return
+
     # Load vector store info
     vector_store_info = load_vector_store_info()
     if not vector_store_info:
         return
-    
+
     vector_store_id = vector_store_info["vector_store_id"]
-    
+
     # Load uploaded files
     uploaded_files = load_uploaded_files()
     if not uploaded_files:
         return
-    
+
     # Determine which files to update
     files_to_update = []
-    
+
     if args.file_id:
         # Find the file in the uploaded files list
         file_info = next((f for f in uploaded_files if f["file_id"] == args.file_id), None)
@@ -135,51 +256,40 @@ def main():
     else:
         print("Error: Please specify --file-id, --all, or --sample")
         return
-    
-    # Process each file
-    for file_info in files_to_update:
-        file_id = file_info["file_id"]
-        filename = file_info["filename"]
-        
-        print(f"Processing file: {filename} (ID: {file_id})")
-        
-        # Determine attributes to set
-        if args.attributes:
-            try:
-                attributes = json.loads(args.attributes)
-            except json.JSONDecodeError:
-                print("Error: Invalid JSON in --attributes")
-                continue
-        elif args.generate:
-            # Try to read the file content to generate attributes
+
+    attribute_cache = JsonlStore(ATTRIBUTE_CACHE_PATH, "key")
+    progress = JsonlStore(PROGRESS_PATH, "file_id")
+    llm_slots = threading.BoundedSemaphore(args.llm_concurrency)
+    usage = TokenUsage()
+    # Local mirror of the attributes, used for filtering without the API
+    attribute_store = AttributeStore(ATTRIBUTE_STORE_PATH)
+    counts = {"updated": 0, "skipped": 0, "failed": 0}
+    started = time.perf_counter()
+
+    # Process files concurrently so reads, generation and updates overlap
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        futures = [
+            executor.submit(process_file, file_info, vector_store_id, args, attribute_cache, progress, llm_slots, usage, attribute_store)
+            for file_info in files_to_update
+        ]
+        for future in as_completed(futures):
             try:
-                with open(filename, "r") as f:
-                    file_content = f.read()
-                attributes = get_file_attributes_from_openai(file_content)
-            except FileNotFoundError:
-                print(f"Warning: Could not find file {filename} locally. Using basic attributes.")
-                attributes = {
-                    "document_type": "unknown",
-                    "processed": True,
-                    "filename": os.path.basename(filename)
-                }
-        else:
-            # Use basic attributes
-            attributes = {
-                "processed": True,
-                "filename": os.path.basename(filename)
-            }
-        
-        # Update the file attributes
-        print(f"Setting attributes: {json.dumps(attributes, indent=2)}")
-        response = update_file_attributes(vector_store_id, file_id, attributes)
-        
-        if response:
-            print(f"Successfully updated attributes for file: {filename}")
-        else:
-            print(f"Failed to update attributes for file: {filename}")
-    
+                counts[future.result()] += 1
+            except Exception as e:
+                print(f"Error processing file: {e}")
+                counts["failed"] += 1
+
+    elapsed = time.perf_counter() - started
+    attribute_store.save()
+
+    # Cached search results may carry the old attributes
+    if counts["updated"]:
+        invalidate_shared_cache(vector_store_id, client)
+
     print("Attribute update process complete.")
+    print(f"  Updated: {counts['updated']}, skipped (already set): {counts['skipped']}, failed: {counts['failed']}")
+    print(f"  Throughput: {len(files_to_update) / elapsed:.1f} files/s over {elapsed:.1f}s")
+    print(f"  Generation calls: {usage.requests}, tokens: {usage.prompt_tokens} prompt + {usage.completion_tokens} completion")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Listing of every vector store in an account, not just the first page.
+
+`iter_vector_stores` walks the list endpoint page by page as the caller
+consumes it, so results can be shown before the last page arrives.
+`iter_store_details` fetches each store's details (and optionally its file
+IDs) on a bounded worker pool while stores are still streaming in, and
+yields each store as soon as its fetch completes. Async variants are
+provided for the ASGI app.
+"""
+import asyncio
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from request_metrics import submit_in_context
+
+PAGE_SIZE = 100
+DEFAULT_CONCURRENCY = 8
+
+
+def format_store(store):
+    """Convert a vector store object into the dict served to the UI."""
+    store_data = {
+        "id": store.id,
+        "name": store.name,
+        "created_at": store.created_at
+    }
+
+    # Add additional fields if they exist
+    if getattr(store, "bytes", None) is not None:
+        store_data["bytes"] = store.bytes
+
+    if getattr(store, "file_counts", None) is not None:
+        store_data["file_counts"] = {
+            "in_progress": store.file_counts.in_progress,
+            "completed": store.file_counts.completed,
+            "failed": store.file_counts.failed,
+            "cancelled": store.file_counts.cancelled,
+            "total": store.file_counts.total
+        }
+
+    return store_data
+
+
+def iter_vector_stores(client, page_size=PAGE_SIZE):
+    """Yield every vector store, fetching the next page only when the current one is consumed."""
+    yield from client.beta.vector_stores.list(limit=page_size)
+
+
+def fetch_store_details(client, vector_store_id, files_limit=0):
+    """Retrieve one store and, if files_limit is set, up to that many of its file IDs."""
+    store_data = format_store(client.beta.vector_stores.retrieve(vector_store_id=vector_store_id))
+    if files_limit:
+        file_ids = []
+        for store_file in client.beta.vector_stores.files.list(
+                vector_store_id=vector_store_id, limit=min(files_limit, PAGE_SIZE)):
+            file_ids.append(store_file.id)
+            if len(file_ids) >= files_limit:
+                break
+        store_data["file_ids"] = file_ids
+    return store_data
+
+
+def iter_store_details(client, stores, concurrency=DEFAULT_CONCURRENCY, files_limit=0):
+    """Yield store details in completion order, fetching up to `concurrency` stores at once.
+
+    At most twice `concurrency` fetches are queued, so a slow consumer does not
+    pull the whole listing into memory. A store whose fetch fails is yielded as
+    {"id": ..., "error": ...} instead of stopping the listing.
+    """
+    def results(done):
+        for future in done:
+            vector_store_id = pending.pop(future)
+            try:
+                yield future.result()
+            except Exception as e:
+                yield {"id": vector_store_id, "error": str(e)}
+
+    pending = {}
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for store in stores:
+            future = submit_in_context(executor, fetch_store_details, client, store.id, files_limit)
+            pending[future] = store.id
+            if len(pending) >= concurrency * 2:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                yield from results(done)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            yield from results(done)
+
+
+async def iter_vector_stores_async(client, page_size=PAGE_SIZE):
+    """Async variant of iter_vector_stores for an AsyncOpenAI client."""
+    async for store in client.beta.vector_stores.list(limit=page_size):
+        yield store
+
+
+async def fetch_store_details_async(client, vector_store_id, files_limit=0):
+    """Async variant of fetch_store_details."""
+    store_data = format_store(await client.beta.vector_stores.retrieve(vector_store_id=vector_store_id))
+    if files_limit:
+        file_ids = []
+        async for store_file in client.beta.vector_stores.files.list(
+                vector_store_id=vector_store_id, limit=min(files_limit, PAGE_SIZE)):
+            file_ids.append(store_file.id)
+            if len(file_ids) >= files_limit:
+                break
+        store_data["file_ids"] = file_ids
+    return store_data
+
+
+async def iter_store_details_async(client, stores, concurrency=DEFAULT_CONCURRENCY, files_limit=0):
+    """Async variant of iter_store_details; `stores` is an async iterator."""
+    async def fetch(vector_store_id):
+        try:
+            return await fetch_store_details_async(client, vector_store_id, files_limit)
+        except Exception as e:
+            return {"id": vector_store_id, "error": str(e)}
+
+    pending = set()
+    try:
+        async for store in stores:
+            pending.add(asyncio.ensure_future(fetch(store.id)))
+            if len(pending) >= concurrency:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield task.result()
+    finally:
+        for task in pending:
+            task.cancel()
@@ -17,10 +17,13 @@ document.addEventListener('DOMContentLoaded', () => {
     const searchButton = document.getElementById('search-button');
     const searchResults = document.getElementById('search-results');
     
-    let threadId = null;
-    let assistantId = null;
+    // The conversation's thread lives in the server-side session; the browser only tracks readiness
+    let chatReady = false;
     let currentVectorStoreId = null;
     
+    // The last search's request body, sent again to load a result's full text
+    let lastSearchRequest = null;
+    
     // Load vector stores
     loadVectorStores();
     
@@ -36,7 +39,7 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     });
     
-    refreshVectorStoresButton.addEventListener('click', loadVectorStores);
+    refreshVectorStoresButton.addEventListener('click', () => loadVectorStores(true));
     
     // Tab switching
     tabButtons.forEach(button => {
@@ -85,6 +88,14 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     });
     
+    // Results arrive as snippets; the full text of one is loaded when asked for
+    searchResults.addEventListener('click', (e) => {
+        const button = e.target.closest('.show-full-content');
+        if (button) {
+            toggleFullContent(button);
+        }
+    });
+    
     vectorStoreSelect.addEventListener('change', async () => {
         const selectedVectorStoreId = vectorStoreSelect.value;
         
@@ -108,8 +119,7 @@ document.addEventListener('DOMContentLoaded', () => {
                     currentVectorStoreId = selectedVectorStoreId;
                     
                     // Reset the chat
-                    threadId = null;
-                    assistantId = null;
+                    chatReady = false;
                     
                     // Clear chat messages except the welcome message
                     while (chatMessages.children.length > 1) {
@@ -135,54 +145,85 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     });
     
-    // Load vector stores
-    async function loadVectorStores() {
+    // Load vector stores as they stream in (refresh bypasses the server-side cache)
+    async function loadVectorStores(refresh = false) {
         try {
             vectorStoreSelect.disabled = true;
             vectorStoreSelect.innerHTML = '<option value="">Loading vector stores...</option>';
             
-            const response = await fetch('/api/vector-stores');
-            const data = await response.json();
+            const response = await fetch(refresh ? '/api/vector-stores/stream?refresh=1' : '/api/vector-stores/stream');
             
-            if (response.ok) {
-                const vectorStores = data.vector_stores;
-                currentVectorStoreId = data.current_vector_store_id;
-                
-                // Clear the select
-                vectorStoreSelect.innerHTML = '';
-                
-                if (vectorStores.length === 0) {
-                    vectorStoreSelect.innerHTML = '<option value="">No vector stores found</option>';
-                    vectorStoreSelect.disabled = true;
-                    return;
-                }
-                
-                // Add options for each vector store
-                vectorStores.forEach(store => {
+            if (!response.ok) {
+                const data = await response.json();
+                throw new Error(data.error || 'Failed to load vector stores');
+            }
+            
+            let count = 0;
+            await readNdjson(response, line => {
+                if (line.error) {
+                    throw new Error(line.error);
+                } else if ('current_vector_store_id' in line) {
+                    currentVectorStoreId = line.current_vector_store_id;
+                } else if (line.store) {
+                    // Replace the loading placeholder with the first store
+                    if (count === 0) {
+                        vectorStoreSelect.innerHTML = '';
+                    }
+                    count++;
+                    
                     const option = document.createElement('option');
-                    option.value = store.id;
-                    option.textContent = store.name || store.id;
+                    option.value = line.store.id;
+                    option.textContent = line.store.name || line.store.id;
                     vectorStoreSelect.appendChild(option);
-                });
-                
-                // Select the current vector store
-                if (currentVectorStoreId) {
-                    vectorStoreSelect.value = currentVectorStoreId;
+                    
+                    // Select the current vector store as soon as it arrives
+                    if (line.store.id === currentVectorStoreId) {
+                        vectorStoreSelect.value = currentVectorStoreId;
+                    }
                 }
-                
-                vectorStoreSelect.disabled = false;
-            } else {
-                addErrorMessage(data.error || 'Failed to load vector stores');
-                vectorStoreSelect.innerHTML = '<option value="">Error loading vector stores</option>';
+            });
+            
+            if (count === 0) {
+                vectorStoreSelect.innerHTML = '<option value="">No vector stores found</option>';
                 vectorStoreSelect.disabled = true;
+                return;
             }
+            
+            vectorStoreSelect.disabled = false;
         } catch (error) {
-            addErrorMessage('Network error: ' + error.message);
+            addErrorMessage('Failed to load vector stores: ' + error.message);
             vectorStoreSelect.innerHTML = '<option value="">Error loading vector stores</option>';
             vectorStoreSelect.disabled = true;
         }
     }
     
+    // Call onLine with each JSON object of a newline-delimited JSON response as it arrives
+    async function readNdjson(response, onLine) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            
+            buffer += decoder.decode(value, { stream: true });
+            
+            let newline;
+            while ((newline = buffer.indexOf('\n')) !== -1) {
+                const line = buffer.slice(0, newline).trim();
+                buffer = buffer.slice(newline + 1);
+                if (line) {
+                    onLine(JSON.parse(line));
+                }
+            }
+        }
+        
+        if (buffer.trim()) {
+            onLine(JSON.parse(buffer));
+        }
+    }
+    
     // Initialize chat by creating a thread
     async function initializeChat() {
         try {
@@ -198,9 +239,8 @@ document.addEventListener('DOMContentLoaded', () => {
             const data = await response.json();
             
             if (response.ok) {
-                threadId = data.thread_id;
-                assistantId = data.assistant_id;
-                console.log('Chat initialized with thread ID:', threadId);
+                chatReady = true;
+                console.log('Chat initialized with thread ID:', data.thread_id);
             } else {
                 addErrorMessage(data.error || 'Failed to initialize chat');
             }
@@ -223,7 +263,7 @@ document.addEventListener('DOMContentLoaded', () => {
         if (!message) return;
         
         // Check if chat is initialized
-        if (!threadId || !assistantId) {
+        if (!chatReady) {
             addErrorMessage('Chat not initialized. Please try refreshing the page.');
             return;
         }
@@ -238,19 +278,26 @@ document.addEventListener('DOMContentLoaded', () => {
             // Show loading indicator
             loadingIndicator.style.display = 'flex';
             
-            // Send message to server
+            // Send message to server, asking for a streamed reply when the browser supports it
+            const canStream = typeof ReadableStream !== 'undefined' && typeof TextDecoder !== 'undefined';
             const response = await fetch('/api/send-message', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json'
                 },
                 body: JSON.stringify({
-                    thread_id: threadId,
-                    assistant_id: assistantId,
-                    message: message
+                    message: message,
+                    stream: canStream
                 })
             });
             
+            const contentType = response.headers.get('Content-Type') || '';
+            
+            if (response.ok && contentType.includes('text/event-stream')) {
+                await readStreamedReply(response);
+                return;
+            }
+            
             const data = await response.json();
             
             if (!response.ok) {
@@ -258,7 +305,10 @@ document.addEventListener('DOMContentLoaded', () => {
             }
             
             // Add assistant response to chat
-            addMessage(data.response, 'assistant');
+            addMessage(withCitations(data.response, data.citations), 'assistant');
+            if (data.timing) {
+                console.log('Response timing:', data.timing);
+            }
         } catch (error) {
             console.error('Error sending message:', error);
             addErrorMessage(error.message);
@@ -268,6 +318,74 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
     
+    // Render Server-Sent Events from /api/send-message into a growing assistant message
+    async function readStreamedReply(response) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let text = '';
+        let messageContent = null;
+        
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            
+            buffer += decoder.decode(value, { stream: true });
+            
+            // Events are separated by a blank line
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const frame = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+                
+                let eventName = 'message';
+                let eventData = '';
+                frame.split('\n').forEach(line => {
+                    if (line.startsWith('event:')) {
+                        eventName = line.slice(6).trim();
+                    } else if (line.startsWith('data:')) {
+                        eventData += line.slice(5).trim();
+                    }
+                });
+                
+                const payload = eventData ? JSON.parse(eventData) : {};
+                
+                if (eventName === 'delta') {
+                    text += payload.text;
+                    if (!messageContent) {
+                        // Hide the spinner once the first token arrives
+                        loadingIndicator.style.display = 'none';
+                        messageContent = addMessage(text, 'assistant');
+                    } else {
+                        renderAssistantContent(messageContent, text);
+                        scrollToBottom();
+                    }
+                } else if (eventName === 'done') {
+                    if (messageContent && payload.citations && payload.citations.length > 0) {
+                        renderAssistantContent(messageContent, withCitations(text, payload.citations));
+                    }
+                    console.log('Response timing:', payload.timing);
+                } else if (eventName === 'error') {
+                    throw new Error(payload.error || 'Failed to send message');
+                }
+            }
+        }
+    }
+    
+    // Replace citation markers with numbered references and list the cited files
+    function withCitations(content, citations) {
+        if (!content || !citations || citations.length === 0) return content;
+        
+        const sources = new Map();
+        citations.forEach(citation => {
+            content = content.split(citation.marker).join(`<sup>[${citation.index}]</sup>`);
+            sources.set(citation.index, citation.filename || citation.file_id);
+        });
+        
+        const list = [...sources].map(([index, name]) => `${index}. \`${name}\``).join('\n');
+        return `${content}\n\n**Sources**\n\n${list}`;
+    }
+    
     // Sanitize and format markdown content
     function sanitizeMarkdown(content) {
         if (!content) return '';
@@ -312,15 +430,7 @@ document.addEventListener('DOMContentLoaded', () => {
         messageContent.className = 'message-content';
         
         if (role === 'assistant') {
-            // For assistant messages, use innerHTML to render markdown
-            messageContent.innerHTML = sanitizeMarkdown(content);
-            
-            // Make all links open in a new tab
-            const links = messageContent.querySelectorAll('a');
-            links.forEach(link => {
-                link.setAttribute('target', '_blank');
-                link.setAttribute('rel', 'noopener noreferrer');
-            });
+            renderAssistantContent(messageContent, content);
         } else {
             // For user messages, just use text content
             messageContent.textContent = content;
@@ -330,6 +440,21 @@ document.addEventListener('DOMContentLoaded', () => {
         chatMessages.appendChild(messageDiv);
         
         scrollToBottom();
+        
+        return messageContent;
+    }
+    
+    // Render markdown into an assistant message element
+    function renderAssistantContent(messageContent, content) {
+        // For assistant messages, use innerHTML to render markdown
+        messageContent.innerHTML = sanitizeMarkdown(content);
+        
+        // Make all links open in a new tab
+        const links = messageContent.querySelectorAll('a');
+        links.forEach(link => {
+            link.setAttribute('target', '_blank');
+            link.setAttribute('rel', 'noopener noreferrer');
+        });
     }
     
     // Add a system message
@@ -378,16 +503,19 @@ document.addEventListener('DOMContentLoaded', () => {
         try {
             loadingIndicator.style.display = 'flex';
             
+            const searchRequest = {
+                query: query,
+                max_results: parseInt(maxResults.value) || 10,
+                rewrite_query: rewriteQuery.checked,
+                snippets: true
+            };
+            
             const response = await fetch('/api/search-vector-store', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json'
                 },
-                body: JSON.stringify({
-                    query: query,
-                    max_results: parseInt(maxResults.value) || 10,
-                    rewrite_query: rewriteQuery.checked
-                })
+                body: JSON.stringify(searchRequest)
             });
             
             const data = await response.json();
@@ -396,7 +524,10 @@ document.addEventListener('DOMContentLoaded', () => {
                 throw new Error(data.error || 'Failed to search vector store');
             }
             
+            lastSearchRequest = searchRequest;
+            const renderStarted = performance.now();
             displaySearchResults(data);
+            console.debug(`Rendered ${(data.data || []).length} search results in ${(performance.now() - renderStarted).toFixed(1)} ms`);
         } catch (error) {
             console.error('Search error:', error);
             searchResults.innerHTML = `
@@ -455,6 +586,114 @@ document.addEventListener('DOMContentLoaded', () => {
         });
     }
     
+    function escapeHtml(text) {
+        return String(text)
+            .replace(/&/g, '&amp;')
+            .replace(/</g, '&lt;')
+            .replace(/>/g, '&gt;')
+            .replace(/"/g, '&quot;')
+            .replace(/'/g, '&#39;');
+    }
+    
+    // Snippet text with the matched query terms wrapped in <mark>
+    function highlightSnippet(snippet) {
+        let html = '';
+        let position = 0;
+        (snippet.highlights || []).forEach(([start, end]) => {
+            html += escapeHtml(snippet.text.slice(position, start));
+            html += `<mark>${escapeHtml(snippet.text.slice(start, end))}</mark>`;
+            position = end;
+        });
+        return html + escapeHtml(snippet.text.slice(position));
+    }
+    
+    async function toggleFullContent(button) {
+        const container = button.nextElementSibling;
+        if (container.dataset.loaded) {
+            container.hidden = !container.hidden;
+            button.textContent = container.hidden ? 'Show full text' : 'Hide full text';
+            return;
+        }
+        
+        button.disabled = true;
+        try {
+            const response = await fetch('/api/search-vector-store/content', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json'
+                },
+                body: JSON.stringify({ ...lastSearchRequest, result_id: button.dataset.resultId })
+            });
+            
+            const data = await response.json();
+            
+            if (!response.ok) {
+                throw new Error(data.error || 'Failed to load the full text');
+            }
+            
+            container.innerHTML = createContentHTML(data.content);
+            container.dataset.loaded = 'true';
+            container.hidden = false;
+            button.textContent = 'Hide full text';
+        } catch (error) {
+            console.error('Full text error:', error);
+            container.innerHTML = `<p>Error: ${escapeHtml(error.message)}</p>`;
+            container.hidden = false;
+        } finally {
+            button.disabled = false;
+        }
+    }
+    
+    // Render a result's content parts (or plain string) as markdown
+    function createContentHTML(content) {
+        let html = '';
+        
+        if (Array.isArray(content)) {
+            // Handle array of content items
+            content.forEach(part => {
+                if (part.type === 'text') {
+                    // Process text content
+                    let text = part.text || '';
+                    
+                    // Replace \n\n with proper paragraph breaks
+                    text = text.replace(/\n\n/g, '</p><p>');
+                    
+                    // Replace single \n with <br>
+                    text = text.replace(/\n/g, '<br>');
+                    
+                    // Wrap in paragraph tags if not already
+                    if (!text.startsWith('<p>')) {
+                        text = '<p>' + text + '</p>';
+                    }
+                    
+                    // Render markdown content
+                    const formattedText = sanitizeMarkdown(text);
+                    html += `<div class="markdown-content">${formattedText}</div>`;
+                }
+            });
+        } else if (typeof content === 'string') {
+            // Handle string content
+            let text = content;
+            
+            // Replace \n\n with proper paragraph breaks
+            text = text.replace(/\n\n/g, '</p><p>');
+            
+            // Replace single \n with <br>
+            text = text.replace(/\n/g, '<br>');
+            
+            // Wrap in paragraph tags if not already
+            if (!text.startsWith('<p>')) {
+                text = '<p>' + text + '</p>';
+            }
+            
+            // Render markdown content
+            const formattedText = sanitizeMarkdown(text);
+            html += `<div class="markdown-content">${formattedText}</div>`;
+        }
+        
+        return html;
+    }
+    
     function createSearchResultHTML(item, index) {
         let html = `
             <div class="search-result">
@@ -480,52 +719,25 @@ document.addEventListener('DOMContentLoaded', () => {
         
         html += `</div></div>`;
         
+        // Add query-aware snippets, with the full text loaded on demand
+        if (item.snippets) {
+            html += `<div class="search-result-content">`;
+            item.snippets.forEach(snippet => {
+                html += `<p class="search-result-snippet">${highlightSnippet(snippet)}</p>`;
+            });
+            if (item.result_id) {
+                const size = item.content_chars ? ` (${item.content_chars.toLocaleString()} characters)` : '';
+                html += `<button class="show-full-content" data-result-id="${escapeHtml(item.result_id)}">Show full text${size}</button>`;
+                html += `<div class="search-result-full" hidden></div>`;
+            }
+            html += `</div>`;
+        }
+        
         // Add content if present
         if (item.content) {
             html += `<div class="search-result-content">`;
             
-            if (Array.isArray(item.content)) {
-                // Handle array of content items
-                item.content.forEach(content => {
-                    if (content.type === 'text') {
-                        // Process text content
-                        let text = content.text || '';
-                        
-                        // Replace \n\n with proper paragraph breaks
-                        text = text.replace(/\n\n/g, '</p><p>');
-                        
-                        // Replace single \n with <br>
-                        text = text.replace(/\n/g, '<br>');
-                        
-                        // Wrap in paragraph tags if not already
-                        if (!text.startsWith('<p>')) {
-                            text = '<p>' + text + '</p>';
-                        }
-                        
-                        // Render markdown content
-                        const formattedText = sanitizeMarkdown(text);
-                        html += `<div class="markdown-content">${formattedText}</div>`;
-                    }
-                });
-            } else if (typeof item.content === 'string') {
-                // Handle string content
-                let text = item.content;
-                
-                // Replace \n\n with proper paragraph breaks
-                text = text.replace(/\n\n/g, '</p><p>');
-                
-                // Replace single \n with <br>
-                text = text.replace(/\n/g, '<br>');
-                
-                // Wrap in paragraph tags if not already
-                if (!text.startsWith('<p>')) {
-                    text = '<p>' + text + '</p>';
-                }
-                
-                // Render markdown content
-                const formattedText = sanitizeMarkdown(text);
-                html += `<div class="markdown-content">${formattedText}</div>`;
-            }
+            html += createContentHTML(item.content);
             
             html += `</div>`;
         }